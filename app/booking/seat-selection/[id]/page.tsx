@@ -137,6 +137,18 @@ function CountdownTimer({ onExpire }: { onExpire: () => void }) {
     );
 }
 
+// Fallback when the API returns no layout; matches the backend's DEFAULT_LAYOUT
+const DEFAULT_SEAT_LAYOUT = { rows: 8, cols: 12, aisles: [] as number[] };
+
+// 0 -> "A", 25 -> "Z", 26 -> "AA" (same labels as backend/seat_state.py)
+function rowLabel(index: number): string {
+    let label = '';
+    for (let n = index + 1; n > 0; n = Math.floor((n - 1) / 26)) {
+        label = String.fromCharCode(65 + ((n - 1) % 26)) + label;
+    }
+    return label;
+}
+
 export default function BookingPage({ params }: { params: Promise<{ id: string }> }) {
     const { id } = use(params);
     const router = useRouter();
@@ -157,6 +169,19 @@ export default function BookingPage({ params }: { params: Promise<{ id: string }
     const [discountAmount, setDiscountAmount] = useState(0);
     const [couponError, setCouponError] = useState('');
     const [validatingCoupon, setValidatingCoupon] = useState(false);
+    // Identifies this browser tab's seat selection to the API (seat locks,
+    // payment dedup); kept across reloads of the same showtime page
+    const [userSession, setUserSession] = useState('');
+
+    useEffect(() => {
+        const key = `seat_session:${id}`;
+        let session = sessionStorage.getItem(key);
+        if (!session) {
+            session = crypto.randomUUID();
+            sessionStorage.setItem(key, session);
+        }
+        setUserSession(session);
+    }, [id]);
 
     useEffect(() => {
         const fetchShowtime = async () => {
@@ -299,7 +324,8 @@ export default function BookingPage({ params }: { params: Promise<{ id: string }
                     seats: selectedSeats,
                     total_amount: finalTotal,
                     coupon_code: appliedCoupon ? appliedCoupon.coupon_code : null,
-                    discount_amount: discountAmount
+                    discount_amount: discountAmount,
+                    user_session: userSession || null
                 }),
             });
 
@@ -319,33 +345,54 @@ export default function BookingPage({ params }: { params: Promise<{ id: string }
         }
     };
 
+    // The Stripe webhook commits the booking server-side; poll its status
+    // (a Redis read) for up to ~10s. Returns null if it hasn't arrived.
+    const waitForWebhookBooking = async (API_URL: string, paymentIntentId: string): Promise<string | null> => {
+        for (let attempt = 0; attempt < 10; attempt++) {
+            const res = await fetch(`${API_URL}/bookings/status/${paymentIntentId}`);
+            if (res.ok) {
+                const status = await res.json();
+                if (status.status === 'confirmed') return status.booking_id;
+                if (status.status === 'conflict' || status.status === 'failed') {
+                    throw new Error(status.detail || 'Booking could not be confirmed');
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+        return null;
+    };
+
     const handlePaymentSuccess = async (paymentIntentId: string) => {
         try {
             const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
             const originalTotal = showtime.price * selectedSeats.length;
             const finalTotal = Math.max(0, originalTotal - discountAmount);
 
-            const response = await fetch(`${API_URL}/bookings/confirm-booking`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    showtime_id: id,
-                    customer_name: customerDetails.name,
-                    customer_email: customerDetails.email,
-                    customer_phone: customerDetails.phone,
-                    seats: selectedSeats,
-                    total_amount: finalTotal,
-                    coupon_code: appliedCoupon ? appliedCoupon.coupon_code : null,
-                    discount_amount: discountAmount,
-                    payment_intent_id: paymentIntentId
-                })
-            });
-
-            const booking = await response.json();
+            let bookingId = await waitForWebhookBooking(API_URL, paymentIntentId);
+            if (!bookingId) {
+                // Webhook not configured or delayed: confirm directly (safe to race the webhook)
+                const response = await fetch(`${API_URL}/bookings/confirm-booking`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        showtime_id: id,
+                        customer_name: customerDetails.name,
+                        customer_email: customerDetails.email,
+                        customer_phone: customerDetails.phone,
+                        seats: selectedSeats,
+                        total_amount: finalTotal,
+                        coupon_code: appliedCoupon ? appliedCoupon.coupon_code : null,
+                        discount_amount: discountAmount,
+                        payment_intent_id: paymentIntentId
+                    })
+                });
+                const booking = await response.json();
+                bookingId = booking.id;
+            }
 
             // Store booking details for success page
             const bookingDetails = {
-                bookingId: booking.id,
+                bookingId,
                 movieTitle: showtime.movie?.title,
                 theaterName: showtime.screen?.theater?.name,
                 screenName: showtime.screen?.name,
@@ -382,8 +429,12 @@ export default function BookingPage({ params }: { params: Promise<{ id: string }
         );
     }
 
-    const rows = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H'];
-    const cols = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12];
+    // Draw the screen's real layout: seats outside it are rejected by the API
+    const seatLayout = showtime.seat_layout || showtime.screen?.seat_layout || DEFAULT_SEAT_LAYOUT;
+    const rows = Array.from({ length: seatLayout.rows }, (_, i) => rowLabel(i));
+    const cols = Array.from({ length: seatLayout.cols }, (_, i) => i + 1);
+    // An aisle value `a` is a gap between seat `a` and seat `a + 1`
+    const aisles: number[] = seatLayout.aisles || [];
     const originalTotal = showtime.price * selectedSeats.length;
     const finalTotal = Math.max(0, originalTotal - discountAmount);
 
@@ -463,6 +514,7 @@ export default function BookingPage({ params }: { params: Promise<{ id: string }
                                                 return (
                                                     <button
                                                         key={seatId}
+                                                        style={aisles.includes(col - 1) ? { marginLeft: '1.5rem' } : undefined}
                                                         onClick={() => toggleSeat(seatId)}
                                                         disabled={isUnavailable}
                                                         className={`
@@ -1,13 +1,39 @@
 # Authentication Middleware for FastAPI
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional
-from database import supabase
+from collections import OrderedDict
+from typing import Optional, Tuple
+from database import db, url as supabase_url
+from executor import run_blocking
+import hashlib
+import hmac
 import jwt
 import os
+import time
 
 security = HTTPBearer(auto_error=False)
 
+# Local verification: HS256 tokens against the project's JWT secret, or
+# asymmetric (RS256/ES256) tokens against the project's cached JWKS
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "")
+SUPABASE_JWKS_URL = os.environ.get("SUPABASE_JWKS_URL", f"{supabase_url}/auth/v1/.well-known/jwks.json")
+SUPABASE_JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+# Ask Supabase Auth (one network round trip) when a token can't be checked
+# locally, e.g. no JWT secret configured or the JWKS can't be fetched
+AUTH_REMOTE_FALLBACK = os.environ.get("AUTH_REMOTE_FALLBACK", "false").lower() == "true"
+
+# Shared key for operational endpoints (e.g. waiting-room switches), sent
+# as X-Admin-Key; those endpoints are closed while it isn't set
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY", "")
+
+# Verified tokens are reused until they expire (or this TTL, if sooner)
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "1024"))
+
+_jwks_client = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=3600)
+
 class AuthUser:
     """Authenticated user model"""
     def __init__(self, id: str, email: str, user_metadata: dict = None):
@@ -15,19 +41,95 @@ class AuthUser:
         self.email = email
         self.user_metadata = user_metadata or {}
 
+class KeyUnavailable(Exception):
+    """No key material to verify a token locally"""
+
+_token_cache: "OrderedDict[str, Tuple[float, AuthUser]]" = OrderedDict()
+
+def _cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def cached_user(token: str) -> Optional[AuthUser]:
+    """User for a token verified earlier and not yet expired (no verification work)"""
+    key = _cache_key(token)
+    entry = _token_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at <= time.time():
+        del _token_cache[key]
+        return None
+    _token_cache.move_to_end(key)
+    return user
+
+def _cache_user(token: str, user: AuthUser, exp: float):
+    _token_cache[_cache_key(token)] = (min(exp, time.time() + TOKEN_CACHE_TTL), user)
+    while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+        _token_cache.popitem(last=False)
+
+async def _verify_locally(token: str) -> Tuple[AuthUser, float]:
+    """
+    Check signature, expiry and audience without calling Supabase.
+    Raises jwt.InvalidTokenError for a bad token, KeyUnavailable if it
+    can't be checked here.
+    """
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise KeyUnavailable("SUPABASE_JWT_SECRET is not set")
+        key = SUPABASE_JWT_SECRET
+    elif algorithm in ASYMMETRIC_ALGORITHMS:
+        try:
+            # Fetched over HTTP only when the kid isn't cached yet
+            key = (await run_blocking(_jwks_client.get_signing_key_from_jwt, token)).key
+        except jwt.PyJWKClientError as e:
+            raise KeyUnavailable(str(e))
+    else:
+        raise jwt.InvalidAlgorithmError(f"Unsupported algorithm: {algorithm}")
+
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=SUPABASE_JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+    user = AuthUser(
+        id=claims["sub"],
+        email=claims.get("email"),
+        user_metadata=claims.get("user_metadata"),
+    )
+    return user, claims["exp"]
+
+async def _verify_remotely(token: str) -> Optional[AuthUser]:
+    """Verify token with Supabase Auth (network round trip)"""
+    response = await db.auth.get_user(token)
+    if response and response.user:
+        return AuthUser(
+            id=response.user.id,
+            email=response.user.email,
+            user_metadata=response.user.user_metadata
+        )
+    return None
+
 async def verify_token(token: str) -> Optional[AuthUser]:
     """Verify JWT token and return user"""
+    user = cached_user(token)
+    if user:
+        return user
     try:
-        # Verify token with Supabase
-        response = supabase.auth.get_user(token)
-        
-        if response and response.user:
-            return AuthUser(
-                id=response.user.id,
-                email=response.user.email,
-                user_metadata=response.user.user_metadata
-            )
+        user, exp = await _verify_locally(token)
+        _cache_user(token, user, exp)
+        return user
+    except jwt.InvalidTokenError as e:
+        print(f"Token verification error: {e}")
         return None
+    except KeyUnavailable as e:
+        if not AUTH_REMOTE_FALLBACK:
+            print(f"Token verification error: {e}")
+            return None
+    try:
+        return await _verify_remotely(token)
     except Exception as e:
         print(f"Token verification error: {e}")
         return None
@@ -81,3 +183,19 @@ async def get_user_from_request(request: Request) -> Optional[AuthUser]:
     
     token = auth_header.replace("Bearer ", "")
     return await verify_token(token)
+
+async def require_admin(request: Request):
+    """
+    Dependency for operational endpoints: requires X-Admin-Key to match
+    ADMIN_API_KEY. Fails closed (503) when no key is configured.
+    """
+    if not ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Admin access is not configured",
+        )
+    if not hmac.compare_digest(request.headers.get("x-admin-key", ""), ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin key required",
+        )
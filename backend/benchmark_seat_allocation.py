@@ -0,0 +1,103 @@
+"""
+Best-available allocation benchmark.
+
+1. Planning: times seat_allocator.find_best_block on a 500-seat IMAX-style
+   hall (20 rows x 25 seats, two aisles) at several occupancy levels.
+2. Allocation: many concurrent bookers call allocate_best_available
+   against one synthetic showtime in Redis until the hall is full, then
+   checks no seat was handed out twice.
+
+Usage:
+    REDIS_URL=redis://localhost:6379 python benchmark_seat_allocation.py [bookers] [party_size]
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+
+import redis_client
+import seat_allocator
+import seat_state
+from seat_state import SeatLayout
+
+IMAX = SeatLayout(rows=20, cols=25, aisles=[5, 20], premium_rows=[12, 13, 14, 15])
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[max(int(len(samples) * 0.99) - 1, 0)]
+
+
+def bench_planning(iterations=2000):
+    for occupancy in (0.0, 0.5, 0.9):
+        sold = [seat for seat in IMAX.seat_ids if random.random() < occupancy]
+        unavailable = IMAX.to_int(IMAX.to_bitmap(sold))
+        for party_size in (2, 4, 8):
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                seat_allocator.find_best_block(IMAX, unavailable, party_size)
+                timings.append((time.perf_counter() - started) * 1_000_000)
+            p50, p99 = percentiles(timings)
+            print(f"occupancy={occupancy:.0%} party={party_size:<2} p50={p50:7.1f}us  p99={p99:7.1f}us")
+
+
+async def bench_allocation(bookers, party_size):
+    showtime_id = f"bench-{uuid.uuid4()}"
+    # Seed layout and an empty sold bitmap so nothing is read from Supabase
+    await seat_state.store_layout(showtime_id, IMAX)
+    await redis_client.redis_bytes_client.set(redis_client.sold_bitmap_key(showtime_id), IMAX.from_int(0))
+
+    latencies = []
+    allocated = []
+    failures = 0
+    slots = asyncio.Semaphore(bookers)
+
+    async def book():
+        async with slots:
+            started = time.perf_counter()
+            result = await seat_allocator.allocate_best_available(
+                showtime_id, party_size, str(uuid.uuid4()), "bench@example.com",
+                centre=random.random() < 0.8,
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            return result
+
+    requests = IMAX.capacity // party_size + bookers
+    for result in await asyncio.gather(*(book() for _ in range(requests))):
+        if result["success"]:
+            allocated.extend(result["locked_seats"])
+        else:
+            failures += 1
+
+    r = redis_client.redis_client
+    keys = [key async for key in r.scan_iter(f"seat_lock:{showtime_id}:*")]
+    await r.delete(*redis_client.seat_keys(showtime_id, []), seat_state.layout_key(showtime_id), *keys)
+    await r.srem(redis_client.LOCKED_SHOWTIMES_KEY, showtime_id)
+
+    p50, p99 = percentiles(latencies)
+    print(f"requests={requests} seated={len(allocated)}/{IMAX.capacity} refused={failures} "
+          f"p50={p50:.2f}ms p99={p99:.2f}ms")
+    duplicates = len(allocated) - len(set(allocated))
+    print("✅ No seat allocated twice" if not duplicates else f"❌ {duplicates} seats allocated twice")
+
+
+async def main():
+    bookers = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    party_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print(f"🚀 Planning on a {IMAX.capacity}-seat hall")
+    print("=" * 60)
+    bench_planning()
+
+    print(f"\n🚀 Allocation: {bookers} concurrent bookers, party of {party_size}")
+    print("=" * 60)
+    await bench_allocation(bookers, party_size)
+    await redis_client.close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Seat lock contention benchmark.
+
+Compares the old per-seat SET NX loop (with per-seat GET/DEL rollback)
+against the scripted all-or-nothing lock in redis_client.lock_seats.
+Many concurrent lockers race for overlapping seat groups in the same
+showtime.
+
+Usage:
+    REDIS_URL=redis://localhost:6379 python benchmark_seat_locks.py [lockers] [rounds] [party_size]
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+
+import redis_client
+from redis_client import SEAT_LOCK_TTL
+
+ROWS = "ABCDEFGH"
+COLS = 12
+
+
+async def legacy_lock_seats(showtime_id, seats, user_session, customer_email):
+    """The pre-script implementation: one SET per seat, GET + DEL per rollback."""
+    r = redis_client.redis_client
+    locked, failed = [], []
+    lock_data = json.dumps({"user_session": user_session, "customer_email": customer_email, "locked_at": None})
+    for seat in seats:
+        if await r.set(f"seat_lock:{showtime_id}:{seat}", lock_data, nx=True, ex=SEAT_LOCK_TTL):
+            locked.append(seat)
+        else:
+            failed.append(seat)
+    if failed:
+        for seat in locked:
+            key = f"seat_lock:{showtime_id}:{seat}"
+            data = await r.get(key)
+            if data and json.loads(data).get("user_session") == user_session:
+                await r.delete(key)
+        return {"success": False}
+    return {"success": True}
+
+
+def random_group(party_size):
+    row = random.choice(ROWS)
+    start = random.randint(1, COLS - party_size + 1)
+    return [f"{row}{col}" for col in range(start, start + party_size)]
+
+
+async def run(label, lock_fn, lockers, rounds, party_size):
+    showtime_id = f"bench-{uuid.uuid4()}"
+    latencies = []
+    wins = 0
+    slots = asyncio.Semaphore(lockers)
+    r = redis_client.redis_client
+    # The scripted lock only accepts seats with an offset in the layout
+    await r.hset(redis_client.seat_offsets_key(showtime_id), mapping={
+        f"{row}{col + 1}": i * COLS + col for i, row in enumerate(ROWS) for col in range(COLS)
+    })
+
+    async def attempt():
+        async with slots:
+            session = str(uuid.uuid4())
+            seats = random_group(party_size)
+            started = time.perf_counter()
+            result = await lock_fn(showtime_id, seats, session, "bench@example.com")
+            return time.perf_counter() - started, result["success"]
+
+    for elapsed, success in await asyncio.gather(*(attempt() for _ in range(lockers * rounds))):
+        latencies.append(elapsed * 1000)
+        wins += int(success)
+
+    keys = [key async for key in r.scan_iter(f"seat_lock:{showtime_id}:*")]
+    await r.delete(*redis_client.seat_keys(showtime_id, []), *keys)
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<10} attempts={len(latencies):<6} won={wins:<5} "
+          f"p50={statistics.median(latencies):.2f}ms p99={p99:.2f}ms")
+
+
+async def main():
+    lockers = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    party_size = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+
+    print(f"🚀 Seat lock contention: {lockers} concurrent lockers, {rounds} rounds, party of {party_size}")
+    print("=" * 60)
+    await run("legacy", legacy_lock_seats, lockers, rounds, party_size)
+    await run("scripted", redis_client.lock_seats, lockers, rounds, party_size)
+    await redis_client.close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
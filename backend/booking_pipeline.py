@@ -0,0 +1,319 @@
+"""
+Webhook-driven booking confirmation.
+
+Stripe's payment_intent.succeeded / payment_intent.canceled events
+are verified by the webhook endpoint and appended to a Redis stream; the
+request returns as soon as the event is durable. Worker coroutines in
+every API process read the stream through a consumer group and:
+
+    succeeded  commit the booking (commit_booking RPC), mark its seats sold,
+               and add a confirmation email to the email_jobs stream
+    canceled   release the session's seat locks
+
+payment_intent.payment_failed isn't handled: it also fires for declines
+the customer retries on the same intent, so their seats must stay held
+(the locks expire on their own if they give up).
+
+An entry is acknowledged only once handled, so a crash or a Supabase
+outage leaves it pending; workers reclaim entries idle for longer than
+RECLAIM_IDLE_MS and give up after MAX_DELIVERIES, moving them to a
+dead-letter stream. Handling is idempotent per payment intent (an
+existing booking for the intent is reused), so redelivery and the
+browser's /bookings/confirm-booking call can't double-book.
+
+Progress is kept in booking_status:{payment_intent_id} for the client
+to poll: pending -> processing -> confirmed | conflict | failed.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from postgrest.exceptions import APIError
+from redis.exceptions import ResponseError
+
+import idempotency
+import redis_client
+import seat_state
+from database import db
+from executor import run_blocking
+
+BOOKING_STREAM = "booking_events"
+BOOKING_GROUP = "booking_workers"
+EMAIL_STREAM = "email_jobs"
+EMAIL_GROUP = "email_workers"
+DEAD_LETTER_STREAM = "booking_events:dead"
+
+BOOKING_WORKERS = int(os.environ.get("BOOKING_WORKERS", "4"))  # per process
+EMAIL_WORKERS = int(os.environ.get("EMAIL_WORKERS", "2"))  # per process
+STREAM_MAXLEN = 100_000  # approximate cap per stream
+READ_BLOCK_MS = 5000
+RECLAIM_IDLE_MS = 60_000  # pending this long = its worker died or failed
+MAX_DELIVERIES = 5
+BOOKING_STATUS_TTL = 86400  # 24 hours
+STRIPE_EVENT_TTL = 86400 * 3  # Stripe retries for up to 3 days
+
+UNIQUE_VIOLATION = "23505"  # Postgres error code raised by booking_seats on a double booking
+
+def booking_status_key(payment_intent_id: str) -> str:
+    return f"booking_status:{payment_intent_id}"
+
+def _consumer_name(index: int) -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+async def set_booking_status(payment_intent_id: str, status: str, **fields):
+    """Record a payment intent's progress for the status endpoint"""
+    key = booking_status_key(payment_intent_id)
+    pipe = redis_client.redis_client.pipeline()
+    pipe.hset(key, mapping={"status": status, "updated_at": int(time.time()), **{k: str(v) for k, v in fields.items()}})
+    pipe.expire(key, BOOKING_STATUS_TTL)
+    await pipe.execute()
+
+async def get_booking_status(payment_intent_id: str) -> dict:
+    """{"status", "booking_id"?, "detail"?}; "pending" until the webhook arrives"""
+    status = await redis_client.redis_client.hgetall(booking_status_key(payment_intent_id))
+    return status or {"status": "pending"}
+
+async def enqueue_stripe_event(event: dict) -> bool:
+    """
+    Queue a verified payment_intent event. Returns False for a Stripe
+    event id that was already queued (Stripe delivers at least once).
+    """
+    r = redis_client.redis_client
+    if not await r.set(f"stripe_event:{event['id']}", 1, nx=True, ex=STRIPE_EVENT_TTL):
+        return False
+    intent = event["data"]["object"]
+    try:
+        await r.xadd(BOOKING_STREAM, {
+            "event_id": event["id"],
+            "type": event["type"],
+            "payment_intent": json.dumps(intent),
+        }, maxlen=STREAM_MAXLEN, approximate=True)
+    except Exception:
+        # Not queued: let Stripe's retry queue it
+        await r.delete(f"stripe_event:{event['id']}")
+        raise
+    return True
+
+async def find_booking_by_payment_intent(payment_intent_id: str) -> Optional[dict]:
+    """The booking already committed for a payment intent, if any"""
+    response = await db.table("bookings").select("*").eq("stripe_payment_intent_id", payment_intent_id).limit(1).execute()
+    return response.data[0] if response.data else None
+
+async def commit_booking(
+    showtime_id: str,
+    customer_name: str,
+    customer_email: str,
+    customer_phone: str,
+    seats: List[str],
+    total_amount: int,
+    payment_intent_id: str,
+    coupon_code: Optional[str] = None,
+    discount_amount: int = 0,
+    user_id: Optional[str] = None,
+) -> dict:
+    """
+    Save a paid booking in one round trip (see
+    supabase/migrations/007_commit_booking_function.sql).
+    Returns {"booking", "showtime"}; raises APIError (UNIQUE_VIOLATION on a seat conflict).
+    """
+    response = await db.rpc("commit_booking", {
+        "p_showtime_id": showtime_id,
+        "p_customer_name": customer_name,
+        "p_customer_email": customer_email,
+        "p_customer_phone": customer_phone,
+        "p_seats": seats,
+        "p_total_amount": total_amount,
+        "p_payment_intent_id": payment_intent_id,
+        "p_coupon_code": coupon_code,
+        "p_discount_amount": discount_amount or 0,
+        "p_user_id": user_id,
+    }).execute()
+    if not response.data:
+        raise RuntimeError("Failed to save booking to database")
+    return response.data
+
+def confirmation_email(booking: dict, showtime: dict, seats: List[str]) -> Dict[str, object]:
+    """send_booking_confirmation kwargs for a committed booking"""
+    formatted_time = datetime.fromisoformat(showtime['start_time'].replace('Z', '+00:00')).strftime('%B %d, %Y at %I:%M %p')
+    return {
+        "customer_email": booking["customer_email"],
+        "customer_name": booking["customer_name"],
+        "movie_title": showtime["movie_title"],
+        "theater_name": showtime["theater_name"],
+        "screen_name": showtime["screen_name"],
+        "showtime": formatted_time,
+        "seats": seats,
+        "total_amount": booking["total_amount"],
+        "booking_id": booking["id"],
+    }
+
+async def enqueue_email(kwargs: Dict[str, object]):
+    await redis_client.redis_client.xadd(
+        EMAIL_STREAM, {"kwargs": json.dumps(kwargs)}, maxlen=STREAM_MAXLEN, approximate=True,
+    )
+
+def _seats_from(metadata: dict) -> List[str]:
+    return [seat.strip() for seat in (metadata.get("seats") or "").split(",") if seat.strip()]
+
+async def _mark_confirmed(payment_intent_id: str, booking: dict):
+    # A retried /bookings/confirm-booking then returns this booking in one read
+    await idempotency.complete("confirm_booking", payment_intent_id, booking)
+    await set_booking_status(payment_intent_id, "confirmed", booking_id=booking["id"])
+
+async def _handle_succeeded(intent: dict):
+    payment_intent_id = intent["id"]
+    metadata = intent.get("metadata") or {}
+    if not metadata.get("showtime_id"):
+        # Not created by /bookings/create-payment-intent
+        return
+    await set_booking_status(payment_intent_id, "processing")
+
+    existing = await find_booking_by_payment_intent(payment_intent_id)
+    if existing:
+        await _mark_confirmed(payment_intent_id, existing)
+        return
+
+    showtime_id = metadata["showtime_id"]
+    seats = _seats_from(metadata)
+    try:
+        result = await commit_booking(
+            showtime_id=showtime_id,
+            customer_name=metadata.get("customer_name", ""),
+            customer_email=metadata.get("customer_email", ""),
+            customer_phone=metadata.get("customer_phone", ""),
+            seats=seats,
+            total_amount=intent["amount"],
+            payment_intent_id=payment_intent_id,
+            coupon_code=metadata.get("coupon_code") or None,
+            discount_amount=int(metadata.get("discount_amount") or 0),
+            user_id=metadata.get("user_id") or None,
+        )
+    except APIError as e:
+        if e.code != UNIQUE_VIOLATION:
+            raise
+        # Either this intent was committed concurrently (browser confirm), or
+        # the seats were sold to someone else while the payment went through
+        existing = await find_booking_by_payment_intent(payment_intent_id)
+        if existing:
+            await _mark_confirmed(payment_intent_id, existing)
+            return
+        print(f"❌ Paid booking conflicts with sold seats, refund needed: {payment_intent_id}: {e.message}")
+        await set_booking_status(payment_intent_id, "conflict", detail=e.message or "Seats already booked")
+        return
+
+    booking = result["booking"]
+    showtime = result.get("showtime")
+    print(f"✅ Booking saved from webhook: {booking['id']}")
+    try:
+        await seat_state.confirm_seats(showtime_id, seats)
+    except Exception as e:
+        print(f"⚠️ Failed to update seat state: {e}")
+    if showtime:
+        await enqueue_email(confirmation_email(booking, showtime, seats))
+    await _mark_confirmed(payment_intent_id, booking)
+
+async def _handle_canceled(intent: dict):
+    metadata = intent.get("metadata") or {}
+    if metadata.get("user_session") and metadata.get("showtime_id"):
+        await redis_client.unlock_seats(metadata["showtime_id"], _seats_from(metadata), metadata["user_session"])
+    # A retry of the same request must get a new intent, not this dead one's clientSecret
+    await idempotency.forget("payment_intent", intent["id"])
+    await set_booking_status(intent["id"], "failed", detail="Payment was canceled")
+
+async def handle_booking_event(fields: Dict[str, str]):
+    """Apply one queued Stripe event"""
+    intent = json.loads(fields["payment_intent"])
+    if fields["type"] == "payment_intent.succeeded":
+        await _handle_succeeded(intent)
+    elif fields["type"] == "payment_intent.canceled":
+        await _handle_canceled(intent)
+
+async def _send_email(fields: Dict[str, str]):
+    from email_service import send_booking_confirmation
+    await run_blocking(send_booking_confirmation, **json.loads(fields["kwargs"]))
+
+async def _dead_letter(stream: str, group: str, message_id: str, fields: Dict[str, str]):
+    """Park an entry that kept failing, so it stops being redelivered"""
+    r = redis_client.redis_client
+    await r.xadd(DEAD_LETTER_STREAM, {"stream": stream, "id": message_id, **fields}, maxlen=STREAM_MAXLEN, approximate=True)
+    await r.xack(stream, group, message_id)
+    if stream == BOOKING_STREAM:
+        intent = json.loads(fields["payment_intent"])
+        await set_booking_status(intent["id"], "failed", detail="Booking could not be confirmed; please contact support")
+    print(f"❌ Gave up on {stream} entry {message_id} after {MAX_DELIVERIES} attempts")
+
+async def _ensure_group(stream: str, group: str):
+    try:
+        await redis_client.redis_client.xgroup_create(stream, group, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def _reclaim(stream: str, group: str, consumer: str) -> list:
+    """Take over entries another worker left pending; dead-letter repeat failures"""
+    r = redis_client.redis_client
+    stale = await r.xpending_range(stream, group, min="-", max="+", count=10, idle=RECLAIM_IDLE_MS)
+    if not stale:
+        return []
+    claimed = await r.xclaim(stream, group, consumer, RECLAIM_IDLE_MS, [entry["message_id"] for entry in stale])
+    deliveries = {entry["message_id"]: entry["times_delivered"] for entry in stale}
+    messages = []
+    for message_id, fields in claimed:
+        if not fields:
+            # Trimmed from the stream; nothing left to do
+            await r.xack(stream, group, message_id)
+        elif deliveries.get(message_id, 0) >= MAX_DELIVERIES:
+            await _dead_letter(stream, group, message_id, fields)
+        else:
+            messages.append((message_id, fields))
+    return messages
+
+async def _consume(stream: str, group: str, consumer: str, handler):
+    """One worker: read new entries (and reclaimed stale ones), ack what was handled"""
+    r = redis_client.redis_client
+    while True:
+        try:
+            messages = await _reclaim(stream, group, consumer)
+            if not messages:
+                response = await r.xreadgroup(group, consumer, {stream: ">"}, count=10, block=READ_BLOCK_MS)
+                messages = response[0][1] if response else []
+            for message_id, fields in messages:
+                try:
+                    await handler(fields)
+                except Exception as e:
+                    # Left pending; reclaimed and retried after RECLAIM_IDLE_MS
+                    print(f"⚠️ {stream} entry {message_id} failed: {e}")
+                    continue
+                await r.xack(stream, group, message_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ {stream} worker error: {e}. Retrying.")
+            await asyncio.sleep(1)
+            if "NOGROUP" in str(e):
+                # Stream was deleted (e.g. Redis flushed); recreate it
+                await _ensure_group(stream, group)
+
+async def run_booking_workers():
+    """Booking and email workers for this process; run until cancelled"""
+    while True:
+        try:
+            await _ensure_group(BOOKING_STREAM, BOOKING_GROUP)
+            await _ensure_group(EMAIL_STREAM, EMAIL_GROUP)
+            break
+        except Exception as e:
+            print(f"⚠️ Could not create booking stream groups: {e}. Retrying.")
+            await asyncio.sleep(5)
+    workers = [
+        _consume(BOOKING_STREAM, BOOKING_GROUP, _consumer_name(i), handle_booking_event)
+        for i in range(BOOKING_WORKERS)
+    ] + [
+        _consume(EMAIL_STREAM, EMAIL_GROUP, _consumer_name(i), _send_email)
+        for i in range(EMAIL_WORKERS)
+    ]
+    await asyncio.gather(*workers)
@@ -1,94 +1,565 @@
+import asyncio
 import functools
+import gzip
+import inspect
 import json
 import hashlib
-from typing import Callable, Any, Optional
+import math
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Any, Dict, List, Optional, Tuple
 from fastapi import Request, Response
-from fastapi.responses import JSONResponse
+import metrics
 import redis_client
 
-# Cache TTL configurations (in seconds)
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped without it
+    brotli = None
+
+# Cache TTL configurations (in seconds). Writes through the API invalidate
+# by tag; TTLs bound staleness for everything else: data that changes with
+# time (listings filtered on start_time / valid_until) and rows edited
+# outside the API (dashboard, seed scripts).
 CACHE_TTL = {
-    "movies_list": 300,  # 5 minutes
-    "movie_detail": 600,  # 10 minutes
-    "showtimes": 120,  # 2 minutes
-    "offers": 900,  # 15 minutes
-    "ads": 1800,  # 30 minutes
+    "movies_list": 240,  # 4 minutes
+    "movies_with_showtimes": 90,  # 90 seconds (time-filtered)
+    "movie_detail": 480,  # 8 minutes
+    "showtimes": 90,  # 90 seconds (time-filtered)
+    "offers": 600,  # 10 minutes (time-filtered)
+    "ads": 1500,  # 25 minutes
     "theaters": 600,  # 10 minutes
     "upcoming_movies": 600,  # 10 minutes
 }
 
+# How long past its TTL an entry may still be served (in seconds): stale
+# while a background refresh runs, and for as long as refreshes keep failing.
+# TTL + stale is the real staleness bound, so each endpoint keeps it within
+# the TTL it had before stale serving (2 minutes for showtimes, 15 for
+# offers), or listings would show showtimes that have already started.
+CACHE_STALE_TTL = {
+    "movies_list": 60,  # 1 minute
+    "movies_with_showtimes": 30,  # 30 seconds (time-filtered)
+    "movie_detail": 120,  # 2 minutes
+    "showtimes": 30,  # 30 seconds (time-filtered)
+    "offers": 300,  # 5 minutes (time-filtered)
+    "ads": 300,  # 5 minutes
+}
+
+# In-process (L1) cache size per worker
+L1_MAX_ENTRIES = int(os.environ.get("L1_CACHE_MAX_ENTRIES", "512"))
+
+# Pub/sub channel used to evict L1 entries in every worker
+INVALIDATION_CHANNEL = "api_cache:invalidate"
+
+# Single-flight recomputation: one worker holds a short lease per key while
+# the others wait for its result (polling Redis) instead of querying too
+CACHE_LEASE_MS = int(os.environ.get("CACHE_LEASE_MS", "10000"))
+CACHE_LEASE_POLL_MS = int(os.environ.get("CACHE_LEASE_POLL_MS", "50"))
+
+# Probabilistic early refresh (XFetch): a hit refreshes ahead of expiry with a
+# probability that grows as expiry nears, scaled by how long the value took to
+# compute. Higher beta refreshes earlier; 0 disables it.
+XFETCH_BETA = float(os.environ.get("CACHE_XFETCH_BETA", "1.0"))
+
+# Bodies at least this large are stored pre-compressed (matches GZipMiddleware's minimum_size)
+COMPRESS_MIN_SIZE = 1000
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Clients may store cached responses but must revalidate (If-None-Match)
+# every time, so tag invalidations reach them immediately
+CACHE_CONTROL = "public, no-cache"
+
+# Releases a lease only if we still hold it
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class LocalCache:
+    """
+    Size-bounded LRU of encoded responses (every content-encoding variant),
+    each expiring when its Redis (L2) copy goes stale, so a worker never
+    serves data older than the route's TTL.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[str, ...], Dict[str, bytes]]]" = OrderedDict()
+        # Bumped on every eviction, so a fill can tell one happened while it computed
+        self.generation = 0
+
+    def get(self, key: str) -> Optional[Dict[str, bytes]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, variants = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return variants
+
+    def set(self, key: str, tags: Tuple[str, ...], variants: Dict[str, bytes], ttl: float):
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, tags, variants)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def evict_tags(self, tags: List[str]) -> int:
+        self.generation += 1
+        tags = set(tags)
+        keys = [key for key, (_, entry_tags, _) in self._entries.items() if tags.intersection(entry_tags)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+local_cache = LocalCache(L1_MAX_ENTRIES)
+
+def _tag_version_key(tag: str) -> str:
+    """Redis key holding a tag's version counter"""
+    return f"api_cache_tag:{tag}"
+
+def _lease_key(cache_key: str) -> str:
+    """Redis key for the single-flight recompute lease of a cache entry"""
+    return f"api_cache_lease:{cache_key}"
+
 def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     """Generate a unique cache key based on function arguments"""
-    key_data = f"{prefix}:{str(args)}:{str(sorted(kwargs.items()))}"
-    return f"api_cache:{hashlib.md5(key_data.encode()).hexdigest()}"
+    key_data = f"{str(args)}:{str(sorted(kwargs.items()))}"
+    return f"api_cache:{prefix}:{hashlib.md5(key_data.encode()).hexdigest()}"
+
+def _encode_variants(body: bytes) -> Dict[str, bytes]:
+    """
+    Encoded JSON body plus its gzip/brotli variants, compressed once at
+    fill time, and the content hash used as the ETag
+    """
+    variants = {"identity": body, "etag": hashlib.md5(body).hexdigest().encode()}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """Codings the client accepts (ignores q-value preferences other than q=0)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+    return accepted
+
+def etag_matches(request: Optional[Request], etag: str) -> bool:
+    """
+    True if the request's If-None-Match names this ETag (weak comparison,
+    ignoring the content-coding suffix of pre-compressed variants)
+    """
+    if request is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    base = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate.removeprefix("W/").strip('"')
+        if candidate in (base, f"{base}-gzip", f"{base}-br"):
+            return True
+    return False
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """304 response carrying the validators a 200 would have sent"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL, **(headers or {})})
+
+def _prefix_of(cache_key: str) -> str:
+    """Key prefix of an "api_cache:<prefix>:<md5>" key, for metric labels"""
+    return cache_key.split(":")[1]
+
+def _json_response(variants: Dict[str, bytes], request: Optional[Request], prefix: str) -> Response:
+    """
+    Serve an already-encoded JSON body without decoding/re-encoding it,
+    pre-compressed when the client accepts it, or a 304 if the client's
+    copy is current. GZipMiddleware leaves responses that already carry
+    Content-Encoding alone.
+    """
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": CACHE_CONTROL}
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", "")) if request else set()
+    coding = next((c for c in ("br", "gzip") if c in variants and (c in accepted or "*" in accepted)), "identity")
+    
+    etag = variants["etag"].decode() if "etag" in variants else None
+    if etag:
+        # Strong validators differ per content-coding, since the bytes do
+        etag = f'"{etag}"' if coding == "identity" else f'"{etag}-{coding}"'
+        headers["ETag"] = etag
+        if etag_matches(request, etag):
+            metrics.CACHE_NOT_MODIFIED.labels(prefix).inc()
+            return not_modified(etag, {"Vary": "Accept-Encoding"})
+    
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    metrics.CACHE_PAYLOAD_BYTES.labels(prefix, coding).inc(len(variants[coding]))
+    return Response(content=variants[coding], media_type="application/json", headers=headers)
+
+_release_lease_script = redis_client.redis_client.register_script(RELEASE_LEASE_SCRIPT)
+
+# Recomputations in flight in this worker, so concurrent misses for one key
+# share a single lease/poll/compute instead of each contending in Redis
+_inflight: Dict[str, "asyncio.Task"] = {}
+
+def _versions(tags: Tuple[str, ...], raw_versions: List[Optional[bytes]]) -> Dict[str, int]:
+    return {tag: int(version or 0) for tag, version in zip(tags, raw_versions)}
+
+async def _read_entry(cache_key: str, tags: Tuple[str, ...]):
+    """
+    Read an entry and the current tag versions in one round trip.
+    Returns (variants, delta, fresh_ms, versions); variants is None on a miss or
+    when a tag has been invalidated since the entry was built. fresh_ms is
+    the time left until the soft TTL, negative once the entry is stale.
+    """
+    pipe = redis_client.redis_bytes_client.pipeline()
+    pipe.hmget(cache_key, "body", "gzip", "br", "etag", "tags", "delta", "fresh_until")
+    pipe.mget([_tag_version_key(tag) for tag in tags])
+    (body, gzipped, brotlied, etag, cached_tags, delta, fresh_until), raw_versions = await pipe.execute()
+    versions = _versions(tags, raw_versions)
+    if not body or json.loads(cached_tags) != versions:
+        return None, 0.0, 0, versions
+    variants = {"identity": body}
+    if etag:
+        variants["etag"] = etag
+    if gzipped:
+        variants["gzip"] = gzipped
+    if brotlied:
+        variants["br"] = brotlied
+    fresh_ms = int(fresh_until or 0) - int(time.time() * 1000)
+    return variants, float(delta or 0), fresh_ms, versions
+
+def _should_refresh_early(delta: float, fresh_ms: int) -> bool:
+    """XFetch: refresh when delta * beta * -ln(rand) reaches the remaining TTL"""
+    if XFETCH_BETA <= 0 or delta <= 0:
+        return False
+    return -delta * XFETCH_BETA * math.log(1.0 - random.random()) * 1000 >= fresh_ms
+
+async def _compute_and_store(cache_key: str, tags: Tuple[str, ...], versions: Dict[str, int],
+                             ttl: int, stale_ttl: int, func: Callable, args, kwargs) -> Any:
+    """
+    Run the endpoint and cache its result against the versions read before
+    computing it, so a write that lands meanwhile still invalidates it.
+    The L1 copy is only kept if the versions still match after the write
+    and no eviction ran meanwhile (it could have run before this set).
+    Returns the encoded variants, or the endpoint's result if it isn't cacheable.
+    """
+    generation = local_cache.generation
+    started = time.monotonic()
+    result = await func(*args, **kwargs)
+    if not isinstance(result, (dict, list)):
+        return result
+    
+    variants = _encode_variants(json.dumps(result).encode())
+    delta = time.monotonic() - started
+    try:
+        pipe = redis_client.redis_bytes_client.pipeline()
+        pipe.hset(cache_key, mapping={
+            "body": variants["identity"],
+            **{field: data for field, data in variants.items() if field != "identity"},
+            "tags": json.dumps(versions),
+            "delta": delta,
+            "fresh_until": int(time.time() * 1000) + ttl * 1000,
+        })
+        pipe.expire(cache_key, ttl + stale_ttl)
+        pipe.mget([_tag_version_key(tag) for tag in tags])
+        *_, raw_versions = await pipe.execute()
+        if _versions(tags, raw_versions) == versions and local_cache.generation == generation:
+            local_cache.set(cache_key, tags, variants, ttl)
+        metrics.CACHE_FILL_SECONDS.labels(_prefix_of(cache_key)).observe(delta)
+        metrics.CACHE_FILL_BYTES.labels(_prefix_of(cache_key)).observe(len(variants["identity"]))
+    except Exception as e:
+        print(f"⚠️ Cache error: {e}. Response not cached.")
+    return variants
+
+async def _acquire_lease(lease_key: str, token: str) -> bool:
+    return bool(await redis_client.redis_client.set(lease_key, token, nx=True, px=CACHE_LEASE_MS))
+
+async def _wait_for_fill(cache_key: str, tags: Tuple[str, ...], deadline: float) -> Optional[Dict[str, bytes]]:
+    """
+    Poll for the lease holder's result until the deadline. Gives up early
+    (None) once the lease is gone without a result, i.e. the holder failed,
+    got an uncacheable result, or discarded it after an invalidation.
+    """
+    lease_key = _lease_key(cache_key)
+    while time.monotonic() < deadline:
+        await asyncio.sleep(CACHE_LEASE_POLL_MS / 1000)
+        variants, _, fresh_ms, _ = await _read_entry(cache_key, tags)
+        if variants is not None:
+            local_cache.set(cache_key, tags, variants, fresh_ms / 1000)
+            return variants
+        if not await redis_client.redis_client.exists(lease_key):
+            return None
+    return None
+
+async def _single_flight(cache_key: str, tags: Tuple[str, ...], versions: Dict[str, int],
+                         ttl: int, stale_ttl: int, func: Callable, args, kwargs, wait: bool) -> Any:
+    """
+    Recompute under a cross-worker lease. Without the lease, wait for the
+    holder's result (wait=True) or give up and return None (wait=False).
+    If the holder drops its lease without a result, the next waiter takes
+    the lease over; if nobody delivers within CACHE_LEASE_MS, compute
+    anyway rather than fail the request.
+    """
+    lease_key = _lease_key(cache_key)
+    token = uuid.uuid4().hex
+    try:
+        acquired = await _acquire_lease(lease_key, token)
+    except Exception as e:
+        print(f"⚠️ Cache lease error: {e}. Computing without lease.")
+        acquired = False
+        wait = False
+    
+    if not acquired:
+        if not wait:
+            return None
+        deadline = time.monotonic() + CACHE_LEASE_MS / 1000
+        while not acquired and time.monotonic() < deadline:
+            try:
+                variants = await _wait_for_fill(cache_key, tags, deadline)
+                if variants is not None:
+                    return variants
+                acquired = await _acquire_lease(lease_key, token)
+            except Exception as e:
+                print(f"⚠️ Cache lease error: {e}. Computing without lease.")
+                break
+        if not acquired:
+            print(f"⏱️ Cache lease wait timed out: {cache_key}")
+    
+    try:
+        return await _compute_and_store(cache_key, tags, versions, ttl, stale_ttl, func, args, kwargs)
+    finally:
+        if acquired:
+            try:
+                await _release_lease_script(keys=[lease_key], args=[token])
+            except Exception as e:
+                print(f"⚠️ Cache lease release error: {e}")
+
+def _start_flight(flight_key: str, factory: Callable) -> "asyncio.Task":
+    """Start (or join) this worker's in-flight recomputation for a key"""
+    task = _inflight.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[flight_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(flight_key, None))
+    return task
+
+async def _coalesced(flight_key: str, factory: Callable) -> Any:
+    """Share one in-flight recomputation per key within this worker"""
+    # A cancelled request must not cancel the computation others are awaiting
+    return await asyncio.shield(_start_flight(flight_key, factory))
+
+def _log_refresh_failure(cache_key: str, task: "asyncio.Task"):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Cache background refresh failed: {cache_key}: {task.exception()}. Serving stale.")
 
-def cache_response(ttl: int, key_prefix: str):
+def cache_response(ttl: int, key_prefix: str, tags: Optional[List[str]] = None, stale_ttl: int = 0):
     """
-    Decorator to cache API responses in Redis
+    Decorator to cache API responses in a per-worker LRU (L1) in front of Redis (L2)
+    
+    Responses are cached as encoded JSON, with gzip/brotli variants made
+    once at fill time, so a hit is served as raw bytes in the encoding the
+    client accepts, with no JSON or compression work. Responses carry an
+    ETag (the content hash) and a matching If-None-Match gets a 304 straight
+    from the cache. Each entry records
+    the versions of its tags; invalidate_tags() bumps a version, which makes
+    every entry built against the old one a miss without touching or
+    scanning the entries.
+    
+    Misses are recomputed single-flight: one request across all workers
+    holds a lease and runs the endpoint while the rest wait for its result.
+    Hits near expiry are refreshed early (XFetch) by whichever request wins
+    the lease; everyone else keeps getting the current value.
+    
+    With a stale_ttl, an entry past its TTL is still served immediately
+    while one background refresh runs; if that refresh fails (e.g. Supabase
+    is down) the stale copy keeps being served until ttl + stale_ttl.
     
     Args:
-        ttl: Time to live in seconds
+        ttl: Time to live in seconds (soft TTL when stale_ttl is set)
         key_prefix: Prefix for the cache key
+        tags: Tag templates formatted with the endpoint's arguments,
+              e.g. ["movies", "movie:{movie_id}"] (defaults to [key_prefix])
+        stale_ttl: Extra seconds a stale entry may be served (hard TTL = ttl + stale_ttl)
     """
+    tag_templates = tags or [key_prefix]
+
     def decorator(func: Callable) -> Callable:
         @functools.wraps(func)
         async def wrapper(*args, **kwargs) -> Any:
+            # Injected by FastAPI (see __signature__ below); not part of the key
+            request = kwargs.pop("_cache_request", None)
+            
+            def respond(result):
+                # Recomputes yield encoded variants, or the endpoint's own non-JSON result
+                return _json_response(result, request, key_prefix) if isinstance(result, dict) else result
+            
             # Generate cache key
             cache_key = generate_cache_key(key_prefix, *args, **kwargs)
+            entry_tags = tuple(template.format(**kwargs) for template in tag_templates)
+            
+            variants = local_cache.get(cache_key)
+            if variants is not None:
+                metrics.CACHE_REQUESTS.labels(key_prefix, "l1_hit").inc()
+                return _json_response(variants, request, key_prefix)
             
             try:
-                # Try to get from cache
-                cached_data = redis_client.redis_client.get(cache_key)
-                if cached_data:
-                    print(f"✅ Cache HIT: {cache_key}")
-                    return JSONResponse(content=json.loads(cached_data))
-                
-                print(f"❌ Cache MISS: {cache_key}")
-                
-                # Execute function
-                result = await func(*args, **kwargs)
-                
-                # Cache the result
-                if isinstance(result, (dict, list)):
-                    redis_client.redis_client.setex(
-                        cache_key,
-                        ttl,
-                        json.dumps(result)
-                    )
-                    print(f"💾 Cached: {cache_key} (TTL: {ttl}s)")
-                
-                return result
-                
+                variants, delta, fresh_ms, versions = await _read_entry(cache_key, entry_tags)
             except Exception as e:
                 print(f"⚠️ Cache error: {e}. Proceeding without cache.")
-                # If cache fails, execute function normally
+                metrics.CACHE_REQUESTS.labels(key_prefix, "bypass").inc()
                 return await func(*args, **kwargs)
+            
+            def recompute(wait: bool):
+                return lambda: _single_flight(
+                    cache_key, entry_tags, versions, ttl, stale_ttl, func, args, kwargs, wait=wait)
+            
+            if variants is not None and fresh_ms <= 0:
+                # Stale: serve it now and refresh in the background
+                metrics.CACHE_REQUESTS.labels(key_prefix, "stale").inc()
+                refresh_key = f"{cache_key}:refresh"
+                if refresh_key not in _inflight:
+                    task = _start_flight(refresh_key, recompute(wait=False))
+                    task.add_done_callback(functools.partial(_log_refresh_failure, cache_key))
+                return _json_response(variants, request, key_prefix)
+            
+            if variants is not None:
+                if _should_refresh_early(delta, fresh_ms):
+                    try:
+                        refreshed = await _coalesced(f"{cache_key}:refresh", recompute(wait=False))
+                    except Exception as e:
+                        # The cached copy is still fresh; serve it
+                        print(f"⚠️ Cache early refresh failed: {cache_key}: {e}")
+                        refreshed = None
+                    if refreshed is not None:
+                        metrics.CACHE_REQUESTS.labels(key_prefix, "early_refresh").inc()
+                        return respond(refreshed)
+                metrics.CACHE_REQUESTS.labels(key_prefix, "hit").inc()
+                local_cache.set(cache_key, entry_tags, variants, fresh_ms / 1000)
+                return _json_response(variants, request, key_prefix)
+            
+            metrics.CACHE_REQUESTS.labels(key_prefix, "miss").inc()
+            return respond(await _coalesced(cache_key, recompute(wait=True)))
         
+        async def refresh(*args, **kwargs) -> bool:
+            """
+            Recompute and store the entry for these arguments now, through the
+            same lease as request-driven refreshes (used by the cache warmer).
+            Returns False if another worker is already refreshing it.
+            """
+            cache_key = generate_cache_key(key_prefix, *args, **kwargs)
+            entry_tags = tuple(template.format(**kwargs) for template in tag_templates)
+            _, _, _, versions = await _read_entry(cache_key, entry_tags)
+            result = await _coalesced(f"{cache_key}:refresh", lambda: _single_flight(
+                cache_key, entry_tags, versions, ttl, stale_ttl, func, args, kwargs, wait=False))
+            return result is not None
+        
+        wrapper.refresh = refresh
+        wrapper.cache_ttl = ttl
+        
+        # Ask FastAPI for the Request too, to pick a pre-compressed variant
+        signature = inspect.signature(func)
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("_cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+        ])
         return wrapper
     return decorator
 
-def invalidate_cache_pattern(pattern: str):
+# Decoded bodies by ETag (a content hash), so cached_json doesn't re-parse
+# the same listing on every request
+_decoded: "OrderedDict[str, Any]" = OrderedDict()
+DECODED_MAX_ENTRIES = 32
+
+async def cached_json(endpoint: Callable, **kwargs) -> Any:
+    """
+    Call a cache_response endpoint for its decoded JSON, through the cache,
+    e.g. to post-process a cached listing per request. kwargs must match
+    what FastAPI passes so the cache key lines up. The value is shared
+    between requests: copy before modifying it.
     """
-    Invalidate all cache keys matching a pattern
+    result = await endpoint(**kwargs)
+    if not isinstance(result, Response):
+        return result
+    etag = result.headers.get("etag")
+    if etag in _decoded:
+        _decoded.move_to_end(etag)
+        return _decoded[etag]
+    value = json.loads(result.body)
+    if etag:
+        _decoded[etag] = value
+        if len(_decoded) > DECODED_MAX_ENTRIES:
+            _decoded.popitem(last=False)
+    return value
+
+async def invalidate_tags(*tags: str):
+    """
+    Invalidate every cached response carrying any of the given tags
+    
+    O(1) per tag: the tag's version is bumped and entries built against the
+    previous version stop matching. Every worker's L1 copies are evicted
+    via pub/sub.
     
     Args:
-        pattern: Redis key pattern (e.g., "api_cache:movies:*")
+        tags: Cache tags (e.g., "movies", f"movie:{movie_id}")
     """
     try:
-        keys = redis_client.redis_client.keys(f"api_cache:{pattern}*")
-        if keys:
-            redis_client.redis_client.delete(*keys)
-            print(f"🗑️ Invalidated {len(keys)} cache keys matching: {pattern}")
-            return len(keys)
-        return 0
+        pipe = redis_client.redis_client.pipeline()
+        for tag in tags:
+            pipe.incr(_tag_version_key(tag))
+        await pipe.execute()
+        # Evict this worker's L1 copies now and tell the other workers
+        local_cache.evict_tags(list(tags))
+        await redis_client.redis_client.publish(INVALIDATION_CHANNEL, json.dumps(tags))
+        print(f"🗑️ Invalidated cache tags: {', '.join(tags)}")
     except Exception as e:
         print(f"⚠️ Cache invalidation error: {e}")
-        return 0
 
-def get_cache_stats() -> dict:
+async def listen_for_invalidations():
+    """
+    Evict L1 entries when any worker invalidates a tag.
+    Runs for the lifetime of the worker (started from the app lifespan).
+    """
+    while True:
+        pubsub = redis_client.redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything published while we were disconnected is unknown
+            local_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    local_cache.evict_tags(json.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Cache invalidation listener error: {e}. Reconnecting.")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+async def get_cache_stats() -> dict:
     """Get Redis cache statistics"""
     try:
-        info = redis_client.redis_client.info('stats')
+        info = await redis_client.redis_client.info('stats')
         return {
             "total_commands_processed": info.get('total_commands_processed', 0),
             "keyspace_hits": info.get('keyspace_hits', 0),
@@ -0,0 +1,60 @@
+"""
+Keeps the busiest cached endpoints warm.
+
+Runs in every worker (started from the app lifespan), but each target is
+refreshed by one worker per deployment: a worker must take the target's
+Redis lock, which is held until shortly before the entry's TTL runs out.
+Refreshes go through cache_response's own refresh path (same key, tags,
+lease and encoding as a request-driven fill).
+"""
+
+import asyncio
+import os
+from typing import Callable, Dict, List, Tuple
+
+import redis_client
+
+CACHE_WARMER_ENABLED = os.environ.get("CACHE_WARMER_ENABLED", "true").lower() == "true"
+WARM_MARGIN = int(os.environ.get("CACHE_WARM_MARGIN", "30"))  # seconds before TTL expiry
+WARM_TICK = int(os.environ.get("CACHE_WARM_TICK", "10"))  # how often each worker checks
+
+def _warm_lock_key(name: str) -> str:
+    return f"api_cache_warm:{name}"
+
+def warm_targets() -> List[Tuple[str, Callable, Dict]]:
+    """
+    (name, cached endpoint, kwargs) to keep warm. kwargs must match what
+    FastAPI passes, defaults included, so the cache keys line up.
+    """
+    from routers import ads, movies, offers, showtimes
+    return [
+        ("movies_with_showtimes", movies.list_movies_with_showtimes, {}),
+        ("showtimes", showtimes.list_showtimes, {"include_expired": False}),
+        ("offers", offers.get_active_offers, {}),
+        ("ads", ads.get_ads, {}),
+    ]
+
+async def warm_once(targets: List[Tuple[str, Callable, Dict]]) -> List[str]:
+    """Refresh every target whose lock this worker can take. Returns the names warmed."""
+    warmed = []
+    for name, endpoint, kwargs in targets:
+        interval = max(endpoint.cache_ttl - WARM_MARGIN, WARM_TICK)
+        try:
+            if not await redis_client.redis_client.set(_warm_lock_key(name), 1, nx=True, ex=interval):
+                continue
+            if await endpoint.refresh(**kwargs):
+                warmed.append(name)
+        except Exception as e:
+            print(f"⚠️ Cache warm failed for {name}: {e}")
+    return warmed
+
+async def run_cache_warmer():
+    """Warm at startup, then keep refreshing ahead of expiry until cancelled"""
+    if not CACHE_WARMER_ENABLED:
+        return
+    targets = warm_targets()
+    while True:
+        warmed = await warm_once(targets)
+        if warmed:
+            print(f"🔥 Cache warmed: {', '.join(warmed)}")
+        await asyncio.sleep(WARM_TICK)
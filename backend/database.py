@@ -1,7 +1,12 @@
-from supabase import create_client, Client
+from supabase import create_client, Client, AsyncClient
+from supabase.lib.client_options import AsyncClientOptions
+import httpx
 import os
+import time
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL") or os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
@@ -10,4 +15,40 @@ key: str = os.environ.get("SUPABASE_KEY") or os.environ.get("NEXT_PUBLIC_SUPABAS
 if not url or not key:
     raise ValueError("Supabase URL and Key must be set in environment variables (SUPABASE_URL/NEXT_PUBLIC_SUPABASE_URL and SUPABASE_KEY/NEXT_PUBLIC_SUPABASE_ANON_KEY)")
 
+# Synchronous client, for scripts (seeding, migrations, checks)
 supabase: Client = create_client(url, key)
+
+# Connection pool for the API's PostgREST/Auth traffic; connections are
+# kept alive between requests instead of re-doing TLS per query
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_KEEPALIVE_CONNECTIONS = int(os.environ.get("SUPABASE_KEEPALIVE_CONNECTIONS", "20"))
+
+class TimedTransport(httpx.AsyncHTTPTransport):
+    """Records each Supabase call's duration (to response headers), by path"""
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await super().handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.SUPABASE_CALL_SECONDS.labels(request.method, request.url.path, status).observe(
+                time.perf_counter() - started
+            )
+
+http_client = httpx.AsyncClient(
+    transport=TimedTransport(limits=httpx.Limits(
+        max_connections=SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=60,
+    )),
+    timeout=httpx.Timeout(10.0),
+)
+
+# Async client used by every router, so requests never block the event loop
+db: AsyncClient = AsyncClient(url, key, AsyncClientOptions(httpx_client=http_client))
+
+async def close_db():
+    """Release pooled HTTP connections (called on app shutdown)"""
+    await http_client.aclose()
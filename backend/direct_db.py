@@ -0,0 +1,159 @@
+"""
+Optional direct-SQL read path for the hottest endpoints.
+
+Enabled with READ_PATH=postgres and a DATABASE_URL, which must be
+Supabase's direct or session-mode (port 5432) connection string. Reads run
+as prepared statements on pooled psycopg2 connections, on the bounded
+executor so they don't block the event loop. The transaction-mode pooler
+(port 6543) hands each transaction to any backend, where statements
+prepared on another one don't exist, so it's refused and PostgREST is used.
+Every caller keeps the PostgREST query as its fallback.
+"""
+
+import os
+import threading
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+
+from executor import run_blocking
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+READ_PATH = os.environ.get("READ_PATH", "postgrest")  # "postgrest" or "postgres"
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", "10"))
+# An unreachable database must not hold executor threads that Stripe and
+# Supabase calls also need
+PG_CONNECT_TIMEOUT = int(os.environ.get("PG_CONNECT_TIMEOUT", "5"))  # seconds
+TRANSACTION_POOLER_PORT = 6543  # Supabase's transaction-mode pooler
+
+# Prepared once per connection. Each statement returns a single column;
+# jsonb rows are shaped like the equivalent PostgREST response.
+PREPARED_STATEMENTS = {
+    "showtimes_upcoming": """
+        SELECT to_jsonb(s) || jsonb_build_object(
+            'movie', to_jsonb(m),
+            'screen', jsonb_build_object('name', sc.name, 'theater', jsonb_build_object('name', t.name))
+        )
+        FROM showtimes s
+        JOIN movies m ON m.id = s.movie_id
+        JOIN screens sc ON sc.id = s.screen_id
+        JOIN theaters t ON t.id = sc.theater_id
+        WHERE s.start_time >= now()
+        ORDER BY s.start_time
+    """,
+    "showtimes_all": """
+        SELECT to_jsonb(s) || jsonb_build_object(
+            'movie', to_jsonb(m),
+            'screen', jsonb_build_object('name', sc.name, 'theater', jsonb_build_object('name', t.name))
+        )
+        FROM showtimes s
+        JOIN movies m ON m.id = s.movie_id
+        JOIN screens sc ON sc.id = s.screen_id
+        JOIN theaters t ON t.id = sc.theater_id
+        ORDER BY s.start_time
+    """,
+    "showtime_seat_layout (uuid)": """
+        SELECT jsonb_build_object('seat_layout', sc.seat_layout)
+        FROM showtimes s
+        LEFT JOIN screens sc ON sc.id = s.screen_id
+        WHERE s.id = $1
+    """,
+    "showtime_sold_seats (uuid)": """
+        SELECT seat FROM booking_seats WHERE showtime_id = $1
+    """,
+    "movie_detail (uuid)": """
+        SELECT to_jsonb(m) FROM movies m WHERE m.id = $1
+    """,
+    "user_bookings (uuid)": """
+        SELECT to_jsonb(b) FROM get_user_bookings($1) b
+    """,
+}
+
+class PreparedConnectionPool(ThreadedConnectionPool):
+    """Connection pool that prepares the read statements on every new connection"""
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for signature, sql in PREPARED_STATEMENTS.items():
+                cur.execute(f"PREPARE {signature} AS {sql}")
+        return conn
+
+_pool: Optional[PreparedConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def _is_transaction_pooler(url: str) -> bool:
+    """True for a transaction-mode pooler URL, where per-connection PREPARE breaks"""
+    try:
+        return urlparse(url).port == TRANSACTION_POOLER_PORT
+    except ValueError:
+        return False
+
+_ENABLED = READ_PATH == "postgres" and bool(DATABASE_URL)
+if _ENABLED and _is_transaction_pooler(DATABASE_URL):
+    print("⚠️ DATABASE_URL is the transaction-mode pooler (port 6543), which can't keep "
+          "prepared statements; use the direct or session-mode URL. Reading via PostgREST.")
+    _ENABLED = False
+
+def enabled() -> bool:
+    """True when configuration selects the direct-SQL read path"""
+    return _ENABLED
+
+def _get_pool() -> PreparedConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PreparedConnectionPool(PG_POOL_MIN, PG_POOL_MAX, DATABASE_URL, connect_timeout=PG_CONNECT_TIMEOUT)
+        return _pool
+
+def _execute(statement: str, *params) -> List:
+    """Run a prepared statement and return its single column, row by row"""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            if params:
+                placeholders = ", ".join(["%s"] * len(params))
+                cur.execute(f"EXECUTE {statement} ({placeholders})", params)
+            else:
+                cur.execute(f"EXECUTE {statement}")
+            return [row[0] for row in cur.fetchall()]
+    except Exception:
+        # Don't return a connection in an unknown state to the pool
+        pool.putconn(conn, close=True)
+        conn = None
+        raise
+    finally:
+        if conn is not None:
+            pool.putconn(conn)
+
+async def fetch_showtimes(include_expired: bool = False) -> List[dict]:
+    statement = "showtimes_all" if include_expired else "showtimes_upcoming"
+    return await run_blocking(_execute, statement)
+
+async def fetch_seat_layout(showtime_id: str) -> Tuple[bool, Optional[dict]]:
+    """(whether the showtime exists, its screen's seat_layout)"""
+    rows = await run_blocking(_execute, "showtime_seat_layout", showtime_id)
+    return (True, rows[0]["seat_layout"]) if rows else (False, None)
+
+async def fetch_sold_seats(showtime_id: str) -> List[str]:
+    return await run_blocking(_execute, "showtime_sold_seats", showtime_id)
+
+async def fetch_movie(movie_id: str) -> Optional[dict]:
+    rows = await run_blocking(_execute, "movie_detail", movie_id)
+    return rows[0] if rows else None
+
+async def fetch_user_bookings(user_id: str) -> List[dict]:
+    return await run_blocking(_execute, "user_bookings", user_id)
+
+def close_pool():
+    """Close pooled connections (called on app shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
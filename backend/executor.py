@@ -0,0 +1,19 @@
+# Bounded thread pool for calls that have no async client (e.g. Stripe SDK)
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+BLOCKING_WORKERS = int(os.environ.get("BLOCKING_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a synchronous call on the bounded executor without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def shutdown_executor():
+    """Stop accepting work (called on app shutdown)"""
+    _executor.shutdown(wait=False)
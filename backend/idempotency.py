@@ -0,0 +1,122 @@
+"""
+Idempotency for retried payment requests.
+
+A request is identified by a key (e.g. the payment intent id, or a hash
+of session, showtime and seats). The first request claims the key in
+Redis and stores its response when it finishes; a repeat gets that
+stored response back from a single scripted read, without touching
+Stripe or Supabase. A repeat that arrives while the first is still
+running waits for its result. Keys that never complete (the request
+failed or its worker died) are released so the client can retry.
+
+    idempotency:{scope}:{key}       IN_PROGRESS marker (lease) or response JSON
+    idempotency_ref:{scope}:{ref}   key whose response created `ref` (see forget)
+
+Redis errors fail open: the request runs without deduplication and
+relies on the downstream guards (Stripe idempotency keys, the
+booking_seats unique index).
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Optional
+
+from fastapi import HTTPException
+
+import redis_client
+
+IDEMPOTENCY_TTL = 86400  # 24 hours, as long as Stripe keeps its idempotency keys
+IDEMPOTENCY_LEASE_MS = 30_000  # default for how long a claim survives if its request never finishes
+IDEMPOTENCY_WAIT = 10.0  # seconds a repeat waits for the first request's result
+IDEMPOTENCY_POLL = 0.1
+IN_PROGRESS = "__in_progress__"
+
+# Returns the stored value, or claims the key (with a lease) and returns false.
+# KEYS[1]: idempotency key; ARGV[1]: in-progress marker, ARGV[2]: lease (ms)
+CLAIM_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    return value
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return false
+"""
+
+# Deletes the key only while it still holds the in-progress marker.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_claim_script = redis_client.redis_client.register_script(CLAIM_SCRIPT)
+_release_script = redis_client.redis_client.register_script(RELEASE_SCRIPT)
+
+def _key(scope: str, key: str) -> str:
+    return f"idempotency:{scope}:{key}"
+
+def _ref_key(scope: str, ref: str) -> str:
+    return f"idempotency_ref:{scope}:{ref}"
+
+def fingerprint(*parts: Any) -> str:
+    """Stable key for a request made of several fields"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+async def begin(scope: str, key: str, lease_ms: int = IDEMPOTENCY_LEASE_MS) -> Optional[Any]:
+    """
+    Claim `key`, or return the stored response of an earlier identical
+    request (waiting for it if it's still running; 409 if it takes too
+    long). None means the caller now owns the key and must call complete()
+    or release(). lease_ms must outlast the request's slowest path, or a
+    repeat can start a second run while the first is still going.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        try:
+            value = await _claim_script(keys=[_key(scope, key)], args=[IN_PROGRESS, lease_ms])
+        except Exception as e:
+            print(f"⚠️ Idempotency check failed: {e}. Proceeding without it.")
+            return None
+        if value is None:
+            return None
+        if value != IN_PROGRESS:
+            return json.loads(value)
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="An identical request is still being processed; retry shortly")
+        await asyncio.sleep(IDEMPOTENCY_POLL)
+
+async def complete(scope: str, key: str, response: Any, ref: Optional[str] = None):
+    """
+    Store the response that repeats of this request should get. `ref` (e.g.
+    the id of the object the request created) lets forget() drop it later.
+    """
+    try:
+        pipe = redis_client.redis_client.pipeline()
+        pipe.set(_key(scope, key), json.dumps(response, default=str), ex=IDEMPOTENCY_TTL)
+        if ref:
+            pipe.set(_ref_key(scope, ref), key, ex=IDEMPOTENCY_TTL)
+        await pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Failed to store idempotent response: {e}")
+
+async def forget(scope: str, ref: str):
+    """
+    Drop the stored response recorded under `ref` once it's no longer usable
+    (e.g. its PaymentIntent was canceled), so an identical request runs again.
+    """
+    try:
+        key = await redis_client.redis_client.get(_ref_key(scope, ref))
+        if key:
+            await redis_client.redis_client.delete(_key(scope, key), _ref_key(scope, ref))
+    except Exception as e:
+        print(f"⚠️ Failed to drop idempotent response: {e}")
+
+async def release(scope: str, key: str):
+    """Give up a claim after a failure so the request can be retried"""
+    try:
+        await _release_script(keys=[_key(scope, key)], args=[IN_PROGRESS])
+    except Exception as e:
+        print(f"⚠️ Failed to release idempotency key: {e}")
@@ -0,0 +1,99 @@
+"""
+Waiting room load test.
+
+Simulates a ticket drop: N clients arrive within the same second and each
+wants the seat map. Without a waiting room they all hit
+/seats/available/{showtime_id} at once; with one, they join the queue,
+poll /queue/{showtime_id}/status (Redis only), and reach the seat
+endpoint at the admission rate. Prints protected-endpoint requests per
+second for both runs, so the flattened backend load is visible.
+
+Run against a local API (uvicorn main:app) with Redis and Supabase, with
+the API's ADMIN_API_KEY (to switch queue mode) and WAITING_ROOM_SECRET set:
+    ADMIN_API_KEY=... python load_test_waiting_room.py <showtime_id> [clients] [rate_per_second] [base_url]
+"""
+
+import asyncio
+import collections
+import os
+import sys
+import time
+import uuid
+
+import httpx
+
+POLL_INTERVAL = 1.0
+
+
+async def fetch_seats(client, base_url, showtime_id, token, timeline, started):
+    headers = {"X-Admission-Token": token} if token else {}
+    response = await client.get(f"{base_url}/seats/available/{showtime_id}", headers=headers)
+    timeline[int(time.perf_counter() - started)] += 1
+    return response.status_code
+
+
+async def direct_client(client, base_url, showtime_id, timeline, started):
+    return await fetch_seats(client, base_url, showtime_id, None, timeline, started)
+
+
+async def queued_client(client, base_url, showtime_id, timeline, started):
+    session = f"load-{uuid.uuid4().hex}"
+    response = await client.post(f"{base_url}/queue/{showtime_id}/join", json={"user_session": session})
+    status = response.json()
+    while not status.get("admitted"):
+        await asyncio.sleep(POLL_INTERVAL)
+        response = await client.get(f"{base_url}/queue/{showtime_id}/status", params={"user_session": session})
+        status = response.json()
+    return await fetch_seats(client, base_url, showtime_id, status.get("admission_token"), timeline, started)
+
+
+async def run(label, worker, clients, base_url, showtime_id):
+    timeline = collections.Counter()
+    limits = httpx.Limits(max_connections=200)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        statuses = await asyncio.gather(
+            *(worker(client, base_url, showtime_id, timeline, started) for _ in range(clients)),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"\n{label}: {ok}/{clients} seat-map reads succeeded in {elapsed:.1f}s")
+    print("second  seat-map requests")
+    for second in range(max(timeline) + 1 if timeline else 0):
+        count = timeline[second]
+        print(f"{second:>6}  {count:>5} {'#' * min(count, 80)}")
+    if timeline:
+        print(f"peak: {max(timeline.values())} req/s")
+
+
+async def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    showtime_id = sys.argv[1]
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 50
+    base_url = sys.argv[4] if len(sys.argv) > 4 else "http://localhost:8000"
+
+    admin_headers = {"X-Admin-Key": os.environ.get("ADMIN_API_KEY", "")}
+
+    async with httpx.AsyncClient(timeout=10, headers=admin_headers) as admin:
+        await admin.delete(f"{base_url}/queue/{showtime_id}")
+    await run("🚪 No waiting room", direct_client, clients, base_url, showtime_id)
+
+    async with httpx.AsyncClient(timeout=10, headers=admin_headers) as admin:
+        response = await admin.post(f"{base_url}/queue/{showtime_id}/enable", json={"rate_per_second": rate})
+        if response.status_code != 200:
+            print(f"❌ Could not enable the waiting room: {response.status_code} {response.text}")
+            return
+    try:
+        await run(f"🎟️ Waiting room at {rate:g}/s", queued_client, clients, base_url, showtime_id)
+    finally:
+        async with httpx.AsyncClient(timeout=10, headers=admin_headers) as admin:
+            await admin.delete(f"{base_url}/queue/{showtime_id}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
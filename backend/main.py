@@ -1,25 +1,57 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 import os
-from rate_limiter import limiter
-from slowapi.errors import RateLimitExceeded
-from slowapi import _rate_limit_exceeded_handler
+import time
+import metrics
 from fastapi.responses import JSONResponse
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from rate_limiter import limiter, rate_limit_strict
+from rate_limiter import limit_per_client
+
+from contextlib import asynccontextmanager
 
 load_dotenv()
 
-app = FastAPI(title="Movie Booking API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep this worker's in-process cache in step with invalidations from other workers
+    import asyncio
+    from cache_middleware import listen_for_invalidations
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    # Pre-populate hot cache entries now and ahead of each expiry (one worker per deployment)
+    from cache_warmer import run_cache_warmer
+    cache_warmer = asyncio.create_task(run_cache_warmer())
+    # Push seat deltas to this worker's stream clients; sweep expired locks so they're pushed too
+    from seat_events import listen_for_seat_events, sweep_expired_locks
+    seat_event_listener = asyncio.create_task(listen_for_seat_events())
+    seat_lock_sweeper = asyncio.create_task(sweep_expired_locks())
+    # Correct seat counts that drifted from Supabase (one worker per interval)
+    from seat_reconciler import run_seat_reconciler
+    seat_reconciler = asyncio.create_task(run_seat_reconciler())
+    # Commit bookings and send emails queued by the Stripe webhook
+    from booking_pipeline import run_booking_workers
+    booking_workers = asyncio.create_task(run_booking_workers())
+    yield
+    invalidation_listener.cancel()
+    cache_warmer.cancel()
+    seat_event_listener.cancel()
+    seat_lock_sweeper.cancel()
+    seat_reconciler.cancel()
+    booking_workers.cancel()
+    # Release pooled Supabase/Redis/Postgres connections and the blocking executor
+    from database import close_db
+    from redis_client import close_redis
+    from executor import shutdown_executor
+    from direct_db import close_pool
+    await close_db()
+    await close_redis()
+    close_pool()
+    shutdown_executor()
 
-# Add rate limiter to app
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app = FastAPI(title="Movie Booking API", lifespan=lifespan)
 
-# Add Gzip compression middleware (must be before CORS)
+# Add Gzip compression middleware (must be before CORS). Cached responses are
+# already compressed and carry Content-Encoding, which GZipMiddleware passes through
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 # Get frontend URL from environment
@@ -45,13 +77,11 @@ app.add_middleware(
     max_age=3600,
 ) # Cache preflight requests for 1 hour
 
-@app.get("/")
-@limiter.limit("100/minute")
+@app.get("/", dependencies=[Depends(limit_per_client("root", "100/minute"))])
 def read_root(request: Request):
     return {"message": "Welcome to Movie Booking System API", "status": "running"}
 
-@app.get("/health")
-@limiter.limit("60/minute")
+@app.get("/health", dependencies=[Depends(limit_per_client("health", "60/minute"))])
 def health_check(request: Request):
     """Health check endpoint for monitoring"""
     return {
@@ -60,14 +90,34 @@ def health_check(request: Request):
         "version": "1.0.0"
     }
 
-@app.get("/cache-stats")
-@limiter.limit("30/minute")
-def get_cache_statistics(request: Request):
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Per-route latency histogram (route template, not raw path)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.labels(
+            request.method, route.path if route else "unmatched", status
+        ).observe(time.perf_counter() - started)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text exposition"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache-stats", dependencies=[Depends(limit_per_client("cache_stats", "30/minute"))])
+async def get_cache_statistics(request: Request):
     """Get Redis cache statistics"""
     from cache_middleware import get_cache_stats
-    return get_cache_stats()
+    return await get_cache_stats()
 
-from routers import movies, showtimes, bookings, seats, upcoming_movies, screens, ads, offers, users, tickets
+from routers import movies, showtimes, bookings, seats, upcoming_movies, screens, ads, offers, users, tickets, waiting_room
 
 app.include_router(movies.router)
 app.include_router(showtimes.router)
@@ -79,4 +129,5 @@ app.include_router(screens.router)
 app.include_router(offers.router)
 app.include_router(users.router)
 app.include_router(tickets.router)
+app.include_router(waiting_room.router)
 
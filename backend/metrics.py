@@ -0,0 +1,75 @@
+"""
+Prometheus metrics, served in text format on /metrics.
+
+With several uvicorn/gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to a
+writable directory so /metrics aggregates every worker's samples.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Per cache prefix (e.g. "showtimes", "movie_detail")
+# result: l1_hit, hit, stale, early_refresh, miss, bypass (Redis unavailable)
+CACHE_REQUESTS = Counter(
+    "api_cache_requests_total",
+    "Cached endpoint lookups by outcome",
+    ["prefix", "result"],
+)
+CACHE_NOT_MODIFIED = Counter(
+    "api_cache_not_modified_total",
+    "Cached endpoint requests answered with 304",
+    ["prefix"],
+)
+CACHE_FILL_SECONDS = Histogram(
+    "api_cache_fill_seconds",
+    "Time to recompute a cached endpoint on a miss or refresh",
+    ["prefix"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CACHE_PAYLOAD_BYTES = Counter(
+    "api_cache_payload_bytes_total",
+    "Bytes served from the response cache, by content-coding",
+    ["prefix", "encoding"],
+)
+CACHE_FILL_BYTES = Histogram(
+    "api_cache_fill_bytes",
+    "Encoded size of cache entries when filled",
+    ["prefix"],
+    buckets=(1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000),
+)
+
+# Per route template (e.g. "/movies/{movie_id}"), so ids don't explode cardinality
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route",
+    ["method", "route", "status"],
+)
+
+REDIS_CALL_SECONDS = Histogram(
+    "redis_call_duration_seconds",
+    "Redis command or pipeline round-trip time",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+SUPABASE_CALL_SECONDS = Histogram(
+    "supabase_call_duration_seconds",
+    "Supabase (PostgREST/Auth) HTTP call time, by path",
+    ["method", "path", "status"],
+)
+
+def render() -> tuple:
+    """Exposition body and content type for /metrics"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
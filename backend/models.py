@@ -37,6 +37,7 @@ class BookingCreate(BaseModel):
     total_amount: int
     coupon_code: Optional[str] = None
     discount_amount: Optional[int] = 0
+    user_session: Optional[str] = None  # seat lock session, released if the payment fails
 
 class BookingConfirmation(BookingCreate):
     """Model for confirming a booking after payment"""
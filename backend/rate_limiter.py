@@ -1,20 +1,88 @@
 # Rate Limiting Middleware for FastAPI
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import os
+import time
+import uuid
 
-# Initialize limiter
-limiter = Limiter(key_func=get_remote_address, default_limits=["100/minute"])
+from fastapi import HTTPException, Request
+from limits import parse
 
-# Common rate limit decorators
-def rate_limit_strict(limit: str = "10/minute"):
-    """Strict rate limit for sensitive endpoints"""
-    return limiter.limit(limit)
+import redis_client
 
-def rate_limit_moderate(limit: str = "30/minute"):
-    """Moderate rate limit for regular endpoints"""
-    return limiter.limit(limit)
+# Number of proxies in front of the app (Render's load balancer = 1). The
+# client address is the entry that many hops from the right of
+# X-Forwarded-For; anything further left is client-supplied and untrusted.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
 
-def rate_limit_relaxed(limit: str = "100/minute"):
-    """Relaxed rate limit for public endpoints"""
-    return limiter.limit(limit)
+# Per-identity limits for abuse-prone endpoints (limits notation)
+SEAT_LOCK_LIMIT = os.environ.get("SEAT_LOCK_LIMIT", "20/minute")  # per client and per seat session
+COUPON_VALIDATE_LIMIT = os.environ.get("COUPON_VALIDATE_LIMIT", "10/minute")  # per client
+OCCUPANCY_LIMIT = os.environ.get("OCCUPANCY_LIMIT", "60/minute")  # per client
+
+def client_ip(request: Request) -> str:
+    """Client address as seen by the trusted proxy"""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+def client_identity(request: Request) -> str:
+    """
+    Rate limit key: the authenticated user when their token has already been
+    verified (so limits follow the account across IPs), otherwise the client IP.
+    """
+    from auth_middleware import cached_user
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.startswith("Bearer "):
+        user = cached_user(auth_header[len("Bearer "):])
+        if user:
+            return f"user:{user.id}"
+    return f"ip:{client_ip(request)}"
+
+# Sliding-window log: one sorted-set member per request in the window.
+# KEYS[1]: window key; ARGV[1]: now (ms), ARGV[2]: window (ms),
+# ARGV[3]: limit, ARGV[4]: unique member
+# Returns {allowed (1/0), seconds until a slot frees up}
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, math.ceil((tonumber(oldest[2]) + window - now) / 1000)}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('PEXPIRE', KEYS[1], window)
+return {1, 0}
+"""
+
+_sliding_window_script = redis_client.redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+
+async def enforce_limit(scope: str, identity: str, limit: str):
+    """
+    Count a request against `identity`'s limit for `scope` (e.g. "seat_lock")
+    and raise 429 with Retry-After once it's exceeded. Fails open if Redis
+    is unavailable.
+    """
+    item = parse(limit)
+    try:
+        allowed, retry_after = await _sliding_window_script(
+            keys=[f"rate_limit:{scope}:{identity}"],
+            args=[int(time.time() * 1000), item.get_expiry() * 1000, item.amount, uuid.uuid4().hex],
+        )
+    except Exception as e:
+        print(f"⚠️ Rate limit check failed: {e}. Allowing request.")
+        return
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded: {limit}",
+            headers={"Retry-After": str(max(int(retry_after), 1))},
+        )
+
+def limit_per_client(scope: str, limit: str):
+    """Dependency enforcing a per-client (user or IP) limit on one endpoint"""
+    async def dependency(request: Request):
+        await enforce_limit(scope, client_identity(request), limit)
+    return dependency
@@ -1,96 +1,309 @@
-import redis
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
 import os
 import json
+import time
 from dotenv import load_dotenv
 from typing import List, Optional
 
+import metrics
+
 load_dotenv()
 
-# Initialize Redis client
+class InstrumentedPipeline(Pipeline):
+    """Pipeline that records each round trip's duration"""
+    async def execute(self, raise_on_error: bool = True):
+        with metrics.REDIS_CALL_SECONDS.labels("PIPELINE").time():
+            return await super().execute(raise_on_error)
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records each command's duration, by command name"""
+    async def execute_command(self, *args, **options):
+        with metrics.REDIS_CALL_SECONDS.labels(str(args[0]).upper()).time():
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# Initialize Redis clients (asyncio, pooled)
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
+redis_client = InstrumentedRedis.from_url(REDIS_URL, decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS)
+# Raw-bytes client for bitmap values, which are not valid UTF-8
+redis_bytes_client = InstrumentedRedis.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+
+async def close_redis():
+    """Release pooled connections (called on app shutdown)"""
+    await redis_client.aclose()
+    await redis_bytes_client.aclose()
 
 SEAT_LOCK_TTL = 300  # 5 minutes in seconds
 
-def lock_seats(showtime_id: str, seats: List[str], user_session: str, customer_email: str) -> dict:
+def lock_index_key(showtime_id: str) -> str:
+    """Sorted set of seat -> lock expiry (epoch seconds) for one showtime"""
+    return f"seat_locks:{showtime_id}"
+
+def held_bitmap_key(showtime_id: str) -> str:
+    """Bitmap of currently locked seats, by layout offset"""
+    return f"seat_held:{showtime_id}"
+
+def sold_bitmap_key(showtime_id: str) -> str:
+    """Bitmap of paid seats, by layout offset"""
+    return f"seat_sold:{showtime_id}"
+
+def seat_offsets_key(showtime_id: str) -> str:
+    """Hash of seat id -> bit offset, written when the layout is compiled"""
+    return f"seat_offsets:{showtime_id}"
+
+def seat_version_key(showtime_id: str) -> str:
+    """Counter bumped on every change to a showtime's seat state (used for ETags)"""
+    return f"seat_version:{showtime_id}"
+
+SEAT_VERSION_TTL = 86400  # 24 hours
+# The lock index and held bitmap outlive their newest lock by this much,
+# far longer than the expiry sweep interval, so every lapsed lock is
+# pruned by a script (publishing "expired" and bumping the seat version)
+# instead of vanishing with its key while the version stays put.
+SEAT_INDEX_GRACE = SEAT_VERSION_TTL
+
+def seat_events_channel(showtime_id: str) -> str:
+    """Pub/sub channel carrying a showtime's seat deltas (published by the seat scripts)"""
+    return f"seat_events:{showtime_id}"
+
+# Set of showtimes with seat locks outstanding, so the expiry sweeper
+# (seat_events.sweep_expired_locks) knows where to look.
+LOCKED_SHOWTIMES_KEY = "seat_locked_showtimes"
+
+def seat_keys(showtime_id: str, seats: List[str]) -> List[str]:
+    """Fixed script keys (index, held bitmap, offsets, sold bitmap, version) followed by one lock key per seat"""
+    return [
+        lock_index_key(showtime_id),
+        held_bitmap_key(showtime_id),
+        seat_offsets_key(showtime_id),
+        sold_bitmap_key(showtime_id),
+        seat_version_key(showtime_id),
+    ] + [f"seat_lock:{showtime_id}:{seat}" for seat in seats]
+
+# Seat scripts take KEYS as built by seat_keys; lock keys start at KEYS[6].
+# Seat ids are read back from the lock key ("seat_lock:<showtime>:<seat>").
+
+# Shared by the seat scripts: bumps the showtime's seat version. A new
+# counter is seeded from the clock so versions never repeat after expiry.
+# publish_seat_event bumps it and announces the change on the showtime's
+# seat_events channel as {type, seats, version}; seats is omitted when
+# there's no per-seat delta (e.g. "resync").
+BUMP_SEAT_VERSION = """
+local function bump_seat_version()
+    if redis.call('INCR', KEYS[5]) == 1 then
+        local t = redis.call('TIME')
+        redis.call('SET', KEYS[5], t[1] .. string.format('%06d', tonumber(t[2])))
+    end
+    redis.call('EXPIRE', KEYS[5], """ + str(SEAT_VERSION_TTL) + """)
+end
+local function publish_seat_event(kind, seats)
+    bump_seat_version()
+    local event = {type = kind, version = redis.call('GET', KEYS[5])}
+    if seats and #seats > 0 then
+        event['seats'] = seats
+    end
+    redis.call('PUBLISH', 'seat_events:' .. string.match(KEYS[5], '[^:]+$'), cjson.encode(event))
+end
+"""
+
+# Shared by the seat scripts: drops index entries whose lock has expired
+# and clears their bits in the held bitmap. Held bits left behind by an
+# index that vanished unpruned (evicted or deleted) are cleared too, with
+# a "resync", so every change to held state moves the seat version (and
+# so the ETags built from it). Expects a local `now`.
+PRUNE_EXPIRED_LOCKS = BUMP_SEAT_VERSION + """
+if redis.call('EXISTS', KEYS[1]) == 0 and redis.call('BITCOUNT', KEYS[2]) > 0 then
+    redis.call('DEL', KEYS[2])
+    publish_seat_event('resync')
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)
+for _, seat in ipairs(expired) do
+    local offset = redis.call('HGET', KEYS[3], seat)
+    if offset then
+        redis.call('SETBIT', KEYS[2], offset, 0)
+    end
+end
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    publish_seat_event('expired', expired)
+end
+"""
+
+# Takes every requested seat lock or none of them in a single round trip,
+# keeping the showtime's lock index and held bitmap in step. Sold seats
+# are refused as well as locked ones, and seats with no offset in the
+# layout (which the bitmaps couldn't track) are refused outright.
+# ARGV[1]: lock payload, ARGV[2]: TTL in seconds, ARGV[3]: now
+# Returns the 1-based indexes of seats that are unavailable (empty on
+# success), or the negated indexes of seats outside the layout.
+LOCK_SEATS_SCRIPT = """
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+""" + PRUNE_EXPIRED_LOCKS + """
+local held = {}
+local invalid = {}
+local offsets = {}
+local seats = {}
+for i = 6, #KEYS do
+    local seat = string.match(KEYS[i], '[^:]+$')
+    local offset = redis.call('HGET', KEYS[3], seat)
+    offsets[i] = offset
+    seats[i - 5] = seat
+    if not offset then
+        table.insert(invalid, 5 - i)
+    elseif redis.call('EXISTS', KEYS[i]) == 1
+        or redis.call('GETBIT', KEYS[4], offset) == 1 then
+        table.insert(held, i - 5)
+    end
+end
+if #invalid > 0 then
+    return invalid
+end
+if #held > 0 then
+    return held
+end
+for i = 6, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[1], 'EX', ttl)
+    redis.call('ZADD', KEYS[1], now + ttl, seats[i - 5])
+    redis.call('SETBIT', KEYS[2], offsets[i], 1)
+end
+redis.call('EXPIRE', KEYS[1], ttl + """ + str(SEAT_INDEX_GRACE) + """)
+redis.call('EXPIRE', KEYS[2], ttl + """ + str(SEAT_INDEX_GRACE) + """)
+publish_seat_event('locked', seats)
+return held
+"""
+
+# Releases seat locks owned by a session and drops them from the index.
+# ARGV[1]: user session
+# Returns one flag per seat: 1 if released (or already free), 0 if held by someone else.
+UNLOCK_SEATS_SCRIPT = BUMP_SEAT_VERSION + """
+local released = {}
+local unlocked = {}
+for i = 6, #KEYS do
+    local data = redis.call('GET', KEYS[i])
+    local ok = 1
+    if data then
+        local decoded, lock = pcall(cjson.decode, data)
+        if decoded and lock['user_session'] == ARGV[1] then
+            redis.call('DEL', KEYS[i])
+            table.insert(unlocked, string.match(KEYS[i], '[^:]+$'))
+        else
+            ok = 0
+        end
+    end
+    if ok == 1 then
+        local seat = string.match(KEYS[i], '[^:]+$')
+        redis.call('ZREM', KEYS[1], seat)
+        local offset = redis.call('HGET', KEYS[3], seat)
+        if offset then
+            redis.call('SETBIT', KEYS[2], offset, 0)
+        end
+    end
+    table.insert(released, ok)
+end
+if #unlocked > 0 then
+    publish_seat_event('unlocked', unlocked)
+end
+return released
+"""
+
+# Extends seat locks owned by a session, all or nothing.
+# ARGV[1]: user session, ARGV[2]: TTL in seconds, ARGV[3]: now
+# Returns 1 if every lock was refreshed, 0 otherwise.
+REFRESH_SEATS_SCRIPT = """
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+for i = 6, #KEYS do
+    local data = redis.call('GET', KEYS[i])
+    if not data then
+        return 0
+    end
+    local decoded, lock = pcall(cjson.decode, data)
+    if not decoded or lock['user_session'] ~= ARGV[1] then
+        return 0
+    end
+end
+for i = 6, #KEYS do
+    redis.call('EXPIRE', KEYS[i], ttl)
+    redis.call('ZADD', KEYS[1], now + ttl, string.match(KEYS[i], '[^:]+$'))
+end
+redis.call('EXPIRE', KEYS[1], ttl + """ + str(SEAT_INDEX_GRACE) + """)
+redis.call('EXPIRE', KEYS[2], ttl + """ + str(SEAT_INDEX_GRACE) + """)
+return 1
+"""
+
+_lock_seats_script = redis_client.register_script(LOCK_SEATS_SCRIPT)
+_unlock_seats_script = redis_client.register_script(UNLOCK_SEATS_SCRIPT)
+_refresh_seats_script = redis_client.register_script(REFRESH_SEATS_SCRIPT)
+
+async def lock_seats(showtime_id: str, seats: List[str], user_session: str, customer_email: str) -> dict:
     """
     Attempt to lock seats for a showtime.
-    Returns: {"success": bool, "locked_seats": [], "failed_seats": []}
+    All seats are taken atomically by a server-side script, so a request
+    either holds the whole selection or nothing. The showtime's seat
+    offsets must be loaded (seat_state.ensure_layout); seats outside the
+    layout are refused and listed in "invalid_seats".
+    Returns: {"success": bool, "locked_seats": [], "failed_seats": [], "invalid_seats": []}
     """
-    locked_seats = []
-    failed_seats = []
+    keys = seat_keys(showtime_id, seats)
+    lock_data = json.dumps({
+        "user_session": user_session,
+        "customer_email": customer_email,
+        "locked_at": None  # Will be set by Redis
+    })
     
-    for seat in seats:
-        key = f"seat_lock:{showtime_id}:{seat}"
-        
-        # Try to set the key only if it doesn't exist (NX flag)
-        lock_data = json.dumps({
-            "user_session": user_session,
-            "customer_email": customer_email,
-            "locked_at": None  # Will be set by Redis
-        })
-        
-        # SET with NX (only if not exists) and EX (expiry time)
-        success = redis_client.set(key, lock_data, nx=True, ex=SEAT_LOCK_TTL)
-        
-        if success:
-            locked_seats.append(seat)
-        else:
-            failed_seats.append(seat)
+    held = await _lock_seats_script(keys=keys, args=[lock_data, SEAT_LOCK_TTL, int(time.time())])
+    if not held:
+        await redis_client.sadd(LOCKED_SHOWTIMES_KEY, showtime_id)
     
-    # If any seat failed to lock, release all locked seats
-    if failed_seats:
-        for seat in locked_seats:
-            unlock_seat(showtime_id, seat, user_session)
+    invalid_seats = [seats[-int(i) - 1] for i in held if int(i) < 0]
+    if invalid_seats:
         return {
             "success": False,
             "locked_seats": [],
             "failed_seats": seats,
-            "message": f"Seats {', '.join(failed_seats)} are already locked by another user"
+            "invalid_seats": invalid_seats,
+            "message": f"Seats {', '.join(invalid_seats)} do not exist on this screen"
+        }
+    
+    if held:
+        failed_seats = [seats[int(i) - 1] for i in held]
+        return {
+            "success": False,
+            "locked_seats": [],
+            "failed_seats": seats,
+            "invalid_seats": [],
+            "message": f"Seats {', '.join(failed_seats)} are already locked by another user or booked"
         }
     
     return {
         "success": True,
-        "locked_seats": locked_seats,
+        "locked_seats": list(seats),
         "failed_seats": [],
+        "invalid_seats": [],
         "message": "All seats locked successfully"
     }
 
-def unlock_seat(showtime_id: str, seat: str, user_session: str) -> bool:
+async def unlock_seat(showtime_id: str, seat: str, user_session: str) -> bool:
     """
     Unlock a specific seat if it's locked by the given user session.
     Returns True if unlocked, False otherwise.
     """
-    key = f"seat_lock:{showtime_id}:{seat}"
-    
-    # Get current lock data
-    lock_data = redis_client.get(key)
-    if not lock_data:
-        return True  # Already unlocked
-    
-    # Verify it's locked by this user
-    try:
-        data = json.loads(lock_data)
-        if data.get("user_session") == user_session:
-            redis_client.delete(key)
-            return True
-    except json.JSONDecodeError:
-        pass
-    
-    return False
+    return (await unlock_seats(showtime_id, [seat], user_session))["success"]
 
-def unlock_seats(showtime_id: str, seats: List[str], user_session: str) -> dict:
+async def unlock_seats(showtime_id: str, seats: List[str], user_session: str) -> dict:
     """
     Unlock multiple seats for a user session.
     """
-    unlocked = []
-    failed = []
+    keys = seat_keys(showtime_id, seats)
+    released = await _unlock_seats_script(keys=keys, args=[user_session])
     
-    for seat in seats:
-        if unlock_seat(showtime_id, seat, user_session):
-            unlocked.append(seat)
-        else:
-            failed.append(seat)
+    unlocked = [seat for seat, ok in zip(seats, released) if int(ok)]
+    failed = [seat for seat, ok in zip(seats, released) if not int(ok)]
     
     return {
         "success": len(failed) == 0,
@@ -98,36 +311,28 @@ def unlock_seats(showtime_id: str, seats: List[str], user_session: str) -> dict:
         "failed_seats": failed
     }
 
-def check_seat_availability(showtime_id: str, seat: str) -> bool:
+async def check_seat_availability(showtime_id: str, seat: str) -> bool:
     """
     Check if a seat is available (not locked in Redis).
     """
     key = f"seat_lock:{showtime_id}:{seat}"
-    return not redis_client.exists(key)
+    return not await redis_client.exists(key)
 
-def get_locked_seats(showtime_id: str) -> List[str]:
+async def get_locked_seats(showtime_id: str) -> List[str]:
     """
     Get all currently locked seats for a showtime.
+    Reads the showtime's lock index, so the cost is O(locked seats in
+    that showtime) rather than a scan of the whole keyspace.
     """
-    pattern = f"seat_lock:{showtime_id}:*"
-    keys = redis_client.keys(pattern)
-    
-    # Extract seat IDs from keys
-    locked_seats = []
-    for key in keys:
-        # key format: seat_lock:{showtime_id}:{seat_id}
-        seat_id = key.split(":")[-1]
-        locked_seats.append(seat_id)
-    
-    return locked_seats
+    return await redis_client.zrangebyscore(lock_index_key(showtime_id), f"({int(time.time())}", "+inf")
 
-def verify_seats_locked(showtime_id: str, seats: List[str], user_session: str) -> bool:
+async def verify_seats_locked(showtime_id: str, seats: List[str], user_session: str) -> bool:
     """
     Verify that all seats are locked by the given user session.
     """
     for seat in seats:
         key = f"seat_lock:{showtime_id}:{seat}"
-        lock_data = redis_client.get(key)
+        lock_data = await redis_client.get(key)
         
         if not lock_data:
             return False
@@ -141,24 +346,9 @@ def verify_seats_locked(showtime_id: str, seats: List[str], user_session: str) -
     
     return True
 
-def refresh_seat_locks(showtime_id: str, seats: List[str], user_session: str) -> bool:
+async def refresh_seat_locks(showtime_id: str, seats: List[str], user_session: str) -> bool:
     """
     Refresh the TTL on seat locks (extend the 5-minute timer).
     """
-    for seat in seats:
-        key = f"seat_lock:{showtime_id}:{seat}"
-        lock_data = redis_client.get(key)
-        
-        if not lock_data:
-            return False
-        
-        try:
-            data = json.loads(lock_data)
-            if data.get("user_session") == user_session:
-                redis_client.expire(key, SEAT_LOCK_TTL)
-            else:
-                return False
-        except json.JSONDecodeError:
-            return False
-    
-    return True
+    keys = seat_keys(showtime_id, seats)
+    return bool(await _refresh_seats_script(keys=keys, args=[user_session, SEAT_LOCK_TTL, int(time.time())]))
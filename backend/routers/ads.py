@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException
-from database import supabase
+from database import db
 from pydantic import BaseModel
 from typing import Optional
-from cache_middleware import cache_response, invalidate_cache_pattern, CACHE_TTL
+from cache_middleware import cache_response, invalidate_tags, CACHE_TTL, CACHE_STALE_TTL
 
 router = APIRouter(
     prefix="/ads",
@@ -27,11 +27,12 @@ class AdUpdate(BaseModel):
     display_order: Optional[int] = None
 
 @router.get("/")
-@cache_response(ttl=CACHE_TTL["ads"], key_prefix="ads")
+@cache_response(ttl=CACHE_TTL["ads"], key_prefix="ads", tags=["ads"],
+                stale_ttl=CACHE_STALE_TTL["ads"])
 async def get_ads():
     try:
         # Fetch active ads ordered by display_order
-        response = supabase.table("advertisements").select("*").eq("is_active", True).order("display_order").execute()
+        response = await db.table("advertisements").select("*").eq("is_active", True).order("display_order").execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -40,7 +41,7 @@ async def get_ads():
 async def get_all_ads():
     try:
         # Fetch all ads (for admin)
-        response = supabase.table("advertisements").select("*").order("display_order").execute()
+        response = await db.table("advertisements").select("*").order("display_order").execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -48,12 +49,12 @@ async def get_all_ads():
 @router.post("/")
 async def create_ad(ad: AdCreate):
     try:
-        response = supabase.table("advertisements").insert(ad.dict()).execute()
+        response = await db.table("advertisements").insert(ad.dict()).execute()
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create advertisement")
         
         # Invalidate ads cache
-        invalidate_cache_pattern("ads")
+        await invalidate_tags("ads")
         
         return response.data[0]
     except Exception as e:
@@ -62,7 +63,8 @@ async def create_ad(ad: AdCreate):
 @router.delete("/{ad_id}")
 async def delete_ad(ad_id: str):
     try:
-        response = supabase.table("advertisements").delete().eq("id", ad_id).execute()
+        response = await db.table("advertisements").delete().eq("id", ad_id).execute()
+        await invalidate_tags("ads")
         return {"message": "Advertisement deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -72,9 +74,10 @@ async def update_ad(ad_id: str, ad: AdUpdate):
     try:
         # Filter out None values
         update_data = {k: v for k, v in ad.dict().items() if v is not None}
-        response = supabase.table("advertisements").update(update_data).eq("id", ad_id).execute()
+        response = await db.table("advertisements").update(update_data).eq("id", ad_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Advertisement not found")
+        await invalidate_tags("ads")
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1,14 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends
-from database import supabase
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from typing import Optional
+from database import db
 from models import BookingCreate, BookingConfirmation
 from auth_middleware import get_current_user_optional
+import booking_pipeline
+import idempotency
+import seat_state
+import waiting_room
+from cache_middleware import CACHE_CONTROL, etag_matches, not_modified
+from executor import run_blocking
+from postgrest.exceptions import APIError
 import stripe
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 stripe.api_key = os.environ.get("STRIPE_SECRET_KEY", "").strip()
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "").strip()
+
+# Bound each Stripe call so a payment request's idempotency lease can outlast it
+STRIPE_TIMEOUT = int(os.environ.get("STRIPE_TIMEOUT", "20"))  # seconds per attempt
+STRIPE_MAX_NETWORK_RETRIES = 1  # retried with the same idempotency key
+stripe.default_http_client = stripe.new_default_http_client(timeout=STRIPE_TIMEOUT)
+stripe.max_network_retries = STRIPE_MAX_NETWORK_RETRIES
+PAYMENT_INTENT_LEASE_MS = (STRIPE_TIMEOUT * (STRIPE_MAX_NETWORK_RETRIES + 1) + 20) * 1000
 
 router = APIRouter(
     prefix="/bookings",
@@ -16,7 +33,46 @@ router = APIRouter(
 )
 
 @router.post("/create-payment-intent")
-async def create_payment_intent(booking: BookingCreate):
+async def create_payment_intent(
+    booking: BookingCreate,
+    admission_token: Optional[str] = Header(None, alias="X-Admission-Token"),
+    current_user: dict = Depends(get_current_user_optional),
+):
+    """
+    Create (or, for a repeated request, return) the PaymentIntent for a
+    seat selection. Requests that would send Stripe the same parameters
+    are deduplicated: a repeat gets the stored response from Redis, and
+    Stripe gets an idempotency key derived from those parameters.
+    """
+    # Flash-sale showtimes only accept sessions admitted from the waiting room;
+    # the token must belong to this seat session (none means no match)
+    await waiting_room.require_admission(booking.showtime_id, admission_token, booking.user_session or "")
+    user_id = current_user.id if current_user else ''
+    # Everything sent to Stripe, so the idempotency key can never be
+    # reused with different parameters (which Stripe rejects)
+    intent_params = {
+        'amount': booking.total_amount,
+        'currency': 'usd', # Changed to usd as per previous code, but should ideally be inr for India
+        'automatic_payment_methods': {
+            'enabled': True,
+        },
+        # Everything the webhook needs to commit the booking without the browser
+        'metadata': {
+            'customer_name': booking.customer_name,
+            'customer_email': booking.customer_email,
+            'customer_phone': booking.customer_phone,
+            'showtime_id': booking.showtime_id,
+            'seats': ",".join(sorted(booking.seats)),
+            'coupon_code': booking.coupon_code or '',
+            'discount_amount': booking.discount_amount or 0,
+            'user_session': booking.user_session or '',
+            'user_id': user_id,
+        },
+    }
+    idempotency_key = idempotency.fingerprint(intent_params)
+    stored = await idempotency.begin("payment_intent", idempotency_key, lease_ms=PAYMENT_INTENT_LEASE_MS)
+    if stored is not None:
+        return stored
     try:
         if not stripe.api_key:
             print("❌ Error: Stripe API key is missing or empty")
@@ -26,20 +82,24 @@ async def create_payment_intent(booking: BookingCreate):
         # This is a safety check - frontend should have already locked seats
         import redis_client
         
-        # Check if seats are available (not booked in Supabase)
+        # Check if seats are available (not already sold)
         print(f"Checking availability for seats: {booking.seats} in showtime {booking.showtime_id}")
-        response = supabase.table("bookings").select("seats").eq("showtime_id", booking.showtime_id).eq("payment_status", "paid").execute()
+        state = await seat_state.get_seat_state(booking.showtime_id)
         
-        booked_seats = []
-        if response.data:
-            for existing_booking in response.data:
-                booked_seats.extend(existing_booking.get("seats", []))
-        
-        # Check if any requested seats are already booked
-        conflicting_seats = set(booking.seats) & set(booked_seats)
+        # Check if any requested seats are already booked. Seats outside the
+        # layout aren't in the bitmaps, so check those against the database
+        # before refusing them: nothing may reach Stripe that can't be booked.
+        conflicting_seats = [seat for seat in booking.seats if state.is_sold(seat)]
+        invalid_seats = state.layout.invalid_seats(booking.seats)
+        if invalid_seats:
+            sold_in_db = set(await seat_state.fetch_sold_seats(booking.showtime_id))
+            conflicting_seats += [seat for seat in invalid_seats if seat in sold_in_db]
         if conflicting_seats:
             print(f"❌ Conflict: Seats {conflicting_seats} are already booked")
             raise HTTPException(status_code=409, detail=f"Seats {', '.join(conflicting_seats)} are already booked")
+        if invalid_seats:
+            print(f"❌ Seats {invalid_seats} are not in the layout of showtime {booking.showtime_id}")
+            raise HTTPException(status_code=400, detail=f"Seats {', '.join(invalid_seats)} do not exist on this screen")
         
         # Validate coupon if provided
         if booking.coupon_code:
@@ -47,7 +107,7 @@ async def create_payment_intent(booking: BookingCreate):
             try:
                 # Call internal validation logic (duplicating logic from offers router for now or importing)
                 # For simplicity, we'll trust the frontend's calculation but verify the coupon exists and is active
-                coupon_response = supabase.table("offers").select("*").eq("coupon_code", booking.coupon_code.upper()).execute()
+                coupon_response = await db.table("offers").select("*").eq("coupon_code", booking.coupon_code.upper()).execute()
                 if not coupon_response.data:
                     print(f"❌ Invalid coupon code: {booking.coupon_code}")
                     # We won't block the booking, but we'll log it. 
@@ -63,27 +123,25 @@ async def create_payment_intent(booking: BookingCreate):
 
         # Create a PaymentIntent with the order amount and currency
         print(f"Creating Stripe PaymentIntent for amount: {booking.total_amount}")
-        intent = stripe.PaymentIntent.create(
-            amount=booking.total_amount,
-            currency='usd', # Changed to usd as per previous code, but should ideally be inr for India
-            automatic_payment_methods={
-                'enabled': True,
-            },
-            metadata={
-                'customer_name': booking.customer_name,
-                'customer_email': booking.customer_email,
-                'showtime_id': booking.showtime_id,
-                'seats': ",".join(booking.seats),
-                'coupon_code': booking.coupon_code or '',
-                'discount_amount': booking.discount_amount or 0
-            }
+        # The Stripe SDK is synchronous; run it on the bounded executor
+        intent = await run_blocking(
+            stripe.PaymentIntent.create,
+            **intent_params,
+            idempotency_key=f"payment_intent-{idempotency_key}",
         )
         print(f"✅ PaymentIntent created: {intent.id}")
-        return {
+        result = {
             'clientSecret': intent.client_secret,
             'id': intent.id
         }
+        # Recorded under the intent id so a cancellation can drop it (booking_pipeline)
+        await idempotency.complete("payment_intent", idempotency_key, result, ref=intent.id)
+        return result
+    except HTTPException:
+        await idempotency.release("payment_intent", idempotency_key)
+        raise
     except Exception as e:
+        await idempotency.release("payment_intent", idempotency_key)
         print(f"❌ Error in create_payment_intent: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -97,55 +155,71 @@ async def confirm_booking(
     background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user_optional)
 ):
+    """
+    Commit a paid booking. Idempotent per payment intent: retries get the
+    stored booking from Redis (also filled by the webhook workers).
+    """
+    payment_intent_id = booking_details.payment_intent_id
+    stored = await idempotency.begin("confirm_booking", payment_intent_id)
+    if stored is not None:
+        return stored
+    try:
+        booking = await _confirm_booking(booking_details, background_tasks, current_user)
+    except Exception:
+        await idempotency.release("confirm_booking", payment_intent_id)
+        raise
+    await idempotency.complete("confirm_booking", payment_intent_id, booking)
+    return booking
+
+async def _confirm_booking(booking_details: BookingConfirmation, background_tasks: BackgroundTasks, current_user):
     try:
         print(f"Confirming booking for {booking_details.customer_email}")
         
-        # Convert booking details to dict
-        booking_data = booking_details.dict()
-        booking_data['payment_status'] = 'paid'
-        
-        # Rename payment_intent_id to stripe_payment_intent_id to match database schema
-        if 'payment_intent_id' in booking_data:
-            booking_data['stripe_payment_intent_id'] = booking_data.pop('payment_intent_id')
-        
         # Add user_id if user is authenticated
+        user_id = None
         if current_user:
-            booking_data['user_id'] = current_user['id']
-            print(f"✅ Linking booking to user: {current_user['id']}")
+            user_id = current_user.id
+            print(f"✅ Linking booking to user: {user_id}")
         else:
             print("ℹ️ Guest booking (no user_id)")
         
-        response = supabase.table("bookings").insert(booking_data).execute()
-        if not response.data:
-            print("❌ Failed to save booking to database")
-            raise HTTPException(status_code=500, detail="Failed to save booking to database")
+        # One round trip: seat conflict check, booking insert, coupon usage
+        # increment and the showtime details for the email
+        try:
+            result = await booking_pipeline.commit_booking(
+                showtime_id=booking_details.showtime_id,
+                customer_name=booking_details.customer_name,
+                customer_email=booking_details.customer_email,
+                customer_phone=booking_details.customer_phone,
+                seats=booking_details.seats,
+                total_amount=booking_details.total_amount,
+                payment_intent_id=booking_details.payment_intent_id,
+                coupon_code=booking_details.coupon_code,
+                discount_amount=booking_details.discount_amount or 0,
+                user_id=user_id,
+            )
+        except APIError as e:
+            if e.code == booking_pipeline.UNIQUE_VIOLATION:
+                # The Stripe webhook may already have committed this payment
+                existing = await booking_pipeline.find_booking_by_payment_intent(booking_details.payment_intent_id)
+                if existing:
+                    return existing
+                print(f"❌ Conflict: {e.message}")
+                raise HTTPException(status_code=409, detail=e.message or "One or more selected seats have already been booked")
+            raise
         
-        booking = response.data[0]
+        booking = result["booking"]
+        showtime = result.get("showtime")
         print(f"✅ Booking saved to DB: {booking['id']}")
         
-        # Increment coupon usage if applicable
-        if booking_details.coupon_code:
-            try:
-                # Find offer by code
-                offer_res = supabase.table("offers").select("id, used_count").eq("coupon_code", booking_details.coupon_code.upper()).execute()
-                if offer_res.data:
-                    offer_id = offer_res.data[0]['id']
-                    current_count = offer_res.data[0].get('used_count', 0)
-                    supabase.table("offers").update({"used_count": current_count + 1}).eq("id", offer_id).execute()
-                    print(f"✅ Incremented usage for coupon: {booking_details.coupon_code}")
-            except Exception as e:
-                print(f"⚠️ Failed to increment coupon usage: {e}")
-        
-        # Fetch showtime details for email
-        showtime_response = supabase.table("showtimes").select(
-            "*, movie:movies(title), screen:screens(name, theater:theaters(name))"
-        ).eq("id", booking_details.showtime_id).single().execute()
+        # Convert the seat locks into sold seats in the seat-state projection
+        try:
+            await seat_state.confirm_seats(booking_details.showtime_id, booking_details.seats)
+        except Exception as e:
+            print(f"⚠️ Failed to update seat state: {e}")
         
-        if showtime_response.data:
-            showtime = showtime_response.data
-            
+        if showtime:
             # Check email credentials before adding background task
-            import os
             sendgrid_api_key = os.environ.get("SENDGRID_API_KEY", "").strip()
             
             if not sendgrid_api_key:
@@ -155,53 +229,79 @@ async def confirm_booking(
             
             # Send email confirmation in background
             from email_service import send_booking_confirmation
-            from datetime import datetime
-            
-            formatted_time = datetime.fromisoformat(showtime['start_time'].replace('Z', '+00:00')).strftime('%B %d, %Y at %I:%M %p')
             
             background_tasks.add_task(
                 send_booking_confirmation,
-                customer_email=booking_details.customer_email,
-                customer_name=booking_details.customer_name,
-                movie_title=showtime['movie']['title'],
-                theater_name=showtime['screen']['theater']['name'],
-                screen_name=showtime['screen']['name'],
-                showtime=formatted_time,
-                seats=booking_details.seats,
-                total_amount=booking_details.total_amount,
-                booking_id=booking['id']
+                **booking_pipeline.confirmation_email(booking, showtime, booking_details.seats)
             )
             print(f"📧 Email task added to background for {booking_details.customer_email}")
             
         return booking
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in confirm_booking: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/webhook")
+async def stripe_webhook(request: Request, stripe_signature: Optional[str] = Header(None, alias="Stripe-Signature")):
+    """
+    Stripe webhook for payment_intent.succeeded / payment_intent.canceled.
+    Verifies the signature (offline, with STRIPE_WEBHOOK_SECRET), queues the
+    event for the booking workers and returns; bookings are committed even
+    if the customer's tab has closed.
+    """
+    if not STRIPE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Stripe webhook secret not configured")
+    payload = await request.body()
+    try:
+        stripe.Webhook.construct_event(payload, stripe_signature or "", STRIPE_WEBHOOK_SECRET)
+        event = json.loads(payload)
+    except (ValueError, stripe.error.SignatureVerificationError) as e:
+        print(f"❌ Rejected Stripe webhook: {e}")
+        raise HTTPException(status_code=400, detail="Invalid Stripe webhook")
+
+    if event["type"] not in ("payment_intent.succeeded", "payment_intent.canceled"):
+        return {"received": True, "queued": False}
+    try:
+        queued = await booking_pipeline.enqueue_stripe_event(event)
+    except Exception as e:
+        # Non-2xx makes Stripe retry the delivery
+        print(f"❌ Could not queue Stripe event {event['id']}: {e}")
+        raise HTTPException(status_code=503, detail="Could not queue event")
+    return {"received": True, "queued": queued}
+
+@router.get("/status/{payment_intent_id}")
+async def get_booking_status(payment_intent_id: str):
+    """
+    Confirmation progress for a payment, for the client to poll after
+    Stripe reports success: pending, processing, confirmed (with
+    booking_id), conflict or failed (with detail). Redis only.
+    """
+    try:
+        return await booking_pipeline.get_booking_status(payment_intent_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/showtime/{showtime_id}/seats")
-async def get_booked_seats(showtime_id: str):
-    """Get all booked seats for a specific showtime"""
+async def get_booked_seats(showtime_id: str, request: Request, response: Response):
+    """Get all booked seats for a specific showtime (conditional on the seat version)"""
     try:
-        # Fetch all bookings for this showtime that are paid
-        response = supabase.table("bookings").select("seats").eq("showtime_id", showtime_id).eq("payment_status", "paid").execute()
+        if request.headers.get("if-none-match"):
+            version = await seat_state.get_seat_version(showtime_id)
+            etag = version and seat_state.seat_etag(version, "sold")
+            if etag and etag_matches(request, etag):
+                return not_modified(etag)
         
-        booked_seats = []
-        if response.data:
-            for booking in response.data:
-                # seats is stored as a list of strings in the JSONB column or array
-                seats = booking.get("seats", [])
-                if isinstance(seats, list):
-                    booked_seats.extend(seats)
-                elif isinstance(seats, str):
-                    # Handle case where it might be stored as comma-separated string
-                    booked_seats.extend([s.strip() for s in seats.split(",")])
-                    
-        # Remove duplicates just in case
-        return list(set(booked_seats))
+        state = await seat_state.get_seat_state(showtime_id)
+        response.headers["ETag"] = seat_state.seat_etag(state.version, "sold")
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return state.layout.seats_in(state.sold)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error fetching booked seats: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
-
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from database import supabase
+from fastapi import APIRouter, HTTPException, Request
+from database import db
 from models import MovieCreate
-from cache_middleware import cache_response, invalidate_cache_pattern, CACHE_TTL
+from cache_middleware import cache_response, cached_json, invalidate_tags, CACHE_TTL, CACHE_STALE_TTL
 from datetime import datetime
+from typing import Optional
+import direct_db
+import seat_allocator
 
 router = APIRouter(
     prefix="/movies",
@@ -10,21 +13,43 @@ router = APIRouter(
 )
 
 @router.get("/")
-@cache_response(ttl=CACHE_TTL["movies_list"], key_prefix="movies_list")
+@cache_response(ttl=CACHE_TTL["movies_list"], key_prefix="movies_list", tags=["movies"],
+                stale_ttl=CACHE_STALE_TTL["movies_list"])
 async def get_movies():
-    response = supabase.table("movies").select("*").order("created_at", desc=True).execute()
+    response = await db.table("movies").select("*").order("created_at", desc=True).execute()
     return response.data
 
 @router.get("/with-showtimes")
-@cache_response(ttl=CACHE_TTL["movies_list"], key_prefix="movies_with_showtimes")
-async def get_movies_with_showtimes():
-    """Get only movies that have active (future) showtimes"""
+async def get_movies_with_showtimes(request: Request, party_size: Optional[int] = None):
+    """
+    Get only movies that have active (future) showtimes.
+    With party_size, only movies with an upcoming showtime that still has
+    that many adjacent free seats.
+    """
+    if party_size is None:
+        return await list_movies_with_showtimes(_cache_request=request)
+    if party_size < 1:
+        raise HTTPException(status_code=400, detail="party_size must be at least 1")
+    from routers.showtimes import list_showtimes
+    try:
+        movies = await cached_json(list_movies_with_showtimes)
+        showtimes = await cached_json(list_showtimes, include_expired=False)
+        seating = await seat_allocator.showtimes_with_block([s["id"] for s in showtimes], party_size)
+        movie_ids = {s["movie_id"] for s in showtimes if s["id"] in seating}
+        return [m for m in movies if m["id"] in movie_ids]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@cache_response(ttl=CACHE_TTL["movies_with_showtimes"], key_prefix="movies_with_showtimes", tags=["movies", "showtimes"],
+                stale_ttl=CACHE_STALE_TTL["movies_with_showtimes"])
+async def list_movies_with_showtimes():
+    """Movies that have active (future) showtimes (cached)"""
     try:
         # Use RPC to get movies with active showtimes
         now = datetime.utcnow().isoformat()
         
         # This gets distinct movies that have at least one future showtime
-        response = supabase.rpc(
+        response = await db.rpc(
             'get_movies_with_active_showtimes',
             {'query_time': now}
         ).execute()
@@ -32,11 +57,11 @@ async def get_movies_with_showtimes():
         # If RPC doesn't exist, fall back to manual filtering
         if not response.data:
             # Get all movies
-            movies_response = supabase.table("movies").select("*").execute()
+            movies_response = await db.table("movies").select("*").execute()
             movies = movies_response.data or []
             
             # Get all future showtimes
-            showtimes_response = supabase.table("showtimes").select("movie_id").gte("start_time", now).execute()
+            showtimes_response = await db.table("showtimes").select("movie_id").gte("start_time", now).execute()
             showtime_movie_ids = set(st['movie_id'] for st in (showtimes_response.data or []))
             
             # Filter movies to only those with showtimes
@@ -45,16 +70,16 @@ async def get_movies_with_showtimes():
         
         return response.data
     except Exception as e:
-        print(f"Error in get_movies_with_showtimes (RPC failed, using fallback): {e}")
+        print(f"Error in list_movies_with_showtimes (RPC failed, using fallback): {e}")
         try:
             # Fallback: Manual filtering in Python
             # 1. Get all movies
-            movies_response = supabase.table("movies").select("*").order("created_at", desc=True).execute()
+            movies_response = await db.table("movies").select("*").order("created_at", desc=True).execute()
             movies = movies_response.data or []
             
             # 2. Get all future showtimes
             # Note: We fetch only movie_ids for active showtimes
-            showtimes_response = supabase.table("showtimes").select("movie_id").gte("start_time", now).execute()
+            showtimes_response = await db.table("showtimes").select("movie_id").gte("start_time", now).execute()
             active_movie_ids = set(st['movie_id'] for st in (showtimes_response.data or []))
             
             # 3. Filter movies
@@ -67,20 +92,31 @@ async def get_movies_with_showtimes():
 
 @router.post("/")
 async def create_movie(movie: MovieCreate):
-    response = supabase.table("movies").insert(movie.dict()).execute()
+    response = await db.table("movies").insert(movie.dict()).execute()
     if not response.data:
         raise HTTPException(status_code=400, detail="Could not create movie")
     
-    # Invalidate movies list cache
-    invalidate_cache_pattern("movies_list")
-    invalidate_cache_pattern("movies_with_showtimes")
+    # Invalidate movie list caches
+    await invalidate_tags("movies")
     
     return response.data[0]
 
 @router.get("/{movie_id}")
-@cache_response(ttl=CACHE_TTL["movie_detail"], key_prefix="movie_detail")
+@cache_response(ttl=CACHE_TTL["movie_detail"], key_prefix="movie_detail", tags=["movie:{movie_id}"],
+                stale_ttl=CACHE_STALE_TTL["movie_detail"])
 async def get_movie(movie_id: str):
-    response = supabase.table("movies").select("*").eq("id", movie_id).single().execute()
+    if direct_db.enabled():
+        try:
+            movie = await direct_db.fetch_movie(movie_id)
+            if not movie:
+                raise HTTPException(status_code=404, detail="Movie not found")
+            return movie
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"⚠️ Direct SQL read failed, falling back to PostgREST: {e}")
+    
+    response = await db.table("movies").select("*").eq("id", movie_id).single().execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Movie not found")
     return response.data
@@ -88,16 +124,14 @@ async def get_movie(movie_id: str):
 @router.delete("/{movie_id}")
 async def delete_movie(movie_id: str):
     # First check if movie exists
-    check = supabase.table("movies").select("id").eq("id", movie_id).execute()
+    check = await db.table("movies").select("id").eq("id", movie_id).execute()
     if not check.data:
         raise HTTPException(status_code=404, detail="Movie not found")
         
     # Delete the movie
-    response = supabase.table("movies").delete().eq("id", movie_id).execute()
+    response = await db.table("movies").delete().eq("id", movie_id).execute()
     
-    # Invalidate caches
-    invalidate_cache_pattern("movies_list")
-    invalidate_cache_pattern("movies_with_showtimes")
-    invalidate_cache_pattern(f"movie_detail:{movie_id}")
+    # Invalidate caches (showtime listings embed the movie)
+    await invalidate_tags("movies", f"movie:{movie_id}", "showtimes")
     
     return {"message": "Movie deleted successfully"}
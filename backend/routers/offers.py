@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from database import supabase
+from fastapi import APIRouter, Depends, HTTPException
+from database import db
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
-from cache_middleware import cache_response, invalidate_cache_pattern, CACHE_TTL
+from cache_middleware import cache_response, invalidate_tags, CACHE_TTL, CACHE_STALE_TTL
+from rate_limiter import COUPON_VALIDATE_LIMIT, limit_per_client
 
 router = APIRouter(
     prefix="/offers",
@@ -47,11 +48,12 @@ class CouponValidate(BaseModel):
     booking_amount: float
 
 @router.get("/")
-@cache_response(ttl=CACHE_TTL["offers"], key_prefix="offers")
+@cache_response(ttl=CACHE_TTL["offers"], key_prefix="offers", tags=["offers"],
+                stale_ttl=CACHE_STALE_TTL["offers"])
 async def get_active_offers():
     try:
         now = datetime.utcnow().isoformat()
-        response = supabase.table("offers").select("*").eq("is_active", True).gte("valid_until", now).execute()
+        response = await db.table("offers").select("*").eq("is_active", True).gte("valid_until", now).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -59,7 +61,7 @@ async def get_active_offers():
 @router.get("/all")
 async def get_all_offers():
     try:
-        response = supabase.table("offers").select("*").order("created_at", desc=True).execute()
+        response = await db.table("offers").select("*").order("created_at", desc=True).execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -78,12 +80,12 @@ async def create_offer(offer: OfferCreate):
         offer_data = offer.dict()
         offer_data['used_count'] = 0
         
-        response = supabase.table("offers").insert(offer_data).execute()
+        response = await db.table("offers").insert(offer_data).execute()
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create offer")
         
         # Invalidate offers cache
-        invalidate_cache_pattern("offers")
+        await invalidate_tags("offers")
         
         return response.data[0]
     except HTTPException:
@@ -99,9 +101,10 @@ async def update_offer(offer_id: str, offer: OfferUpdate):
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        response = supabase.table("offers").update(update_data).eq("id", offer_id).execute()
+        response = await db.table("offers").update(update_data).eq("id", offer_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Offer not found")
+        await invalidate_tags("offers")
         return response.data[0]
     except HTTPException:
         raise
@@ -111,16 +114,17 @@ async def update_offer(offer_id: str, offer: OfferUpdate):
 @router.delete("/{offer_id}")
 async def delete_offer(offer_id: str):
     try:
-        response = supabase.table("offers").delete().eq("id", offer_id).execute()
+        response = await db.table("offers").delete().eq("id", offer_id).execute()
+        await invalidate_tags("offers")
         return {"message": "Offer deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/validate")
+@router.post("/validate", dependencies=[Depends(limit_per_client("coupon_validate", COUPON_VALIDATE_LIMIT))])
 async def validate_coupon(data: CouponValidate):
     try:
         # Find coupon by code
-        response = supabase.table("offers").select("*").eq("coupon_code", data.coupon_code.upper()).execute()
+        response = await db.table("offers").select("*").eq("coupon_code", data.coupon_code.upper()).execute()
         
         if not response.data or len(response.data) == 0:
             raise HTTPException(status_code=404, detail="Invalid coupon code")
@@ -186,14 +190,14 @@ async def increment_offer_usage(offer_id: str):
     """Increment the used_count for an offer after successful booking"""
     try:
         # Get current count
-        response = supabase.table("offers").select("used_count").eq("id", offer_id).execute()
+        response = await db.table("offers").select("used_count").eq("id", offer_id).execute()
         if not response.data:
             return {"message": "Offer not found"}
         
         current_count = response.data[0].get('used_count', 0)
         
         # Increment
-        supabase.table("offers").update({"used_count": current_count + 1}).eq("id", offer_id).execute()
+        await db.table("offers").update({"used_count": current_count + 1}).eq("id", offer_id).execute()
         
         return {"message": "Offer usage incremented"}
     except Exception as e:
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from database import supabase
+from database import db
 
 router = APIRouter(
     prefix="/screens",
@@ -9,5 +9,5 @@ router = APIRouter(
 @router.get("/")
 async def get_screens():
     """Get all screens with their theater information"""
-    response = supabase.table("screens").select("*, theater:theaters(*)").execute()
+    response = await db.table("screens").select("*, theater:theaters(*)").execute()
     return response.data
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import redis_client
-from database import supabase
+import seat_allocator
+import seat_events
+import seat_state
+import waiting_room
+from cache_middleware import CACHE_CONTROL, etag_matches, not_modified
+from rate_limiter import SEAT_LOCK_LIMIT, enforce_limit, limit_per_client
 
 router = APIRouter(
     prefix="/seats",
@@ -24,33 +30,83 @@ class SeatCheckRequest(BaseModel):
     showtime_id: str
     seats: List[str]
 
-@router.post("/lock")
-async def lock_seats(request: SeatLockRequest):
+class BestAvailableRequest(BaseModel):
+    showtime_id: str
+    party_size: int
+    user_session: str
+    customer_email: str
+    premium: bool = False
+    centre: bool = True
+    allow_aisle_split: bool = False
+
+@router.post("/lock", dependencies=[Depends(limit_per_client("seat_lock", SEAT_LOCK_LIMIT))])
+async def lock_seats(request: SeatLockRequest, admission_token: Optional[str] = Header(None, alias="X-Admission-Token")):
     """
     Lock seats for a user session with 5-minute TTL.
+    Rate limited per client and per seat session. While the showtime has a
+    waiting room, requires the session's admission token. Seats that aren't
+    in the screen's layout are rejected with 400.
     """
+    await enforce_limit("seat_lock_session", request.user_session, SEAT_LOCK_LIMIT)
+    await waiting_room.require_admission(request.showtime_id, admission_token, request.user_session)
     try:
-        result = redis_client.lock_seats(
+        # Offsets must be in Redis for the lock script to mark held seats
+        await seat_state.ensure_layout(request.showtime_id)
+        result = await redis_client.lock_seats(
             showtime_id=request.showtime_id,
             seats=request.seats,
             user_session=request.user_session,
             customer_email=request.customer_email
         )
         
+        if result["invalid_seats"]:
+            raise HTTPException(status_code=400, detail=result["message"])
         if not result["success"]:
             raise HTTPException(status_code=409, detail=result["message"])
         
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/best-available", dependencies=[Depends(limit_per_client("seat_lock", SEAT_LOCK_LIMIT))])
+async def lock_best_available(request: BestAvailableRequest, admission_token: Optional[str] = Header(None, alias="X-Admission-Token")):
+    """
+    Find the best block of adjacent seats for a party and lock it (5-minute
+    TTL), in place of picking seats one by one. Preferences: premium rows
+    only, centre of the hall (otherwise front-to-back), and whether the
+    block may span an aisle. Same limits and admission rules as /lock.
+    """
+    if not 1 <= request.party_size <= seat_allocator.MAX_PARTY_SIZE:
+        raise HTTPException(status_code=400, detail=f"party_size must be between 1 and {seat_allocator.MAX_PARTY_SIZE}")
+    await enforce_limit("seat_lock_session", request.user_session, SEAT_LOCK_LIMIT)
+    await waiting_room.require_admission(request.showtime_id, admission_token, request.user_session)
+    try:
+        result = await seat_allocator.allocate_best_available(
+            showtime_id=request.showtime_id,
+            party_size=request.party_size,
+            user_session=request.user_session,
+            customer_email=request.customer_email,
+            premium=request.premium,
+            centre=request.centre,
+            allow_aisle_split=request.allow_aisle_split,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result["success"]:
+        raise HTTPException(status_code=409, detail=result["message"])
+    return result
+
 @router.post("/unlock")
 async def unlock_seats(request: SeatUnlockRequest):
     """
     Unlock seats for a user session.
     """
     try:
-        result = redis_client.unlock_seats(
+        result = await redis_client.unlock_seats(
             showtime_id=request.showtime_id,
             seats=request.seats,
             user_session=request.user_session
@@ -60,58 +116,85 @@ async def unlock_seats(request: SeatUnlockRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/available/{showtime_id}")
-async def get_available_seats(showtime_id: str):
+async def get_available_seats(
+    showtime_id: str,
+    request: Request,
+    response: Response,
+    bitmap: bool = False,
+    admission_token: Optional[str] = Header(None, alias="X-Admission-Token"),
+):
     """
     Get all available seats for a showtime.
-    Returns locked seats (Redis) and booked seats (Supabase).
+    Returns locked and booked seats from the showtime's seat-state bitmaps.
+    Pass bitmap=true to receive base64 bitmaps (plus the layout) instead
+    of seat id lists.
+    The ETag is the showtime's seat version, so polls with If-None-Match
+    get a 304 until a seat changes. Lock expiry counts as a change: the
+    version read prunes lapsed locks (bumping it) before comparing.
+    While the showtime has a waiting room, requires an admission token (for
+    any session: this is read-only, see waiting_room.require_admission).
     """
+    await waiting_room.require_admission(showtime_id, admission_token)
+    variant = "bitmap" if bitmap else "list"
     try:
-        # Get locked seats from Redis
-        locked_seats = redis_client.get_locked_seats(showtime_id)
-        
-        # Get booked seats from Supabase
-        response = supabase.table("bookings").select("seats").eq("showtime_id", showtime_id).eq("payment_status", "paid").execute()
-        
-        booked_seats = []
-        if response.data:
-            for booking in response.data:
-                booked_seats.extend(booking.get("seats", []))
+        if request.headers.get("if-none-match"):
+            version = await seat_state.get_seat_version(showtime_id)
+            etag = version and seat_state.seat_etag(version, variant)
+            if etag and etag_matches(request, etag):
+                return not_modified(etag)
         
-        return {
-            "showtime_id": showtime_id,
-            "locked_seats": locked_seats,
-            "booked_seats": list(set(booked_seats)),  # Remove duplicates
-            "unavailable_seats": list(set(locked_seats + booked_seats))
-        }
+        state = await seat_state.get_seat_state(showtime_id)
+        response.headers["ETag"] = seat_state.seat_etag(state.version, variant)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return state.to_response(bitmap=bitmap)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/stream/{showtime_id}")
+async def stream_seats(
+    showtime_id: str,
+    admission_token: Optional[str] = None,
+    admission_header: Optional[str] = Header(None, alias="X-Admission-Token"),
+):
+    """
+    Push a showtime's seat map as server-sent events instead of polling
+    /available: a snapshot, then locked/unlocked/sold/expired deltas.
+    EventSource can't set headers, so the admission token may also be
+    passed as ?admission_token=. Read-only, so the token isn't tied to a
+    session here (see waiting_room.require_admission).
+    """
+    await waiting_room.require_admission(showtime_id, admission_token or admission_header)
+    # 404 before the stream starts, rather than a stream that breaks
+    await seat_state.ensure_layout(showtime_id)
+    return StreamingResponse(
+        seat_events.stream_seat_events(showtime_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            # Marked as encoded so GZipMiddleware doesn't buffer the stream
+            "Content-Encoding": "identity",
+        },
+    )
+
 @router.post("/check")
 async def check_seats(request: SeatCheckRequest):
     """
     Check if specific seats are available.
+    Seats outside the screen's layout are reported as unavailable.
     """
     try:
-        unavailable = []
-        
-        for seat in request.seats:
-            if not redis_client.check_seat_availability(request.showtime_id, seat):
-                unavailable.append(seat)
-        
-        # Also check Supabase for confirmed bookings
-        response = supabase.table("bookings").select("seats").eq("showtime_id", request.showtime_id).eq("payment_status", "paid").execute()
-        
-        if response.data:
-            for booking in response.data:
-                booked_seats = booking.get("seats", [])
-                for seat in request.seats:
-                    if seat in booked_seats and seat not in unavailable:
-                        unavailable.append(seat)
+        state = await seat_state.get_seat_state(request.showtime_id)
+        unavailable = [seat for seat in request.seats if not state.is_available(seat)]
         
         return {
             "available": len(unavailable) == 0,
             "unavailable_seats": unavailable
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -121,7 +204,7 @@ async def refresh_locks(request: SeatUnlockRequest):
     Refresh the TTL on seat locks (extend 5-minute timer).
     """
     try:
-        success = redis_client.refresh_seat_locks(
+        success = await redis_client.refresh_seat_locks(
             showtime_id=request.showtime_id,
             seats=request.seats,
             user_session=request.user_session
@@ -1,36 +1,86 @@
-from fastapi import APIRouter, HTTPException
-from database import supabase
+from fastapi import APIRouter, Depends, HTTPException, Request
+from database import db
 from models import ShowtimeCreate
 from datetime import datetime
-from cache_middleware import cache_response, invalidate_cache_pattern, CACHE_TTL
+from typing import Optional
+import direct_db
+import seat_allocator
+import seat_state
+from cache_middleware import cache_response, cached_json, invalidate_tags, CACHE_TTL, CACHE_STALE_TTL
+from rate_limiter import OCCUPANCY_LIMIT, limit_per_client
 
 router = APIRouter(
     prefix="/showtimes",
     tags=["showtimes"],
 )
 
+MAX_OCCUPANCY_IDS = 200
+
 @router.get("/")
-@cache_response(ttl=CACHE_TTL["showtimes"], key_prefix="showtimes")
-async def get_showtimes(include_expired: bool = False):
-    """Get all showtimes, optionally filter out expired ones"""
-    query = supabase.table("showtimes").select("*, movie:movies(*), screen:screens(name, theater:theaters(name))").order("start_time", desc=False)
+async def get_showtimes(request: Request, include_expired: bool = False, party_size: Optional[int] = None):
+    """
+    Get all showtimes, optionally filter out expired ones.
+    Served straight from the response cache (pre-compressed, with an ETag);
+    live seat counts come from /showtimes/occupancy. With party_size, only
+    showtimes that still have that many adjacent free seats are returned
+    (checked against the seat-state bitmaps, so never cached).
+    """
+    if party_size is not None and party_size < 1:
+        raise HTTPException(status_code=400, detail="party_size must be at least 1")
+    if party_size is None:
+        return await list_showtimes(include_expired=include_expired, _cache_request=request)
+    try:
+        showtimes = await cached_json(list_showtimes, include_expired=include_expired)
+        available = await seat_allocator.showtimes_with_block([s["id"] for s in showtimes], party_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return [s for s in showtimes if s["id"] in available]
+
+@router.get("/occupancy", dependencies=[Depends(limit_per_client("occupancy", OCCUPANCY_LIMIT))])
+async def get_occupancy(ids: str):
+    """
+    Live seat counts ("X seats left", "filling fast") for a comma-separated
+    list of showtime ids, from one pipelined read of their seat-state
+    bitmaps. Kept out of /showtimes so the listing stays cacheable.
+    Ids that aren't showtimes are left out of the response.
+    """
+    showtime_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if len(showtime_ids) > MAX_OCCUPANCY_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_OCCUPANCY_IDS} showtime ids per request")
+    try:
+        states = await seat_state.get_seat_states(showtime_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {showtime_id: state.occupancy() for showtime_id, state in states.items()}
+
+@cache_response(ttl=CACHE_TTL["showtimes"], key_prefix="showtimes", tags=["showtimes"],
+                stale_ttl=CACHE_STALE_TTL["showtimes"])
+async def list_showtimes(include_expired: bool = False):
+    """All showtimes (cached), optionally without expired ones"""
+    if direct_db.enabled():
+        try:
+            return await direct_db.fetch_showtimes(include_expired)
+        except Exception as e:
+            print(f"⚠️ Direct SQL read failed, falling back to PostgREST: {e}")
+    
+    query = db.table("showtimes").select("*, movie:movies(*), screen:screens(name, theater:theaters(name))").order("start_time", desc=False)
     
     if not include_expired:
         # Only show future showtimes
         now = datetime.utcnow().isoformat()
         query = query.gte("start_time", now)
     
-    response = query.execute()
+    response = await query.execute()
     return response.data
 
 @router.post("/")
 async def create_showtime(showtime: ShowtimeCreate):
-    response = supabase.table("showtimes").insert(showtime.dict()).execute()
+    response = await db.table("showtimes").insert(showtime.dict()).execute()
     if not response.data:
         raise HTTPException(status_code=400, detail="Could not create showtime")
     
     # Invalidate showtimes cache
-    invalidate_cache_pattern("showtimes")
+    await invalidate_tags("showtimes")
     
     return response.data[0]
 
@@ -38,37 +88,53 @@ async def create_showtime(showtime: ShowtimeCreate):
 async def delete_showtime(showtime_id: str):
     """Delete a specific showtime"""
     try:
-        response = supabase.table("showtimes").delete().eq("id", showtime_id).execute()
+        response = await db.table("showtimes").delete().eq("id", showtime_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Showtime not found")
+        await invalidate_tags("showtimes")
         return {"message": "Showtime deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{showtime_id}")
 async def get_showtime(showtime_id: str):
-    """Get a specific showtime by ID with full details"""
+    """
+    Get a specific showtime by ID with full details, including the
+    "seat_layout" ({rows, cols, aisles, premium_rows}) that seat locks are
+    validated against, for the seat map to draw.
+    """
     try:
-        response = supabase.table("showtimes") \
-            .select("*, movie:movies(*), screen:screens(name, theater:theaters(name))") \
+        response = await db.table("showtimes") \
+            .select("*, movie:movies(*), screen:screens(name, seat_layout, theater:theaters(name))") \
             .eq("id", showtime_id) \
             .execute()
             
         if not response.data:
             raise HTTPException(status_code=404, detail="Showtime not found")
-            
-        return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    showtime = response.data[0]
+    try:
+        state = await seat_state.get_seat_state(showtime_id)
+        showtime["occupancy"] = state.occupancy()
+        showtime["seat_layout"] = state.layout.to_dict()
+    except Exception as e:
+        print(f"⚠️ Seat state read failed for showtime {showtime_id}: {e}")
+        showtime["occupancy"] = None
+        showtime["seat_layout"] = None
+    return showtime
+
 @router.post("/cleanup-expired")
 async def cleanup_expired_showtimes():
     """Delete all showtimes that have already passed"""
     try:
         now = datetime.utcnow().isoformat()
-        response = supabase.table("showtimes").delete().lt("start_time", now).execute()
+        response = await db.table("showtimes").delete().lt("start_time", now).execute()
         
         deleted_count = len(response.data) if response.data else 0
+        if deleted_count:
+            await invalidate_tags("showtimes")
         return {
             "message": f"Cleaned up {deleted_count} expired showtimes",
             "deleted_count": deleted_count
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from database import supabase
+from database import db
 from fastapi.responses import HTMLResponse
 
 router = APIRouter(
@@ -12,7 +12,7 @@ async def verify_ticket(booking_id: str):
     """Verify and display ticket details for theater staff"""
     try:
         # Fetch booking details with related data
-        response = supabase.table("bookings").select(
+        response = await db.table("bookings").select(
             "*, showtime:showtimes(*, movie:movies(title, poster_url), screen:screens(name, theater:theaters(name)))"
         ).eq("id", booking_id).single().execute()
         
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from database import supabase
+from database import db
 from datetime import date
 
 router = APIRouter(
@@ -29,12 +29,12 @@ class UpcomingMovieUpdate(BaseModel):
 async def get_upcoming_movies(active_only: bool = True):
     """Get all upcoming movies, optionally filter by active status"""
     try:
-        query = supabase.table("upcoming_movies").select("*").order("display_order")
+        query = db.table("upcoming_movies").select("*").order("display_order")
         
         if active_only:
             query = query.eq("is_active", True)
         
-        response = query.execute()
+        response = await query.execute()
         return response.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -43,7 +43,7 @@ async def get_upcoming_movies(active_only: bool = True):
 async def create_upcoming_movie(movie: UpcomingMovieCreate):
     """Create a new upcoming movie advertisement"""
     try:
-        response = supabase.table("upcoming_movies").insert(movie.dict()).execute()
+        response = await db.table("upcoming_movies").insert(movie.dict()).execute()
         if not response.data:
             raise HTTPException(status_code=400, detail="Could not create upcoming movie")
         return response.data[0]
@@ -54,7 +54,7 @@ async def create_upcoming_movie(movie: UpcomingMovieCreate):
 async def get_upcoming_movie(movie_id: str):
     """Get a specific upcoming movie by ID"""
     try:
-        response = supabase.table("upcoming_movies").select("*").eq("id", movie_id).single().execute()
+        response = await db.table("upcoming_movies").select("*").eq("id", movie_id).single().execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Upcoming movie not found")
         return response.data
@@ -68,7 +68,7 @@ async def update_upcoming_movie(movie_id: str, movie: UpcomingMovieUpdate):
         # Filter out None values
         update_data = {k: v for k, v in movie.dict().items() if v is not None}
         
-        response = supabase.table("upcoming_movies").update(update_data).eq("id", movie_id).execute()
+        response = await db.table("upcoming_movies").update(update_data).eq("id", movie_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Upcoming movie not found")
         return response.data[0]
@@ -79,7 +79,7 @@ async def update_upcoming_movie(movie_id: str, movie: UpcomingMovieUpdate):
 async def delete_upcoming_movie(movie_id: str):
     """Delete an upcoming movie"""
     try:
-        response = supabase.table("upcoming_movies").delete().eq("id", movie_id).execute()
+        response = await db.table("upcoming_movies").delete().eq("id", movie_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Upcoming movie not found")
         return {"message": "Upcoming movie deleted successfully"}
@@ -1,10 +1,11 @@
 # User Profile and Auth Routes
 from fastapi import APIRouter, Depends, HTTPException, status
-from database import supabase
+from database import db
 from auth_middleware import get_current_user, AuthUser
 from auth_models import UserProfile, ProfileUpdate, UserBooking
 from typing import List
-from rate_limiter import limiter
+from rate_limiter import limit_per_client
+import direct_db
 from fastapi import Request
 
 router = APIRouter(
@@ -12,12 +13,11 @@ router = APIRouter(
     tags=["users"],
 )
 
-@router.get("/profile", response_model=UserProfile)
-@limiter.limit("30/minute")
+@router.get("/profile", response_model=UserProfile, dependencies=[Depends(limit_per_client("profile_read", "30/minute"))])
 async def get_profile(request: Request, user: AuthUser = Depends(get_current_user)):
     """Get current user's profile"""
     try:
-        response = supabase.table("user_profiles").select("*").eq("id", user.id).single().execute()
+        response = await db.table("user_profiles").select("*").eq("id", user.id).single().execute()
         
         if not response.data:
             raise HTTPException(
@@ -32,8 +32,7 @@ async def get_profile(request: Request, user: AuthUser = Depends(get_current_use
             detail=f"Error fetching profile: {str(e)}"
         )
 
-@router.put("/profile", response_model=UserProfile)
-@limiter.limit("10/minute")
+@router.put("/profile", response_model=UserProfile, dependencies=[Depends(limit_per_client("profile_update", "10/minute"))])
 async def update_profile(
     request: Request,
     profile_update: ProfileUpdate,
@@ -51,7 +50,7 @@ async def update_profile(
             )
         
         # Update profile
-        response = supabase.table("user_profiles").update(update_data).eq("id", user.id).execute()
+        response = await db.table("user_profiles").update(update_data).eq("id", user.id).execute()
         
         if not response.data:
             raise HTTPException(
@@ -68,13 +67,18 @@ async def update_profile(
             detail=f"Error updating profile: {str(e)}"
         )
 
-@router.get("/bookings", response_model=List[UserBooking])
-@limiter.limit("30/minute")
+@router.get("/bookings", response_model=List[UserBooking], dependencies=[Depends(limit_per_client("user_bookings", "30/minute"))])
 async def get_user_bookings(request: Request, user: AuthUser = Depends(get_current_user)):
     """Get current user's booking history"""
     try:
+        if direct_db.enabled():
+            try:
+                return await direct_db.fetch_user_bookings(user.id)
+            except Exception as e:
+                print(f"⚠️ Direct SQL read failed, falling back to PostgREST: {e}")
+        
         # Use the database function we created
-        response = supabase.rpc("get_user_bookings", {"user_uuid": user.id}).execute()
+        response = await db.rpc("get_user_bookings", {"user_uuid": user.id}).execute()
         
         if not response.data:
             return []
@@ -86,8 +90,7 @@ async def get_user_bookings(request: Request, user: AuthUser = Depends(get_curre
             detail=f"Error fetching bookings: {str(e)}"
         )
 
-@router.delete("/account")
-@limiter.limit("5/minute")
+@router.delete("/account", dependencies=[Depends(limit_per_client("account_delete", "5/minute"))])
 async def delete_account(request: Request, user: AuthUser = Depends(get_current_user)):
     """Delete user account (soft delete - marks as inactive)"""
     try:
@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from pydantic import BaseModel
+import waiting_room
+from auth_middleware import require_admin
+
+router = APIRouter(
+    prefix="/queue",
+    tags=["waiting-room"],
+)
+
+class QueueModeRequest(BaseModel):
+    rate_per_second: float = 5.0
+
+class QueueJoinRequest(BaseModel):
+    user_session: str
+
+@router.post("/{showtime_id}/enable", dependencies=[Depends(require_admin)])
+async def enable_queue(showtime_id: str, request: QueueModeRequest):
+    """
+    Put a showtime in queue mode, admitting rate_per_second sessions per
+    second. Admin only; needs WAITING_ROOM_SECRET to sign admission tokens.
+    """
+    if request.rate_per_second <= 0:
+        raise HTTPException(status_code=400, detail="rate_per_second must be positive")
+    if not waiting_room.configured():
+        raise HTTPException(status_code=503, detail="Waiting room is not configured (WAITING_ROOM_SECRET)")
+    try:
+        await waiting_room.enable_queue(showtime_id, request.rate_per_second)
+        return {"showtime_id": showtime_id, "queue_mode": True, "rate_per_second": request.rate_per_second}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{showtime_id}", dependencies=[Depends(require_admin)])
+async def disable_queue(showtime_id: str):
+    """Take a showtime out of queue mode (admin only)"""
+    try:
+        await waiting_room.disable_queue(showtime_id)
+        return {"showtime_id": showtime_id, "queue_mode": False}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{showtime_id}/join")
+async def join_queue(showtime_id: str, request: QueueJoinRequest, response: Response):
+    """
+    Join a showtime's queue (idempotent per session).
+    Outside queue mode the session is admitted straight away.
+    """
+    try:
+        response.headers["Cache-Control"] = "no-store"
+        return await waiting_room.queue_status(showtime_id, request.user_session, join=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{showtime_id}/status")
+async def queue_status(showtime_id: str, user_session: str, response: Response):
+    """
+    Poll position in the queue; one Redis call, no database access.
+    Once admitted, the response carries the admission token to send as
+    X-Admission-Token to the seat and booking endpoints.
+    """
+    try:
+        response.headers["Cache-Control"] = "no-store"
+        return await waiting_room.queue_status(showtime_id, user_session)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
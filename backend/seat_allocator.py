@@ -0,0 +1,223 @@
+"""
+Best-available seat allocation.
+
+Finds the best block of adjacent free seats for a party in a showtime's
+seat-state bitmaps, then takes it with the usual all-or-nothing lock
+script. Concurrent bookers would all plan the same block, so each picks
+at random among the few best non-overlapping blocks; one that loses the
+race re-plans from fresh state with its failed blocks ruled out.
+
+Each row is scanned as an integer bitmask (bit cols-1-c is column c):
+AND-ing the row's free mask with itself shifted 1..n-1 places leaves a
+bit p set wherever n free seats start, at column cols-n-p. Blocks that
+would straddle an aisle are masked out, and the most central start is
+found with two bit tricks, so a row costs O(n) big-int operations
+however wide it is.
+"""
+
+import functools
+import random
+from typing import Iterable, List, Optional, Set, Tuple
+
+import redis_client
+import seat_state
+from seat_state import SeatLayout
+
+MAX_PARTY_SIZE = 10
+CENTRE_ROW_FRACTION = 0.6  # ideal row, as a fraction of the way from the screen to the back
+ROW_WEIGHT = 1.5  # one row off the ideal costs as much as 1.5 seats off centre
+ALLOCATION_ATTEMPTS = 5  # re-plans when the chosen block is locked first by someone else
+ALLOCATION_SPREAD = 8  # concurrent bookers pick among this many of the best blocks (doubled per retry)
+ALLOCATION_SLACK = 3.0  # ...as long as they score within this much of the best one (x attempt^2)
+
+@functools.lru_cache(maxsize=1024)
+def _block_starts(cols: int, aisles: tuple, party_size: int, allow_aisle_split: bool) -> int:
+    """Mask of block starts (bit cols-n-c for start column c) allowed by the row's aisles"""
+    mask = 0
+    for c in range(cols - party_size + 1):
+        # Aisle `a` is the gap between columns a-1 and a (0-based)
+        if allow_aisle_split or not any(c < a <= c + party_size - 1 for a in aisles):
+            mask |= 1 << (cols - party_size - c)
+    return mask
+
+def _nearest_bit(mask: int, target: float) -> int:
+    """Index of the set bit in `mask` closest to `target`"""
+    floor = int(target)
+    below = mask & ((2 << floor) - 1)
+    above = mask >> (floor + 1)
+    candidates = []
+    if below:
+        candidates.append(below.bit_length() - 1)
+    if above:
+        candidates.append((above & -above).bit_length() + floor)
+    return min(candidates, key=lambda p: abs(p - target))
+
+def _row_order(layout: SeatLayout, rows: Iterable[int], centre: bool) -> List[int]:
+    rows = [row for row in rows if 0 <= row < layout.rows]
+    if not centre:
+        return rows
+    ideal = (layout.rows - 1) * CENTRE_ROW_FRACTION
+    return sorted(rows, key=lambda row: abs(row - ideal))
+
+def find_best_block(
+    layout: SeatLayout,
+    unavailable: int,
+    party_size: int,
+    premium: bool = False,
+    centre: bool = True,
+    allow_aisle_split: bool = False,
+) -> Optional[List[str]]:
+    """
+    Best block of `party_size` adjacent seats that are free in `unavailable`
+    (a SeatState bitmap), or None.
+
+    centre: closest to the middle of the hall (ROW_WEIGHT trades rows
+    against seats); otherwise the first block front-to-back, left-to-right.
+    premium: only consider the layout's premium_rows.
+    allow_aisle_split: let the block span an aisle.
+    """
+    cols = layout.cols
+    if party_size < 1 or party_size > cols:
+        return None
+    full_row = (1 << cols) - 1
+    starts = _block_starts(cols, tuple(layout.aisles), party_size, allow_aisle_split)
+    ideal_row = (layout.rows - 1) * CENTRE_ROW_FRACTION
+    ideal_start = (cols - party_size) / 2
+
+    best = None  # (score, row, p)
+    for row in _row_order(layout, layout.premium_rows if premium else range(layout.rows), centre):
+        row_cost = ROW_WEIGHT * abs(row - ideal_row)
+        if best is not None and (not centre or row_cost >= best[0]):
+            # Rows are visited best-first, so nothing further can win
+            break
+        free = ~(unavailable >> ((layout.rows - 1 - row) * cols)) & full_row
+        fits = free
+        for shift in range(1, party_size):
+            fits &= free >> shift
+        fits &= starts
+        if not fits:
+            continue
+        if centre:
+            p = _nearest_bit(fits, ideal_start)
+            score = row_cost + abs(p - ideal_start)
+        else:
+            p = fits.bit_length() - 1  # leftmost
+            score = row
+        if best is None or score < best[0]:
+            best = (score, row, p)
+
+    if best is None:
+        return None
+    _, row, p = best
+    first = row * cols + (cols - party_size - p)
+    return layout.seat_ids[first:first + party_size]
+
+def ranked_blocks(
+    layout: SeatLayout,
+    unavailable: int,
+    party_size: int,
+    premium: bool = False,
+    centre: bool = True,
+    allow_aisle_split: bool = False,
+    limit: int = ALLOCATION_SPREAD,
+) -> List[Tuple[float, List[str]]]:
+    """
+    Up to `limit` non-overlapping (score, seats) blocks, best first (lower
+    score is better; same preferences as find_best_block). Scores every
+    start position, so it is for picking among candidates, not for
+    checking whether one exists.
+    """
+    cols = layout.cols
+    if party_size < 1 or party_size > cols:
+        return []
+    full_row = (1 << cols) - 1
+    starts = _block_starts(cols, tuple(layout.aisles), party_size, allow_aisle_split)
+    ideal_row = (layout.rows - 1) * CENTRE_ROW_FRACTION
+    ideal_start = (cols - party_size) / 2
+
+    scored = []  # (score, first seat offset)
+    for row in _row_order(layout, layout.premium_rows if premium else range(layout.rows), centre):
+        free = ~(unavailable >> ((layout.rows - 1 - row) * cols)) & full_row
+        fits = free
+        for shift in range(1, party_size):
+            fits &= free >> shift
+        fits &= starts
+        while fits:
+            low = fits & -fits
+            p = low.bit_length() - 1
+            fits ^= low
+            c = cols - party_size - p
+            if centre:
+                score = ROW_WEIGHT * abs(row - ideal_row) + abs(p - ideal_start)
+            else:
+                score = row * cols + c
+            scored.append((score, row * cols + c))
+    scored.sort()
+
+    blocks = []
+    taken = set()
+    for score, first in scored:
+        offsets = range(first, first + party_size)
+        if taken.isdisjoint(offsets):
+            taken.update(offsets)
+            blocks.append((score, layout.seat_ids[first:first + party_size]))
+            if len(blocks) == limit:
+                break
+    return blocks
+
+def has_block(layout: SeatLayout, unavailable: int, party_size: int) -> bool:
+    """Whether some row still has `party_size` adjacent free seats (not split by an aisle)"""
+    return find_best_block(layout, unavailable, party_size, centre=False) is not None
+
+async def showtimes_with_block(showtime_ids: List[str], party_size: int) -> Set[str]:
+    """The showtimes that can still seat a party together, from one pipelined bitmap read"""
+    states = await seat_state.get_seat_states(showtime_ids)
+    return {
+        showtime_id for showtime_id, state in states.items()
+        if has_block(state.layout, state.unavailable, party_size)
+    }
+
+async def allocate_best_available(
+    showtime_id: str,
+    party_size: int,
+    user_session: str,
+    customer_email: str,
+    premium: bool = False,
+    centre: bool = True,
+    allow_aisle_split: bool = False,
+) -> dict:
+    """
+    Pick and lock one of the best blocks for a party: a random one of the
+    top ALLOCATION_SPREAD within ALLOCATION_SLACK of the best, so bookers
+    planning at the same moment mostly pick different blocks. Both widen
+    with every lost race.
+    Returns lock_seats' result: {"success", "locked_seats", "failed_seats", "message"}.
+    """
+    lost: List[str] = []  # blocks taken by someone else since we read them
+    for attempt in range(ALLOCATION_ATTEMPTS):
+        state = await seat_state.get_seat_state(showtime_id)
+        unavailable = state.unavailable | state.layout.to_int(state.layout.to_bitmap(lost))
+        # Each lost race widens the choice, so contenders spread out faster
+        blocks = ranked_blocks(state.layout, unavailable, party_size, premium, centre, allow_aisle_split,
+                               limit=ALLOCATION_SPREAD << attempt)
+        if not blocks:
+            kind = "premium " if premium else ""
+            return {
+                "success": False,
+                "locked_seats": [],
+                "failed_seats": [],
+                "message": f"No block of {party_size} adjacent {kind}seats is available",
+            }
+        best = blocks[0][0]
+        slack = ALLOCATION_SLACK * (attempt + 1) ** 2
+        seats = random.choice([seats for score, seats in blocks if score <= best + slack])
+        result = await redis_client.lock_seats(showtime_id, seats, user_session, customer_email)
+        if result["success"]:
+            return result
+        lost.extend(seats)
+    return {
+        "success": False,
+        "locked_seats": [],
+        "failed_seats": [],
+        "message": "Seats are selling fast and the best block was taken; please try again",
+    }
@@ -0,0 +1,151 @@
+"""
+Real-time seat-map push.
+
+The seat scripts publish every change to a showtime's seats as a delta
+on its pub/sub channel (redis_client.seat_events_channel), atomically with
+the change itself:
+
+    {"type": "locked" | "unlocked" | "sold" | "expired", "seats": [...], "version": "..."}
+    {"type": "resync", "version": "..."}    state rebuilt; re-read the whole map
+
+Each worker holds one pattern subscription and fans events out to its
+own SSE clients, so a lock taken on one worker reaches subscribers on
+every other. Lock expiry has no write to hang an event on, so a sweeper
+(one worker per tick, via a Redis lock) prunes expired locks for every
+showtime in redis_client.LOCKED_SHOWTIMES_KEY, which publishes "expired".
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, Set
+
+import redis_client
+import seat_state
+from redis_client import LOCKED_SHOWTIMES_KEY, PRUNE_EXPIRED_LOCKS, seat_keys
+
+SEAT_EVENTS_PATTERN = "seat_events:*"
+SWEEP_INTERVAL = float(os.environ.get("SEAT_SWEEP_INTERVAL", "2"))  # seconds between expiry sweeps
+STREAM_HEARTBEAT = 15  # seconds between keep-alive comments on an idle stream
+SUBSCRIBER_QUEUE_SIZE = 100  # events buffered per client before it is told to resync
+
+# Prunes a showtime's expired locks (publishing "expired") and drops it
+# from the sweep set once it has no locks left.
+# KEYS[1..5]: as redis_client.seat_keys, KEYS[6]: sweep set
+# ARGV[1]: now, ARGV[2]: showtime id
+# Returns the number of locks that expired.
+SWEEP_SCRIPT = """
+local now = tonumber(ARGV[1])
+""" + PRUNE_EXPIRED_LOCKS + """
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[6], ARGV[2])
+end
+return #expired
+"""
+
+_sweep_script = redis_client.redis_client.register_script(SWEEP_SCRIPT)
+
+# showtime_id -> queues of this worker's connected clients
+_subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+def _deliver(showtime_id: str, event: dict):
+    for queue in _subscribers.get(showtime_id, ()):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop its backlog, a fresh snapshot replaces it
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync"})
+
+def _resync_all():
+    for showtime_id in list(_subscribers):
+        _deliver(showtime_id, {"type": "resync"})
+
+async def listen_for_seat_events():
+    """
+    Fan seat deltas from Redis out to this worker's stream subscribers.
+    Runs for the lifetime of the worker (started from the app lifespan).
+    """
+    while True:
+        pubsub = redis_client.redis_client.pubsub()
+        try:
+            await pubsub.psubscribe(SEAT_EVENTS_PATTERN)
+            # Anything published while we were disconnected is lost
+            _resync_all()
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                showtime_id = message["channel"].split(":", 1)[1]
+                if showtime_id in _subscribers:
+                    _deliver(showtime_id, json.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Seat event listener error: {e}. Reconnecting.")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+async def sweep_expired_locks_once() -> int:
+    """Prune expired locks in every showtime that has some. Returns how many expired."""
+    expired = 0
+    for showtime_id in await redis_client.redis_client.smembers(LOCKED_SHOWTIMES_KEY):
+        expired += int(await _sweep_script(
+            keys=seat_keys(showtime_id, []) + [LOCKED_SHOWTIMES_KEY],
+            args=[int(time.time()), showtime_id],
+        ))
+    return expired
+
+async def sweep_expired_locks():
+    """Run the expiry sweep every SWEEP_INTERVAL on whichever worker takes the tick"""
+    while True:
+        try:
+            if await redis_client.redis_client.set(
+                "seat_lock_sweeper", 1, nx=True, px=int(SWEEP_INTERVAL * 1000)
+            ):
+                await sweep_expired_locks_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Seat lock sweep failed: {e}")
+        await asyncio.sleep(SWEEP_INTERVAL)
+
+def _sse(event: str, data: dict, event_id: str = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+async def stream_seat_events(showtime_id: str) -> AsyncIterator[str]:
+    """
+    Server-sent events for one showtime: a "snapshot" (the /seats/available
+    payload plus version), then one event per delta. Deltas already covered
+    by the latest snapshot are skipped; "resync" sends a new snapshot.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    # Subscribe before reading the snapshot so no delta falls in between
+    _subscribers.setdefault(showtime_id, set()).add(queue)
+    try:
+        state = await seat_state.get_seat_state(showtime_id)
+        version = int(state.version)
+        yield _sse("snapshot", {**state.to_response(), "version": state.version}, state.version)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event["type"] == "resync":
+                state = await seat_state.get_seat_state(showtime_id)
+                version = int(state.version)
+                yield _sse("snapshot", {**state.to_response(), "version": state.version}, state.version)
+            elif int(event["version"]) > version:
+                version = int(event["version"])
+                yield _sse(event["type"], event, event["version"])
+    finally:
+        subscribers = _subscribers.get(showtime_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del _subscribers[showtime_id]
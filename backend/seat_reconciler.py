@@ -0,0 +1,71 @@
+"""
+Corrects drift between the seat-state projection and Supabase.
+
+The sold bitmap (and so the listing's sold counts) is written through by
+confirm_seats, which can miss a booking if Redis was unreachable at
+confirm time, and never sees bookings changed directly in the database.
+The held bitmap can likewise disagree with the lock index after a
+partial failure. Every RECONCILE_INTERVAL one worker (holding a Redis
+lock) compares each upcoming showtime's bitmaps with Supabase's paid
+seats and the live locks, and rebuilds whichever is off.
+"""
+
+import asyncio
+import os
+from typing import Dict
+
+import redis_client
+import seat_state
+
+SEAT_RECONCILER_ENABLED = os.environ.get("SEAT_RECONCILER_ENABLED", "true").lower() == "true"
+RECONCILE_INTERVAL = int(os.environ.get("SEAT_RECONCILE_INTERVAL", "600"))  # seconds
+
+async def reconcile_showtime(showtime_id: str, layout: seat_state.SeatLayout) -> Dict[str, int]:
+    """Rebuild a showtime's sold/held bitmaps if they disagree with their sources"""
+    drift = {"sold": 0, "held": 0}
+
+    # Supabase first, then the bitmap: a sale confirmed in between shows up
+    # in both rather than as drift
+    sold_in_db = layout.to_int(layout.to_bitmap(await seat_state.fetch_sold_seats(showtime_id)))
+    sold = layout.to_int(await redis_client.redis_bytes_client.get(redis_client.sold_bitmap_key(showtime_id)))
+    if sold_in_db != sold:
+        drift["sold"] = bin(sold_in_db ^ sold).count("1")
+        await seat_state.rebuild_sold(showtime_id, layout)
+
+    # Compared and rebuilt inside one script, so lock traffic isn't drift
+    drift["held"] = await seat_state.rebuild_held(showtime_id)
+    return drift
+
+async def reconcile_once() -> Dict[str, Dict[str, int]]:
+    """Reconcile every upcoming showtime. Returns drift found, by showtime."""
+    from cache_middleware import cached_json
+    from routers.showtimes import list_showtimes
+    showtimes = await cached_json(list_showtimes, include_expired=False)
+    states = await seat_state.get_seat_states([s["id"] for s in showtimes])
+    drifted = {}
+    for showtime_id, state in states.items():
+        try:
+            drift = await reconcile_showtime(showtime_id, state.layout)
+        except Exception as e:
+            print(f"⚠️ Seat reconcile failed for showtime {showtime_id}: {e}")
+            continue
+        if any(drift.values()):
+            drifted[showtime_id] = drift
+    return drifted
+
+async def run_seat_reconciler():
+    """Reconcile on one worker every RECONCILE_INTERVAL until cancelled"""
+    if not SEAT_RECONCILER_ENABLED:
+        return
+    while True:
+        try:
+            if await redis_client.redis_client.set("seat_reconciler", 1, nx=True, ex=RECONCILE_INTERVAL):
+                drifted = await reconcile_once()
+                for showtime_id, drift in drifted.items():
+                    print(f"🔧 Seat state drift fixed for showtime {showtime_id}: "
+                          f"{drift['sold']} sold, {drift['held']} held seat(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Seat reconcile failed: {e}")
+        await asyncio.sleep(RECONCILE_INTERVAL)
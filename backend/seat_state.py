@@ -0,0 +1,531 @@
+"""
+Per-showtime seat state kept as Redis bitmaps.
+
+Each showtime's seats, taken from its screen's seat_layout
+({rows, cols, aisles, premium_rows}), are given fixed bit offsets in
+row-major order: seat "B3" in a 10-column layout is offset 1 * 10 + 2.
+Two bitmaps track occupancy:
+
+    seat_sold:{showtime_id}   paid seats
+    seat_held:{showtime_id}   seats under an active lock (see redis_client)
+
+Availability reads fetch layout and both bitmaps in one scripted call
+and never touch Supabase once the showtime is warm. The sold bitmap is a
+write-through projection of paid bookings: confirm_seats updates it when
+a booking is saved, and rebuild_sold recreates it from Supabase.
+
+Every change to a showtime's seats bumps its seat version
+(redis_client.seat_version_key), which seat endpoints use as their ETag,
+and is published as a delta on the showtime's seat_events channel (see
+seat_events).
+
+Nothing is stored for ids that aren't showtimes: reads of those raise
+404, and the miss is remembered briefly so repeats don't reach Supabase.
+"""
+
+import asyncio
+import base64
+import functools
+import json
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+import direct_db
+import redis_client
+from database import db
+from redis_client import (
+    held_bitmap_key,
+    sold_bitmap_key,
+    seat_offsets_key,
+    seat_keys,
+    BUMP_SEAT_VERSION,
+    PRUNE_EXPIRED_LOCKS,
+)
+
+SEAT_STATE_TTL = 86400  # 24 hours; rebuilt from Supabase after expiry
+MISSING_SHOWTIME_TTL = 60  # seconds an unknown showtime id is remembered as missing
+FILLING_FAST_RATIO = 0.8  # share of seats sold or held at which a showtime is "filling fast"
+
+# Used when a screen has no usable seat_layout (rows A-H, seats 1-12).
+# The frontend draws whatever layout /showtimes/{id} returns, so the two
+# always agree.
+DEFAULT_LAYOUT = {"rows": 8, "cols": 12, "aisles": [], "premium_rows": []}
+
+def layout_key(showtime_id: str) -> str:
+    """Compiled seat layout JSON for one showtime"""
+    return f"seat_layout:{showtime_id}"
+
+def missing_showtime_key(showtime_id: str) -> str:
+    """Set briefly when a showtime id was looked up and doesn't exist"""
+    return f"seat_layout_missing:{showtime_id}"
+
+def showtime_not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Showtime not found")
+
+def row_label(index: int) -> str:
+    """0 -> "A", 25 -> "Z", 26 -> "AA" ..."""
+    label = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        label = chr(ord("A") + remainder) + label
+    return label
+
+class SeatLayout:
+    """Maps a screen's seat_layout onto fixed bit offsets"""
+    def __init__(self, rows: int, cols: int, aisles: List[int] = None, premium_rows: List[int] = None):
+        self.rows = rows
+        self.cols = cols
+        # An aisle value `a` is a gap between seat number `a` and `a + 1`
+        self.aisles = sorted(aisles or [])
+        self.premium_rows = sorted(premium_rows or [])
+        self.seat_ids = [
+            f"{row_label(row)}{col + 1}"
+            for row in range(rows)
+            for col in range(cols)
+        ]
+        self.offsets: Dict[str, int] = {seat: i for i, seat in enumerate(self.seat_ids)}
+
+    @property
+    def capacity(self) -> int:
+        return self.rows * self.cols
+
+    @property
+    def byte_length(self) -> int:
+        return (self.capacity + 7) // 8
+
+    def offset(self, seat: str) -> Optional[int]:
+        return self.offsets.get(seat)
+
+    def invalid_seats(self, seats: List[str]) -> List[str]:
+        """Seat ids that have no place in this layout"""
+        return [seat for seat in seats if seat not in self.offsets]
+
+    def to_dict(self) -> dict:
+        return json.loads(self.to_json())
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "rows": self.rows,
+            "cols": self.cols,
+            "aisles": self.aisles,
+            "premium_rows": self.premium_rows,
+        })
+
+    def to_bitmap(self, seats: List[str]) -> bytes:
+        """Pack seat ids into a Redis-compatible bitmap (offset 0 is the MSB of byte 0)"""
+        bits = bytearray(self.byte_length)
+        for seat in seats:
+            offset = self.offsets.get(seat)
+            if offset is not None:
+                bits[offset >> 3] |= 0x80 >> (offset & 7)
+        return bytes(bits)
+
+    def to_int(self, bitmap: Optional[bytes]) -> int:
+        """Bitmap as an integer whose bit (capacity - 1 - offset) is the seat at offset"""
+        bitmap = (bitmap or b"")[:self.byte_length].ljust(self.byte_length, b"\0")
+        return int.from_bytes(bitmap, "big") >> (self.byte_length * 8 - self.capacity)
+
+    def from_int(self, value: int) -> bytes:
+        return (value << (self.byte_length * 8 - self.capacity)).to_bytes(self.byte_length, "big")
+
+    def seats_in(self, value: int) -> List[str]:
+        """Seat ids whose bit is set in an integer from to_int"""
+        seats = []
+        top = self.capacity - 1
+        while value:
+            low = value & -value
+            seats.append(self.seat_ids[top - low.bit_length() + 1])
+            value ^= low
+        seats.reverse()
+        return seats
+
+@functools.lru_cache(maxsize=256)
+def compile_layout(layout_json: str) -> SeatLayout:
+    """Compile a stored layout; cached because layouts rarely change"""
+    data = json.loads(layout_json)
+    return SeatLayout(
+        rows=int(data["rows"]),
+        cols=int(data["cols"]),
+        aisles=data.get("aisles") or [],
+        premium_rows=data.get("premium_rows") or [],
+    )
+
+class SeatState:
+    """Snapshot of one showtime's sold and held bitmaps, at a seat version"""
+    def __init__(self, showtime_id: str, layout: SeatLayout, sold: int, held: int, version: Optional[str] = None):
+        self.showtime_id = showtime_id
+        self.layout = layout
+        self.sold = sold
+        self.held = held
+        self.version = version
+
+    @property
+    def unavailable(self) -> int:
+        return self.sold | self.held
+
+    def _is_set(self, value: int, seat: str) -> Optional[bool]:
+        offset = self.layout.offset(seat)
+        if offset is None:
+            return None
+        return bool((value >> (self.layout.capacity - 1 - offset)) & 1)
+
+    def is_available(self, seat: str) -> bool:
+        """False for held, sold, or seats outside the layout"""
+        return self._is_set(self.unavailable, seat) is False
+
+    def is_sold(self, seat: str) -> bool:
+        return bool(self._is_set(self.sold, seat))
+
+    def to_response(self, bitmap: bool = False) -> dict:
+        """Availability payload; bitmaps are base64 so large halls ship as bytes"""
+        if bitmap:
+            return {
+                "showtime_id": self.showtime_id,
+                "layout": self.layout.to_dict(),
+                "encoding": "base64-bitmap",
+                "booked_bitmap": base64.b64encode(self.layout.from_int(self.sold)).decode(),
+                "locked_bitmap": base64.b64encode(self.layout.from_int(self.held)).decode(),
+            }
+        return {
+            "showtime_id": self.showtime_id,
+            "locked_seats": self.layout.seats_in(self.held & ~self.sold),
+            "booked_seats": self.layout.seats_in(self.sold),
+            "unavailable_seats": self.layout.seats_in(self.unavailable),
+        }
+
+    def occupancy(self) -> dict:
+        """Seat counts for listings ("X seats left", "filling fast")"""
+        capacity = self.layout.capacity
+        sold = bin(self.sold).count("1")
+        held = bin(self.held & ~self.sold).count("1")
+        available = capacity - sold - held
+        return {
+            "capacity": capacity,
+            "sold": sold,
+            "held": held,
+            "available": available,
+            "filling_fast": capacity > 0 and available <= capacity * (1 - FILLING_FAST_RATIO),
+        }
+
+# Prunes expired locks, then returns {layout JSON, sold bitmap, held bitmap,
+# seat version}. Missing bitmaps/layout come back as false; the version is
+# only seeded once the layout is stored, so unknown ids leave nothing behind.
+# KEYS[1..5]: as redis_client.seat_keys, KEYS[6]: layout; ARGV[1]: now
+READ_STATE_SCRIPT = """
+local now = tonumber(ARGV[1])
+""" + PRUNE_EXPIRED_LOCKS + """
+if not redis.call('GET', KEYS[5]) and redis.call('EXISTS', KEYS[6]) == 1 then
+    bump_seat_version()
+end
+return {
+    redis.call('GET', KEYS[6]),
+    redis.call('GET', KEYS[4]),
+    redis.call('GET', KEYS[2]),
+    redis.call('GET', KEYS[5]),
+}
+"""
+
+# Prunes expired locks and returns the seat version, without reading state
+# (false if the layout isn't stored, as in READ_STATE_SCRIPT).
+# KEYS: as READ_STATE_SCRIPT; ARGV[1]: now
+SEAT_VERSION_SCRIPT = """
+local now = tonumber(ARGV[1])
+""" + PRUNE_EXPIRED_LOCKS + """
+if not redis.call('GET', KEYS[5]) and redis.call('EXISTS', KEYS[6]) == 1 then
+    bump_seat_version()
+end
+return redis.call('GET', KEYS[5])
+"""
+
+# Bumps the seat version after state is rebuilt outside the seat scripts;
+# subscribers get a "resync" event telling them to re-read the whole map.
+# KEYS: as redis_client.seat_keys (no seats)
+BUMP_VERSION_SCRIPT = BUMP_SEAT_VERSION + """
+publish_seat_event('resync')
+return redis.call('GET', KEYS[5])
+"""
+
+# Converts seats into sold seats in one step: sets their sold bits and
+# releases any lock on them (whoever holds it, since the seat is now paid).
+# If the sold bitmap hasn't been built, or the offsets have expired, the
+# bitmap is dropped and a dirty marker left so that an in-flight rebuild
+# doesn't store a snapshot taken before this sale.
+# KEYS[1..5]: as redis_client.seat_keys, KEYS[6]: dirty marker, KEYS[7..]: seat lock keys
+# ARGV[1]: dirty marker TTL
+# Returns 1 if the projection was updated, 0 if it will be rebuilt.
+CONFIRM_SEATS_SCRIPT = BUMP_SEAT_VERSION + """
+local projected = 1
+local sold = {}
+if redis.call('EXISTS', KEYS[4]) == 0 or redis.call('EXISTS', KEYS[3]) == 0 then
+    redis.call('DEL', KEYS[4])
+    redis.call('SET', KEYS[6], 1, 'EX', ARGV[1])
+    projected = 0
+end
+for i = 7, #KEYS do
+    local seat = string.match(KEYS[i], '[^:]+$')
+    local offset = redis.call('HGET', KEYS[3], seat)
+    if offset then
+        redis.call('SETBIT', KEYS[2], offset, 0)
+        if projected == 1 then
+            redis.call('SETBIT', KEYS[4], offset, 1)
+        end
+    end
+    redis.call('DEL', KEYS[i])
+    redis.call('ZREM', KEYS[1], seat)
+    table.insert(sold, seat)
+end
+publish_seat_event('sold', sold)
+return projected
+"""
+
+# Stores a rebuilt sold bitmap unless a sale landed while it was being built.
+# KEYS[1]: sold bitmap, KEYS[2]: dirty marker; ARGV[1]: bitmap, ARGV[2]: TTL
+STORE_SOLD_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# Rebuilds the held bitmap from the lock index in one step, so a lock
+# taken meanwhile can't be overwritten, and only if the two disagree.
+# KEYS: as redis_client.seat_keys (no seats); ARGV[1]: now, ARGV[2]: held bitmap TTL
+# Returns the number of seats whose held bit was wrong.
+REBUILD_HELD_SCRIPT = """
+local now = tonumber(ARGV[1])
+""" + PRUNE_EXPIRED_LOCKS + """
+local expected = {}
+local matched = 0
+for _, seat in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '(' .. now, '+inf')) do
+    local offset = redis.call('HGET', KEYS[3], seat)
+    if offset then
+        table.insert(expected, offset)
+        matched = matched + redis.call('GETBIT', KEYS[2], offset)
+    end
+end
+local drift = (#expected - matched) + (redis.call('BITCOUNT', KEYS[2]) - matched)
+if drift > 0 then
+    redis.call('DEL', KEYS[2])
+    for _, offset in ipairs(expected) do
+        redis.call('SETBIT', KEYS[2], offset, 1)
+    end
+    if #expected > 0 then
+        redis.call('EXPIRE', KEYS[2], ARGV[2])
+    end
+    publish_seat_event('resync')
+end
+return drift
+"""
+
+REBUILD_GUARD_TTL = 60  # seconds a confirm blocks a concurrent rebuild
+
+_read_state_script = redis_client.redis_bytes_client.register_script(READ_STATE_SCRIPT)
+_confirm_seats_script = redis_client.redis_client.register_script(CONFIRM_SEATS_SCRIPT)
+_store_sold_script = redis_client.redis_bytes_client.register_script(STORE_SOLD_SCRIPT)
+_seat_version_script = redis_client.redis_client.register_script(SEAT_VERSION_SCRIPT)
+_bump_version_script = redis_client.redis_client.register_script(BUMP_VERSION_SCRIPT)
+_rebuild_held_script = redis_client.redis_client.register_script(REBUILD_HELD_SCRIPT)
+
+def sold_dirty_key(showtime_id: str) -> str:
+    """Set by a confirm that couldn't update the sold bitmap in place"""
+    return f"seat_sold_dirty:{showtime_id}"
+
+def _state_keys(showtime_id: str) -> List[str]:
+    return seat_keys(showtime_id, []) + [layout_key(showtime_id)]
+
+async def _fetch_layout(showtime_id: str) -> Optional[SeatLayout]:
+    """Load the showtime's screen layout from Supabase; None if there's no such showtime"""
+    try:
+        uuid.UUID(showtime_id)
+    except ValueError:
+        return None
+    found = None
+    if direct_db.enabled():
+        try:
+            found, seat_layout = await direct_db.fetch_seat_layout(showtime_id)
+        except Exception as e:
+            print(f"⚠️ Direct SQL read failed, falling back to PostgREST: {e}")
+    if found is None:
+        response = await db.table("showtimes").select("screen:screens(seat_layout)").eq("id", showtime_id).execute()
+        found = bool(response.data)
+        seat_layout = (response.data[0].get("screen") or {}).get("seat_layout") if found else None
+    if not found:
+        return None
+    layout = DEFAULT_LAYOUT
+    if isinstance(seat_layout, dict) and seat_layout.get("rows") and seat_layout.get("cols"):
+        layout = seat_layout
+    return compile_layout(json.dumps(layout, sort_keys=True))
+
+async def fetch_sold_seats(showtime_id: str) -> List[str]:
+    """Paid seats for a showtime, straight from Supabase"""
+    if direct_db.enabled():
+        try:
+            return await direct_db.fetch_sold_seats(showtime_id)
+        except Exception as e:
+            print(f"⚠️ Direct SQL read failed, falling back to PostgREST: {e}")
+    try:
+        # Indexed lookup on booking_seats(showtime_id, seat)
+        response = await db.table("booking_seats").select("seat").eq("showtime_id", showtime_id).execute()
+        return [row["seat"] for row in response.data or []]
+    except Exception as e:
+        print(f"booking_seats lookup failed, scanning bookings instead: {e}")
+
+    response = await db.table("bookings").select("seats").eq("showtime_id", showtime_id).eq("payment_status", "paid").execute()
+    sold = []
+    for booking in response.data or []:
+        seats = booking.get("seats", [])
+        if isinstance(seats, str):
+            seats = [s.strip() for s in seats.split(",")]
+        sold.extend(seats)
+    return sold
+
+async def ensure_layout(showtime_id: str) -> SeatLayout:
+    """
+    Make sure the showtime's layout and seat offsets are in Redis.
+    Call before locking: the lock script refuses seats without an offset.
+    Raises 404 if there's no such showtime.
+    """
+    pipe = redis_client.redis_client.pipeline(transaction=False)
+    pipe.get(layout_key(showtime_id))
+    pipe.exists(seat_offsets_key(showtime_id))
+    layout_json, has_offsets = await pipe.execute()
+    if layout_json and has_offsets:
+        return compile_layout(layout_json)
+    layout = await _load_layout(showtime_id)
+    if layout is None:
+        raise showtime_not_found()
+    return layout
+
+async def _load_layout(showtime_id: str) -> Optional[SeatLayout]:
+    """
+    Compile the layout from Supabase and store it (see store_layout).
+    None, with nothing stored but a short-lived miss, for unknown showtimes.
+    """
+    if await redis_client.redis_client.exists(missing_showtime_key(showtime_id)):
+        return None
+    layout = await _fetch_layout(showtime_id)
+    if layout is None:
+        await redis_client.redis_client.set(missing_showtime_key(showtime_id), 1, ex=MISSING_SHOWTIME_TTL)
+        return None
+    await store_layout(showtime_id, layout)
+    return layout
+
+async def store_layout(showtime_id: str, layout: SeatLayout):
+    """Write layout and offsets, then rebuild the held bitmap from any live locks"""
+    pipe = redis_client.redis_bytes_client.pipeline()
+    pipe.set(layout_key(showtime_id), layout.to_json(), ex=SEAT_STATE_TTL)
+    pipe.delete(seat_offsets_key(showtime_id))
+    pipe.hset(seat_offsets_key(showtime_id), mapping=layout.offsets)
+    pipe.expire(seat_offsets_key(showtime_id), SEAT_STATE_TTL)
+    await pipe.execute()
+    await rebuild_held(showtime_id)
+    await _bump_version_script(keys=seat_keys(showtime_id, []))
+
+async def rebuild_held(showtime_id: str) -> int:
+    """
+    Make the held bitmap match the lock index (atomically, so concurrent
+    locks are kept). Returns how many seats were wrong; 0 leaves it untouched.
+    """
+    return int(await _rebuild_held_script(
+        keys=seat_keys(showtime_id, []),
+        args=[int(time.time()), redis_client.SEAT_LOCK_TTL + redis_client.SEAT_INDEX_GRACE],
+    ))
+
+async def rebuild_sold(showtime_id: str, layout: Optional[SeatLayout] = None) -> bytes:
+    """
+    Rebuild the sold bitmap from Supabase (cold start, expiry, or repair).
+    Returns the bitmap; it is only stored if no booking was confirmed
+    while Supabase was being read.
+    """
+    layout = layout or await ensure_layout(showtime_id)
+    await redis_client.redis_client.delete(sold_dirty_key(showtime_id))
+    bitmap = layout.to_bitmap(await fetch_sold_seats(showtime_id))
+    stored = await _store_sold_script(
+        keys=[sold_bitmap_key(showtime_id), sold_dirty_key(showtime_id)],
+        args=[bitmap, SEAT_STATE_TTL],
+    )
+    if stored:
+        await _bump_version_script(keys=seat_keys(showtime_id, []))
+    return bitmap
+
+async def get_seat_state(showtime_id: str) -> SeatState:
+    """Read a showtime's seat state; one Redis round trip when warm. 404 if unknown."""
+    raw = await _read_state_script(keys=_state_keys(showtime_id), args=[int(time.time())])
+    state = await _seat_state_from(showtime_id, *raw)
+    if state is None:
+        raise showtime_not_found()
+    return state
+
+async def get_seat_states(showtime_ids: List[str]) -> Dict[str, SeatState]:
+    """
+    Seat state for many showtimes in one pipelined round trip. Showtimes
+    that aren't warm yet are loaded from Supabase concurrently; unknown
+    ids are left out.
+    """
+    if not showtime_ids:
+        return {}
+    now = int(time.time())
+    pipe = redis_client.redis_bytes_client.pipeline(transaction=False)
+    for showtime_id in showtime_ids:
+        await _read_state_script(keys=_state_keys(showtime_id), args=[now], client=pipe)
+    results = await pipe.execute()
+    states = await asyncio.gather(*(
+        _seat_state_from(showtime_id, *raw) for showtime_id, raw in zip(showtime_ids, results)
+    ))
+    return {showtime_id: state for showtime_id, state in zip(showtime_ids, states) if state is not None}
+
+async def _seat_state_from(showtime_id: str, layout_json, sold, held, version) -> Optional[SeatState]:
+    """
+    Build a SeatState from READ_STATE_SCRIPT's reply, loading whatever is
+    missing. None if there's no such showtime.
+    """
+    if layout_json:
+        layout = compile_layout(layout_json.decode())
+    else:
+        layout = await _load_layout(showtime_id)
+        if layout is None:
+            return None
+        _, sold, held, version = await _read_state_script(
+            keys=_state_keys(showtime_id), args=[int(time.time())],
+        )
+
+    if sold is None:
+        sold = await rebuild_sold(showtime_id, layout)
+
+    return SeatState(showtime_id, layout, layout.to_int(sold), layout.to_int(held), version.decode())
+
+def seat_etag(version: str, variant: str) -> str:
+    """Strong ETag for one representation (list, bitmap, sold) of a showtime's seat state"""
+    return f'"seats-{version}-{variant}"'
+
+async def get_seat_version(showtime_id: str) -> Optional[str]:
+    """
+    Current seat version (expired locks pruned first), for answering
+    conditional requests without reading the bitmaps. None until the
+    showtime's state has been loaded.
+    """
+    return await _seat_version_script(keys=_state_keys(showtime_id), args=[int(time.time())])
+
+async def get_sold_seats(showtime_id: str) -> List[str]:
+    """Paid seats for a showtime, from the sold projection"""
+    state = await get_seat_state(showtime_id)
+    return state.layout.seats_in(state.sold)
+
+async def confirm_seats(showtime_id: str, seats: List[str]) -> bool:
+    """
+    Write-through for a confirmed booking: mark the seats sold and release
+    their locks atomically. Call after the booking row is saved.
+    Raises ValueError for seats outside the showtime's layout, which the
+    bitmaps can't represent.
+    """
+    invalid = (await ensure_layout(showtime_id)).invalid_seats(seats)
+    if invalid:
+        raise ValueError(f"Seats {', '.join(invalid)} are not in showtime {showtime_id}'s seat layout")
+    keys = redis_client.seat_keys(showtime_id, seats)
+    keys.insert(5, sold_dirty_key(showtime_id))
+    return bool(await _confirm_seats_script(keys=keys, args=[REBUILD_GUARD_TTL]))
@@ -0,0 +1,56 @@
+"""
+Offline test setup: every Redis client the app creates talks to one
+in-memory fakeredis server (Lua scripts run through lupa), and Supabase
+gets placeholder credentials it never uses. Patched before any app module
+is imported, since those create their clients and scripts at import time.
+"""
+
+import asyncio
+import os
+import sys
+
+import fakeredis
+import pytest
+import redis.asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ["STRIPE_WEBHOOK_SECRET"] = "whsec_test"
+os.environ["SEAT_RECONCILER_ENABLED"] = "false"
+os.environ["CACHE_WARMER_ENABLED"] = "false"
+
+FAKE_REDIS = fakeredis.FakeServer()
+
+def _fake_from_url(cls, url, **kwargs):
+    kwargs.pop("max_connections", None)
+    pool = redis.asyncio.ConnectionPool(
+        connection_class=fakeredis.FakeAsyncRedisConnection, server=FAKE_REDIS, **kwargs
+    )
+    return cls(connection_pool=pool)
+
+redis.asyncio.Redis.from_url = classmethod(_fake_from_url)
+
+import redis_client  # noqa: E402  (must come after the patch)
+
+async def _reset_redis():
+    await redis_client.redis_client.flushall()
+    # Connections are bound to the event loop that opened them
+    await redis_client.redis_client.connection_pool.disconnect()
+    await redis_client.redis_bytes_client.connection_pool.disconnect()
+
+@pytest.fixture(autouse=True)
+def clean_redis():
+    """Each test starts from an empty Redis"""
+    asyncio.run(_reset_redis())
+    yield
+    asyncio.run(_reset_redis())
+
+async def seed_showtime(showtime_id: str, layout, sold=()):
+    """Store a showtime's layout and sold bitmap, as if loaded from Supabase"""
+    import seat_state
+    await seat_state.store_layout(showtime_id, layout)
+    await redis_client.redis_bytes_client.set(
+        redis_client.sold_bitmap_key(showtime_id), layout.from_int(layout.to_int(layout.to_bitmap(list(sold)))),
+    )
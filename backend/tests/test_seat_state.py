@@ -0,0 +1,124 @@
+"""
+Seat locks, expiry, best-available allocation and unknown showtimes,
+against fakeredis (see conftest).
+"""
+
+import asyncio
+import json
+import uuid
+from unittest import mock
+
+import pytest
+
+import redis_client
+import seat_allocator
+import seat_events
+import seat_state
+from conftest import seed_showtime
+
+LAYOUT = seat_state.SeatLayout(rows=8, cols=12)
+HALL = seat_state.SeatLayout(rows=20, cols=25, aisles=[5, 20], premium_rows=[12, 13, 14, 15])
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def lock(showtime_id, seats, user_session="session"):
+    return await redis_client.lock_seats(showtime_id, seats, user_session, "customer@example.com")
+
+def test_concurrent_overlapping_locks_have_one_winner():
+    async def scenario():
+        await seed_showtime("s1", LAYOUT)
+        results = await asyncio.gather(*(
+            lock("s1", ["C4", "C5", "C6"][i % 2:i % 2 + 2], f"session-{i}") for i in range(20)
+        ))
+        return results, await redis_client.get_locked_seats("s1")
+
+    results, locked = run(scenario())
+    winners = [r for r in results if r["success"]]
+    assert len(winners) == 1
+    assert sorted(locked) == sorted(winners[0]["locked_seats"])
+
+def test_sold_and_unknown_seats_are_refused():
+    async def scenario():
+        await seed_showtime("s1", LAYOUT, sold=["A1"])
+        return await lock("s1", ["A1", "A2"]), await lock("s1", ["A2", "Z99"])
+
+    sold, unknown = run(scenario())
+    assert not sold["success"] and not sold["invalid_seats"]
+    assert not unknown["success"] and unknown["invalid_seats"] == ["Z99"]
+
+def test_lapsed_locks_are_published_and_bump_the_version(monkeypatch):
+    monkeypatch.setattr(redis_client, "SEAT_LOCK_TTL", 1)
+
+    async def scenario():
+        await seed_showtime("s1", LAYOUT)
+        for seat in ("A1", "A2", "A3"):
+            assert (await lock("s1", [seat]))["success"]
+        before = await seat_state.get_seat_version("s1")
+        pubsub = redis_client.redis_client.pubsub()
+        await pubsub.subscribe(redis_client.seat_events_channel("s1"))
+        await pubsub.get_message(timeout=1)  # subscribe confirmation
+        await asyncio.sleep(2.1)
+        expired = await seat_events.sweep_expired_locks_once()
+        events = []
+        while message := await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1):
+            events.append(json.loads(message["data"]))
+        await pubsub.aclose()
+        state = await seat_state.get_seat_state("s1")
+        return expired, events, before, state
+
+    expired, events, before, state = run(scenario())
+    assert expired == 3
+    assert [event["type"] for event in events] == ["expired"]
+    assert sorted(events[0]["seats"]) == ["A1", "A2", "A3"]
+    assert state.version != before
+    assert state.layout.seats_in(state.held) == []
+
+def test_evicted_lock_index_still_moves_the_version():
+    async def scenario():
+        await seed_showtime("s1", LAYOUT)
+        await lock("s1", ["B2"])
+        before = await seat_state.get_seat_version("s1")
+        await redis_client.redis_client.delete(redis_client.lock_index_key("s1"))
+        after = await seat_state.get_seat_version("s1")
+        return before, after, await seat_state.get_seat_state("s1")
+
+    before, after, state = run(scenario())
+    assert before != after
+    assert state.layout.seats_in(state.held) == []
+
+def test_concurrent_best_available_fills_an_empty_hall():
+    async def scenario():
+        await seed_showtime("hall", HALL)
+        slots = asyncio.Semaphore(16)
+
+        async def book():
+            async with slots:
+                return await seat_allocator.allocate_best_available("hall", 4, str(uuid.uuid4()), "x@example.com")
+
+        return await asyncio.gather(*(book() for _ in range(60)))
+
+    results = run(scenario())
+    assert [r["message"] for r in results if not r["success"]] == []
+    seats = [seat for result in results for seat in result["locked_seats"]]
+    assert len(seats) == len(set(seats)) == 240
+
+@pytest.mark.parametrize("showtime_id", [str(uuid.uuid4()), "not-a-showtime"])
+def test_unknown_showtimes_leave_nothing_behind(showtime_id):
+    fetch = mock.AsyncMock(return_value=None)
+
+    async def scenario():
+        with mock.patch.object(seat_state, "_fetch_layout", fetch):
+            first = await seat_state.get_seat_states([showtime_id])
+            second = await seat_state.get_seat_states([showtime_id])
+            with pytest.raises(Exception) as missing:
+                await seat_state.get_seat_state(showtime_id)
+            version = await seat_state.get_seat_version(showtime_id)
+        return first, second, missing.value, version, await redis_client.redis_client.keys("*")
+
+    first, second, missing, version, keys = run(scenario())
+    assert first == second == {}
+    assert missing.status_code == 404
+    assert version is None
+    assert keys == [seat_state.missing_showtime_key(showtime_id)]
+    assert fetch.await_count == 1
@@ -0,0 +1,122 @@
+"""
+Stripe webhook -> booking stream -> worker, driven by the signed fixtures
+in stripe_fixtures/ (signed with the test secret, as replay_stripe_fixture
+does) against fakeredis. Supabase calls are replaced by fakes.
+"""
+
+import json
+import uuid
+from unittest import mock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import booking_pipeline
+import idempotency
+import redis_client
+import seat_state
+from conftest import seed_showtime
+from replay_stripe_fixture import build_event, stripe_signature
+from routers import bookings
+
+SHOWTIME_ID = str(uuid.uuid4())
+SEATS = ["E5", "E6"]
+LAYOUT = seat_state.SeatLayout(rows=8, cols=12)
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(bookings.router)
+    with TestClient(app) as client:
+        client.portal.call(seed_showtime, SHOWTIME_ID, LAYOUT)
+        yield client
+
+def post_event(client, event, secret="whsec_test"):
+    payload = json.dumps(event).encode()
+    return client.post("/bookings/webhook", content=payload, headers={
+        "Content-Type": "application/json",
+        "Stripe-Signature": stripe_signature(payload, secret),
+    })
+
+async def queued_events():
+    return await redis_client.redis_client.xrange(booking_pipeline.BOOKING_STREAM)
+
+async def lock(seats, user_session):
+    return await redis_client.lock_seats(SHOWTIME_ID, seats, user_session, "customer@example.com")
+
+async def process_queued():
+    """Hand every queued entry to the worker handler, like a booking worker would"""
+    for _, fields in await queued_events():
+        await booking_pipeline.handle_booking_event(fields)
+
+def test_signed_event_is_queued_once(client):
+    event = build_event("succeeded", SHOWTIME_ID, ",".join(SEATS))
+
+    response = post_event(client, event)
+    assert response.status_code == 200
+    assert response.json() == {"received": True, "queued": True}
+
+    entries = client.portal.call(queued_events)
+    assert len(entries) == 1
+    fields = entries[0][1]
+    assert fields["type"] == "payment_intent.succeeded"
+    assert json.loads(fields["payment_intent"])["id"] == event["data"]["object"]["id"]
+
+    # Stripe delivers at least once; a redelivery must not queue it again
+    assert post_event(client, event).json() == {"received": True, "queued": False}
+    assert len(client.portal.call(queued_events)) == 1
+
+def test_bad_signature_is_rejected(client):
+    event = build_event("succeeded", SHOWTIME_ID, ",".join(SEATS))
+    assert post_event(client, event, secret="whsec_wrong").status_code == 400
+    assert client.portal.call(queued_events) == []
+
+def test_other_event_types_are_ignored(client):
+    event = build_event("succeeded", SHOWTIME_ID, ",".join(SEATS))
+    event["type"] = "payment_intent.payment_failed"
+    assert post_event(client, event).json() == {"received": True, "queued": False}
+    assert client.portal.call(queued_events) == []
+
+def test_canceled_releases_seats_and_forgets_the_intent(client):
+    event = build_event("canceled", SHOWTIME_ID, ",".join(SEATS))
+    intent = event["data"]["object"]
+    session = intent["metadata"]["user_session"]
+    assert client.portal.call(lock, SEATS, session)["success"]
+    assert client.portal.call(redis_client.get_locked_seats, SHOWTIME_ID) != []
+
+    # The stored create-payment-intent response for this intent
+    key = idempotency.fingerprint({"request": "fixture"})
+    client.portal.call(idempotency.begin, "payment_intent", key)
+    client.portal.call(idempotency.complete, "payment_intent", key, {"id": intent["id"]}, intent["id"])
+
+    assert post_event(client, event).json() == {"received": True, "queued": True}
+    client.portal.call(process_queued)
+
+    assert client.portal.call(redis_client.get_locked_seats, SHOWTIME_ID) == []
+    state = client.portal.call(seat_state.get_seat_state, SHOWTIME_ID)
+    assert state.layout.seats_in(state.held) == []
+    status = client.portal.call(booking_pipeline.get_booking_status, intent["id"])
+    assert status["status"] == "failed"
+    # An identical retry creates a new intent instead of reusing the dead one
+    assert client.portal.call(idempotency.begin, "payment_intent", key) is None
+
+def test_succeeded_commits_booking_and_sells_seats(client):
+    event = build_event("succeeded", SHOWTIME_ID, ",".join(SEATS))
+    intent = event["data"]["object"]
+    assert client.portal.call(lock, SEATS, intent["metadata"]["user_session"])["success"]
+    assert post_event(client, event).json()["queued"]
+
+    booking = {"id": str(uuid.uuid4())}
+    commit = mock.AsyncMock(return_value={"booking": booking, "showtime": None})
+    with mock.patch.object(booking_pipeline, "find_booking_by_payment_intent", mock.AsyncMock(return_value=None)), \
+            mock.patch.object(booking_pipeline, "commit_booking", commit):
+        client.portal.call(process_queued)
+
+    assert commit.await_args.kwargs["seats"] == SEATS
+    assert commit.await_args.kwargs["payment_intent_id"] == intent["id"]
+    state = client.portal.call(seat_state.get_seat_state, SHOWTIME_ID)
+    assert state.layout.seats_in(state.sold) == SEATS
+    assert state.layout.seats_in(state.held) == []
+    status = client.portal.call(booking_pipeline.get_booking_status, intent["id"])
+    assert status == {"status": "confirmed", "booking_id": booking["id"], "updated_at": status["updated_at"]}
@@ -0,0 +1,193 @@
+"""
+Virtual waiting room for flash-sale showtimes.
+
+While a showtime is in queue mode, clients join a FIFO queue in Redis and
+are admitted at a fixed rate (admissions per second). An admitted client
+gets a signed admission token, which the seat and booking endpoints
+require for that showtime until queue mode is switched off. Tokens are
+signed with WAITING_ROOM_SECRET, which must be the same in every worker;
+queue mode can't be switched on without it.
+
+    waiting_room:{showtime_id}         hash: rate, seq (last position handed
+                                       out), admitted (positions let in so
+                                       far), last_advance (ms)
+    waiting_room_queue:{showtime_id}   sorted set: user_session -> position
+
+Admission is computed lazily by the status script, so no background job
+is needed: each call advances the cursor by the time elapsed x rate.
+Idle time isn't banked, so a quiet queue can't release a burst later.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+import redis_client
+
+ADMISSION_TOKEN_TTL = int(os.environ.get("ADMISSION_TOKEN_TTL", "900"))  # 15 minutes to pick seats and pay
+WAITING_ROOM_TTL = int(os.environ.get("WAITING_ROOM_TTL", "21600"))  # queue state kept 6 hours
+QUEUE_MODE_CACHE_TTL = 1.0  # seconds a worker trusts its copy of a showtime's queue mode
+WAITING_ROOM_SECRET = os.environ.get("WAITING_ROOM_SECRET", "")
+
+def waiting_room_key(showtime_id: str) -> str:
+    return f"waiting_room:{showtime_id}"
+
+def waiting_room_queue_key(showtime_id: str) -> str:
+    return f"waiting_room_queue:{showtime_id}"
+
+# Advances the admission cursor, optionally joins the queue, and reports
+# the caller's position.
+# KEYS[1]: waiting room hash, KEYS[2]: queue; ARGV[1]: now (ms),
+# ARGV[2]: user session, ARGV[3]: "1" to join if not queued yet
+# Returns {-1} outside queue mode, else {position or 0, admitted, seq, rate}
+QUEUE_STATUS_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'rate', 'admitted', 'last_advance', 'seq')
+if not state[1] then
+    return {-1}
+end
+local now = tonumber(ARGV[1])
+local rate = tonumber(state[1])
+local admitted = tonumber(state[2] or 0)
+local last = tonumber(state[3] or now)
+local seq = tonumber(state[4] or 0)
+
+if admitted >= seq then
+    last = now
+else
+    local grant = math.floor((now - last) * rate / 1000)
+    if grant > 0 then
+        admitted = math.min(seq, admitted + grant)
+        last = last + grant * 1000 / rate
+    end
+end
+
+local position = redis.call('ZSCORE', KEYS[2], ARGV[2])
+if not position and ARGV[3] == '1' then
+    seq = seq + 1
+    redis.call('ZADD', KEYS[2], seq, ARGV[2])
+    redis.call('EXPIRE', KEYS[2], """ + str(WAITING_ROOM_TTL) + """)
+    position = seq
+end
+redis.call('HSET', KEYS[1], 'admitted', admitted, 'last_advance', tostring(last), 'seq', seq)
+return {tonumber(position or 0), admitted, seq, state[1]}
+"""
+
+_queue_status_script = redis_client.redis_client.register_script(QUEUE_STATUS_SCRIPT)
+
+# showtime_id -> (checked_at, queue mode on)
+_queue_mode_cache: Dict[str, Tuple[float, bool]] = {}
+
+def configured() -> bool:
+    """Whether admission tokens can be signed (WAITING_ROOM_SECRET is set)"""
+    return bool(WAITING_ROOM_SECRET)
+
+def _signing_secret() -> bytes:
+    if not WAITING_ROOM_SECRET:
+        raise HTTPException(status_code=503, detail="Waiting room is not configured (WAITING_ROOM_SECRET)")
+    return WAITING_ROOM_SECRET.encode()
+
+async def enable_queue(showtime_id: str, rate_per_second: float):
+    """Put a showtime in queue mode (or change its admission rate)"""
+    key = waiting_room_key(showtime_id)
+    pipe = redis_client.redis_client.pipeline()
+    pipe.hset(key, "rate", rate_per_second)
+    pipe.hsetnx(key, "admitted", 0)
+    pipe.hsetnx(key, "seq", 0)
+    pipe.hsetnx(key, "last_advance", int(time.time() * 1000))
+    pipe.expire(key, WAITING_ROOM_TTL)
+    await pipe.execute()
+    _queue_mode_cache.pop(showtime_id, None)
+
+async def disable_queue(showtime_id: str):
+    """Leave queue mode; seat and booking endpoints stop requiring tokens"""
+    await redis_client.redis_client.delete(waiting_room_key(showtime_id), waiting_room_queue_key(showtime_id))
+    _queue_mode_cache.pop(showtime_id, None)
+
+async def queue_enabled(showtime_id: str) -> bool:
+    """Whether the showtime is in queue mode (cached per worker for a second)"""
+    cached = _queue_mode_cache.get(showtime_id)
+    now = time.monotonic()
+    if cached and now - cached[0] < QUEUE_MODE_CACHE_TTL:
+        return cached[1]
+    enabled = bool(await redis_client.redis_client.exists(waiting_room_key(showtime_id)))
+    _queue_mode_cache[showtime_id] = (now, enabled)
+    return enabled
+
+def _sign(payload: bytes, secret: bytes) -> str:
+    return hmac.new(secret, payload, hashlib.sha256).hexdigest()
+
+async def issue_admission_token(showtime_id: str, user_session: str) -> str:
+    """Signed token admitting one session to one showtime until it expires"""
+    payload = json.dumps({
+        "showtime_id": showtime_id,
+        "user_session": user_session,
+        "exp": int(time.time()) + ADMISSION_TOKEN_TTL,
+    }, separators=(",", ":")).encode()
+    encoded = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    return f"{encoded}.{_sign(payload, _signing_secret())}"
+
+async def verify_admission_token(token: str, showtime_id: str, user_session: Optional[str] = None) -> bool:
+    """Check signature, expiry, showtime and (when known) session"""
+    try:
+        encoded, signature = token.split(".", 1)
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        if not hmac.compare_digest(signature, _sign(payload, _signing_secret())):
+            return False
+        claims = json.loads(payload)
+    except (ValueError, TypeError):
+        return False
+    if claims.get("exp", 0) < time.time() or claims.get("showtime_id") != showtime_id:
+        return False
+    return user_session is None or claims.get("user_session") == user_session
+
+async def queue_status(showtime_id: str, user_session: str, join: bool = False) -> dict:
+    """
+    Position and admission state for a session; one Redis call.
+    Admitted sessions get their admission token.
+    """
+    result = await _queue_status_script(
+        keys=[waiting_room_key(showtime_id), waiting_room_queue_key(showtime_id)],
+        args=[int(time.time() * 1000), user_session, "1" if join else "0"],
+    )
+    if int(result[0]) == -1:
+        return {"queue_mode": False, "admitted": True, "admission_token": None}
+
+    position, admitted, seq = (int(value) for value in result[:3])
+    rate = float(result[3])
+    status = {
+        "queue_mode": True,
+        "queued": position > 0,
+        "position": position or None,
+        "ahead": max(position - admitted - 1, 0) if position else None,
+        "queue_length": seq - admitted,
+        "admitted": bool(position) and position <= admitted,
+        "admission_token": None,
+    }
+    if status["admitted"]:
+        status["admission_token"] = await issue_admission_token(showtime_id, user_session)
+    elif position:
+        status["estimated_wait_seconds"] = round((position - admitted) / rate)
+    return status
+
+async def require_admission(showtime_id: str, token: Optional[str], user_session: Optional[str] = None):
+    """
+    Guard for seat/booking endpoints: no-op outside queue mode, otherwise
+    403 unless the request carries a valid admission token (X-Admission-Token).
+    Endpoints that take or pay for seats pass the request's user_session, so
+    a token only works for the session it was issued to. Read-only seat-map
+    endpoints (/seats/available, /seats/stream) pass None: they have no
+    session, and a shared token only lets someone watch the map, not book.
+    """
+    if not await queue_enabled(showtime_id):
+        return
+    if not token or not await verify_admission_token(token, showtime_id, user_session):
+        raise HTTPException(
+            status_code=403,
+            detail=f"This showtime has a waiting room. Join the queue at /queue/{showtime_id}/join",
+        )
@@ -0,0 +1,82 @@
+-- Migration: Normalized booking_seats table
+-- One row per paid seat, with a unique (showtime_id, seat) index so the
+-- database itself rejects double bookings.
+-- Run this in Supabase SQL Editor
+
+CREATE TABLE IF NOT EXISTS public.booking_seats (
+  booking_id uuid REFERENCES public.bookings(id) ON DELETE CASCADE NOT NULL,
+  showtime_id uuid REFERENCES public.showtimes(id) ON DELETE CASCADE NOT NULL,
+  seat text NOT NULL,
+  created_at timestamp with time zone DEFAULT timezone('utc'::text, now()) NOT NULL,
+  PRIMARY KEY (booking_id, seat)
+);
+
+-- The double-booking guard, also used for availability lookups by showtime
+CREATE UNIQUE INDEX IF NOT EXISTS idx_booking_seats_showtime_seat
+ON public.booking_seats(showtime_id, seat);
+
+ALTER TABLE public.booking_seats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow public read on booking_seats" ON public.booking_seats FOR SELECT USING (true);
+
+-- ============================================
+-- KEEP booking_seats IN STEP WITH bookings
+-- ============================================
+
+-- Seats are claimed when a booking is (or becomes) paid and released when
+-- it stops being paid. A seat already claimed by another booking raises
+-- unique_violation (23505), which aborts the bookings insert/update.
+CREATE OR REPLACE FUNCTION public.sync_booking_seats()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.payment_status = OLD.payment_status AND NEW.seats = OLD.seats THEN
+            RETURN NEW;
+        END IF;
+        DELETE FROM public.booking_seats WHERE booking_id = OLD.id;
+    END IF;
+
+    IF NEW.payment_status = 'paid' THEN
+        INSERT INTO public.booking_seats (booking_id, showtime_id, seat)
+        SELECT DISTINCT NEW.id, NEW.showtime_id, s.seat
+        FROM jsonb_array_elements_text(NEW.seats) AS s(seat);
+    END IF;
+
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_sync_booking_seats ON public.bookings;
+CREATE TRIGGER trg_sync_booking_seats
+AFTER INSERT OR UPDATE OF payment_status, seats ON public.bookings
+FOR EACH ROW EXECUTE FUNCTION public.sync_booking_seats();
+
+-- ============================================
+-- BACKFILL FROM EXISTING BOOKINGS
+-- ============================================
+
+-- Earliest booking wins if historic data already contains a double booking
+INSERT INTO public.booking_seats (booking_id, showtime_id, seat, created_at)
+SELECT b.id, b.showtime_id, s.seat, b.created_at
+FROM public.bookings b
+CROSS JOIN LATERAL jsonb_array_elements_text(b.seats) AS s(seat)
+WHERE b.payment_status = 'paid'
+ORDER BY b.created_at
+ON CONFLICT DO NOTHING;
+
+-- List any historic double bookings the backfill skipped
+SELECT b.id AS booking_id, b.showtime_id, s.seat
+FROM public.bookings b
+CROSS JOIN LATERAL jsonb_array_elements_text(b.seats) AS s(seat)
+WHERE b.payment_status = 'paid'
+AND NOT EXISTS (
+    SELECT 1 FROM public.booking_seats bs
+    WHERE bs.booking_id = b.id AND bs.seat = s.seat
+);
+
+ANALYZE public.booking_seats;
+
+COMMENT ON TABLE public.booking_seats IS 'One row per paid seat; unique (showtime_id, seat) prevents double booking';
@@ -0,0 +1,79 @@
+-- Migration: commit_booking RPC
+-- Commits a paid booking in one transaction and one PostgREST round trip:
+-- seat conflict check, booking insert, coupon usage increment, and the
+-- showtime/movie/theater fields the confirmation email needs.
+-- Requires 006_booking_seats.sql.
+-- Run this in Supabase SQL Editor
+
+CREATE OR REPLACE FUNCTION public.commit_booking(
+    p_showtime_id uuid,
+    p_customer_name text,
+    p_customer_email text,
+    p_customer_phone text,
+    p_seats jsonb,
+    p_total_amount integer,
+    p_payment_intent_id text,
+    p_coupon_code text DEFAULT NULL,
+    p_discount_amount integer DEFAULT 0,
+    p_user_id uuid DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_conflicts text[];
+    v_booking public.bookings%ROWTYPE;
+    v_showtime jsonb;
+BEGIN
+    -- Report every conflicting seat; the booking_seats unique index is still
+    -- the final guard against a concurrent commit
+    SELECT array_agg(bs.seat ORDER BY bs.seat) INTO v_conflicts
+    FROM public.booking_seats bs
+    WHERE bs.showtime_id = p_showtime_id
+    AND bs.seat IN (SELECT jsonb_array_elements_text(p_seats));
+
+    IF v_conflicts IS NOT NULL THEN
+        RAISE EXCEPTION 'Seats % are already booked', array_to_string(v_conflicts, ', ')
+            USING ERRCODE = 'unique_violation';
+    END IF;
+
+    INSERT INTO public.bookings (
+        showtime_id, customer_name, customer_email, customer_phone, seats,
+        total_amount, payment_status, stripe_payment_intent_id,
+        coupon_code, discount_amount, user_id
+    )
+    VALUES (
+        p_showtime_id, p_customer_name, p_customer_email, p_customer_phone, p_seats,
+        p_total_amount, 'paid', p_payment_intent_id,
+        p_coupon_code, COALESCE(p_discount_amount, 0), p_user_id
+    )
+    RETURNING * INTO v_booking;
+
+    IF p_coupon_code IS NOT NULL AND p_coupon_code <> '' THEN
+        UPDATE public.offers
+        SET used_count = COALESCE(used_count, 0) + 1
+        WHERE coupon_code = upper(p_coupon_code);
+    END IF;
+
+    SELECT jsonb_build_object(
+        'start_time', s.start_time,
+        'movie_title', m.title,
+        'screen_name', sc.name,
+        'theater_name', t.name
+    ) INTO v_showtime
+    FROM public.showtimes s
+    JOIN public.movies m ON m.id = s.movie_id
+    JOIN public.screens sc ON sc.id = s.screen_id
+    JOIN public.theaters t ON t.id = sc.theater_id
+    WHERE s.id = p_showtime_id;
+
+    RETURN jsonb_build_object(
+        'booking', to_jsonb(v_booking),
+        'showtime', v_showtime
+    );
+END;
+$$;
+
+-- Grant execute permission
+GRANT EXECUTE ON FUNCTION public.commit_booking(uuid, text, text, text, jsonb, integer, text, text, integer, uuid) TO anon, authenticated;